@@ -0,0 +1,423 @@
+"""Serving benchmark for the disease prediction (FastAPI) and ML (Flask) services
+
+Request payloads are built from the CSVs in disease_prediction_service/data,
+then each endpoint is driven in-process through the framework test client by
+a fixed number of concurrent threads (closed loop: every thread sends its
+next request as soon as the previous one returns). For every endpoint and
+concurrency level the run reports throughput and p50/p95/p99 latency.
+
+Results are written as JSON so two runs can be compared; --baseline prints
+the change against a stored run and exits non-zero on a regression larger
+than --tolerance.
+
+Usage:
+    python benchmarks/serving_benchmark.py --output bench.json
+    python benchmarks/serving_benchmark.py --baseline bench.json --concurrency 1,8
+
+The disease models are loaded from DISEASE_MODELS_DIR (default
+disease_prediction_service/models). Endpoints whose model is missing are
+skipped. The single-row prediction cache is disabled unless --cache is
+given, so repeated rows still exercise inference. The ML service is
+trained from the same CSVs with snapshot persistence off, so a run never
+writes to or prunes the service's model store.
+
+An endpoint whose warmup requests fail is skipped, and one with failed
+requests during the timed run is reported but left out of the baseline
+comparison; either way the run exits non-zero.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DISEASE_DIR = os.path.join(ROOT, "disease_prediction_service")
+ML_DIR = os.path.join(ROOT, "ml_service")
+DATA_DIR = os.path.join(DISEASE_DIR, "data")
+
+# Latency percentiles reported for every endpoint
+PERCENTILES = (50, 95, 99)
+
+
+def read_csv(filename):
+    df = pd.read_csv(os.path.join(DATA_DIR, filename))
+    df.columns = [c.strip() for c in df.columns]
+    return df
+
+
+def numeric_parameters(row, columns):
+    parameters = []
+    for column in columns:
+        value = pd.to_numeric(row.get(column), errors="coerce")
+        if pd.notna(value):
+            parameters.append({"name": column, "value": float(value)})
+    return parameters
+
+
+def disease_payloads():
+    """{case name: (path, [json bodies])} built from the training CSVs"""
+    anemia = read_csv("anemia.csv")
+    kidney = read_csv("kidney_disease.csv")
+    liver = read_csv("liver.csv")
+    cardio = read_csv("cardiovascular.csv")
+
+    anemia_bodies = [
+        {
+            "patientId": f"anemia-{i}",
+            "gender": "Male" if row["Gender"] == 1 else "Female",
+            "parameters": numeric_parameters(row, ["Hemoglobin", "MCH", "MCHC", "MCV"])
+        }
+        for i, row in anemia.iterrows()
+    ]
+    kidney_columns = [c for c in kidney.columns if c not in ("id", "age", "classification")]
+    kidney_bodies = [
+        {
+            "patientId": f"kidney-{i}",
+            "age": int(row["age"]) if pd.notna(row["age"]) else 40,
+            "parameters": numeric_parameters(row, kidney_columns)
+        }
+        for i, row in kidney.iterrows()
+    ]
+    liver_columns = [c for c in liver.columns if c not in ("Age", "Gender", "Dataset")]
+    liver_bodies = [
+        {
+            "patientId": f"liver-{i}",
+            "age": int(row["Age"]),
+            "gender": row["Gender"],
+            "parameters": numeric_parameters(row, liver_columns)
+        }
+        for i, row in liver.iterrows()
+    ]
+    cardio_columns = [c for c in cardio.columns if c not in ("male", "age", "TenYearCHD")]
+    cardio_bodies = [
+        {
+            "patientId": f"cardio-{i}",
+            "age": int(row["age"]),
+            "gender": "Male" if row["male"] == 1 else "Female",
+            "parameters": numeric_parameters(row, cardio_columns)
+        }
+        for i, row in cardio.iterrows()
+    ]
+    # No sepsis CSV ships with the repo; use the Framingham vitals
+    sepsis_bodies = []
+    for i, row in cardio.iterrows():
+        vitals = {"HR": row["heartRate"], "SBP": row["sysBP"], "DBP": row["diaBP"]}
+        vitals["MAP"] = (row["sysBP"] + 2 * row["diaBP"]) / 3
+        sepsis_bodies.append({
+            "patientId": f"sepsis-{i}",
+            "age": int(row["age"]),
+            "gender": "Male" if row["male"] == 1 else "Female",
+            "parameters": [{"name": k, "value": float(v)} for k, v in vitals.items() if pd.notna(v)]
+        })
+
+    # Panel requests carry every lab a patient could have
+    panel_bodies = []
+    for i in range(len(cardio_bodies)):
+        body = dict(cardio_bodies[i])
+        body["patientId"] = f"panel-{i}"
+        body["parameters"] = (
+            anemia_bodies[i % len(anemia_bodies)]["parameters"]
+            + kidney_bodies[i % len(kidney_bodies)]["parameters"]
+            + liver_bodies[i % len(liver_bodies)]["parameters"]
+            + cardio_bodies[i]["parameters"]
+            + sepsis_bodies[i]["parameters"]
+        )
+        panel_bodies.append(body)
+
+    batch_size = 64
+    batch_bodies = [
+        {"requests": cardio_bodies[start:start + batch_size]}
+        for start in range(0, len(cardio_bodies) - batch_size + 1, batch_size)
+    ]
+
+    # The same batches in the compact names/values format (missing labs are null)
+    compact_names = cardio_columns + ["male", "age"]
+    compact_bodies = []
+    for body in batch_bodies:
+        values = []
+        for request in body["requests"]:
+            labs = {p["name"]: p["value"] for p in request["parameters"]}
+            values.append([labs.get(c) for c in cardio_columns]
+                          + [1.0 if request["gender"] == "Male" else 0.0, float(request["age"])])
+        compact_bodies.append({"names": compact_names, "values": values})
+
+    return {
+        "anemia": ("/predict", anemia_bodies),
+        "kidney": ("/predict/kidney", kidney_bodies),
+        "liver": ("/predict/liver", liver_bodies),
+        "sepsis": ("/predict/sepsis", sepsis_bodies),
+        "cardio": ("/predict/cardio", cardio_bodies),
+        "panel": ("/predict/all", panel_bodies),
+        "cardio_batch64": ("/predict/cardio/batch", batch_bodies),
+        "cardio_compact64": ("/predict/cardio/compact", compact_bodies),
+    }
+
+
+def lab_consultations():
+    """Hemoglobin / WBC / glucose consultations in the format MLModels.train expects"""
+    anemia = read_csv("anemia.csv")
+    kidney = read_csv("kidney_disease.csv")
+    cardio = read_csv("cardiovascular.csv")
+    hemoglobin = anemia["Hemoglobin"].dropna().to_numpy()
+    # kidney_disease.csv reports WBC per cumm; the ML service works in 10^3/uL
+    wbc = pd.to_numeric(kidney["wc"], errors="coerce").dropna().to_numpy() / 1000.0
+    glucose = cardio["glucose"].dropna().to_numpy()
+
+    n = min(len(hemoglobin), len(wbc), len(glucose))
+    consultations = []
+    for i in range(n):
+        hemo, white, sugar = float(hemoglobin[i]), float(wbc[i]), float(glucose[i])
+        consultations.append({
+            "hemoglobin": {"value": hemo, "isAbnormal": not 12.0 <= hemo <= 17.5},
+            "wbc": {"value": white, "isAbnormal": not 4.0 <= white <= 11.0},
+            "glucose": {"value": sugar, "isAbnormal": not 70.0 <= sugar <= 140.0},
+        })
+    return consultations
+
+
+def ml_payloads(consultations):
+    rows = [[c["hemoglobin"]["value"], c["wbc"]["value"], c["glucose"]["value"]] for c in consultations]
+    return {
+        "predict": ("/api/ml/predict", [{"value": c["hemoglobin"]["value"]} for c in consultations]),
+        "predict_multi": ("/api/ml/predict-multi", [{"features": row} for row in rows]),
+        "predict_multi_batch64": ("/api/ml/predict-multi", [
+            {"features": rows[i:i + 64]} for i in range(0, len(rows) - 63, 8)
+        ]),
+    }
+
+
+class CaseFailed(Exception):
+    pass
+
+
+def run_case(post, bodies, concurrency, n_requests, warmup):
+    """Closed-loop load: `concurrency` threads share n_requests requests
+
+    Raises CaseFailed if a warmup request (at least one is sent) fails.
+    """
+    for body in bodies[:max(warmup, 1)]:
+        status = post(body)
+        if status >= 400:
+            raise CaseFailed(f"warmup request returned {status}")
+
+    latencies = np.zeros(n_requests, dtype=np.float64)
+    failures = [0]
+    next_request = iter(range(n_requests))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                i = next(next_request, None)
+            if i is None:
+                return
+            body = bodies[i % len(bodies)]
+            start = time.perf_counter()
+            status = post(body)
+            latencies[i] = time.perf_counter() - start
+            if status >= 400:
+                with lock:
+                    failures[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "requests": n_requests,
+        "errors": failures[0],
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(n_requests / elapsed, 2),
+        "mean_ms": round(float(latencies.mean()) * 1000, 4),
+    }
+    for p, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+        result[f"p{p}_ms"] = round(float(value) * 1000, 4)
+    return result
+
+
+def benchmark_disease(args, results):
+    sys.path.insert(0, DISEASE_DIR)
+    from fastapi.testclient import TestClient
+    import main
+
+    snapshot = main.registry.current
+    with TestClient(main.app) as client:
+        for name, (path, bodies) in disease_payloads().items():
+            model = name.split("_")[0]
+            if model != "panel" and model not in snapshot.models and main.SPECS_BY_NAME[model].fallback is None:
+                print(f"disease {name}: model not loaded, skipped")
+                continue
+            random.Random(args.seed).shuffle(bodies)
+            post = lambda body, path=path: client.post(path, json=body).status_code
+            for concurrency in args.concurrency:
+                run_and_report(f"disease {name} {path} c={concurrency}", post, bodies, concurrency, args, results)
+
+
+def benchmark_ml(args, results):
+    sys.path.insert(0, ML_DIR)
+    import app as ml_app
+
+    consultations = lab_consultations()
+    client = ml_app.app.test_client()
+    response = client.post("/api/ml/train", json={"trainingData": consultations, "wait": True})
+    if response.status_code != 200:
+        print(f"ml service: training failed ({response.get_json()}), skipped")
+        return
+
+    local = threading.local()
+
+    def thread_client():
+        # Flask test clients keep per-client state; give each thread its own
+        if not hasattr(local, "client"):
+            local.client = ml_app.app.test_client()
+        return local.client
+
+    cases = ml_payloads(consultations)
+    if ml_app.depression_risk_model.is_trained:
+        n_features = len(ml_app.depression_risk_model.features)
+        rng = np.random.default_rng(args.seed)
+        cases["depression"] = ("/api/ml/depression/predict", [
+            {"features": [float(v) for v in rng.uniform(0, 3, n_features)]} for _ in range(500)
+        ])
+    else:
+        print("ml depression: model not trained, skipped")
+
+    for name, (path, bodies) in cases.items():
+        random.Random(args.seed).shuffle(bodies)
+        post = lambda body, path=path: thread_client().post(path, json=body).status_code
+        for concurrency in args.concurrency:
+            run_and_report(f"ml {name} {path} c={concurrency}", post, bodies, concurrency, args, results)
+
+
+def run_and_report(key, post, bodies, concurrency, args, results):
+    """Run one case into results[key]; a case whose warmup fails is recorded in args.failed"""
+    try:
+        results[key] = run_case(post, bodies, concurrency, args.requests, args.warmup)
+    except CaseFailed as e:
+        print(f"{key:<55} FAILED: {e}, skipped")
+        args.failed.append(key)
+        return
+    report(key, results[key])
+
+
+def report(key, result):
+    percentiles = " ".join(f"p{p} {result[f'p{p}_ms']:.2f}ms" for p in PERCENTILES)
+    errors = f" | {result['errors']} errors" if result["errors"] else ""
+    print(f"{key:<55} {result['throughput_rps']:>9.1f} req/s | {percentiles}{errors}")
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Print throughput / p95 change per endpoint; return the regressed keys
+
+    Runs with failed requests, in either results or baseline, are not
+    compared: their numbers time error responses.
+    """
+    regressions = []
+    print(f"\nChange against baseline (tolerance {tolerance:.0%}):")
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            print(f"{key:<55} new")
+            continue
+        if current["errors"] or previous.get("errors"):
+            print(f"{key:<55} not compared (failed requests)")
+            continue
+        throughput = current["throughput_rps"] / previous["throughput_rps"] - 1
+        p95 = current["p95_ms"] / previous["p95_ms"] - 1 if previous["p95_ms"] else 0.0
+        regressed = throughput < -tolerance or p95 > tolerance
+        if regressed:
+            regressions.append(key)
+        print(f"{key:<55} throughput {throughput:+7.1%} | p95 {p95:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--service", choices=["all", "disease", "ml"], default="all")
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="comma-separated concurrency levels (default 1,4,16)")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per endpoint and level")
+    parser.add_argument("--warmup", type=int, default=50, help="untimed requests before each run")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache", action="store_true", help="keep the single-row prediction cache enabled")
+    parser.add_argument("--output", help="write results JSON to this path")
+    parser.add_argument("--baseline", help="results JSON of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative throughput drop / p95 increase counted as a regression")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    # Cases skipped because their warmup requests failed
+    args.failed = []
+    return args
+
+
+def main():
+    args = parse_args()
+    if not args.cache:
+        os.environ["PREDICTION_CACHE_SIZE"] = "0"
+    # Artifacts do not change during a run; skip the watcher thread
+    os.environ.setdefault("MODEL_WATCH_INTERVAL", "0")
+    # The ML models trained here come from the benchmark CSVs; keep them out of the snapshot store
+    os.environ["ML_SNAPSHOT_DIR"] = ""
+
+    results = {}
+    if args.service in ("all", "disease"):
+        benchmark_disease(args, results)
+    if args.service in ("all", "ml"):
+        benchmark_ml(args, results)
+
+    run = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "cache": args.cache,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2, sort_keys=True)
+        print(f"\nResults written to {args.output}")
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressed = bool(compare(results, baseline, args.tolerance))
+
+    errored = [key for key, result in results.items() if result["errors"]]
+    if args.failed or errored:
+        print(f"\n{len(args.failed)} case(s) failed during warmup, {len(errored)} had failed requests")
+    if regressed or args.failed or errored:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Check CompiledForest against sklearn on every stored disease model
+
+Scores the training CSV rows (when available) plus random rows drawn around
+them with both sklearn and the compiled forest, and fails unless the
+probabilities are bit-for-bit identical. Also prints single-row latencies;
+the same comparison runs under pytest in test_forest_engine.py.
+
+Usage: python check_forest_engine.py
+"""
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from disease_models import SPECS, BASE_DIR, load_model
+from forest_engine import CompiledForest
+
+DATASETS = {
+    "anemia": "anemia.csv",
+    "kidney": "kidney_disease.csv",
+    "liver": "liver.csv",
+    "cardio": "cardiovascular.csv",
+}
+
+
+def sample_rows(name, features, n_random=2000):
+    rng = np.random.default_rng(42)
+    rows = []
+    data_path = os.path.join(BASE_DIR, "data", DATASETS.get(name, ""))
+    if name in DATASETS and os.path.exists(data_path):
+        df = pd.read_csv(data_path)
+        df.columns = [c.strip() for c in df.columns]
+        numeric = df.reindex(columns=features).apply(pd.to_numeric, errors="coerce").fillna(0.0)
+        rows.append(numeric.to_numpy(dtype=np.float64))
+    base = rows[0] if rows else rng.normal(50, 30, size=(100, len(features)))
+    picks = base[rng.integers(0, len(base), n_random)]
+    rows.append(picks * rng.uniform(0.5, 1.5, size=picks.shape))
+    return np.vstack(rows)
+
+
+def best_time(fn, repeat=200):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    failures = 0
+    checked = 0
+    for spec in SPECS:
+        compiled = load_model(spec)
+        if compiled is None:
+            print(f"{spec.name}: model not found, skipped")
+            continue
+        if compiled.forest is None:
+            print(f"{spec.name}: not a random forest, skipped")
+            continue
+        if isinstance(compiled.model, CompiledForest):
+            # Fidelity of compressed artifacts is reported by forest_compression.py
+            print(f"{spec.name}: compressed artifact, skipped")
+            continue
+        checked += 1
+
+        X = sample_rows(spec.name, compiled.features)
+        expected = compiled.model.predict_proba(X)
+        classes, proba = compiled.forest.predict(X)
+        same_proba = np.array_equal(expected, proba)
+        same_class = np.array_equal(compiled.model.predict(X), classes)
+        if not (same_proba and same_class):
+            failures += 1
+            print(f"{spec.name}: MISMATCH on {len(X)} rows "
+                  f"(max abs diff {np.max(np.abs(expected - proba)):.3g}, classes equal: {same_class})")
+            continue
+
+        row = X[:1]
+        sklearn_time = best_time(lambda: compiled.model.predict_proba(row), repeat=20)
+        engine_time = best_time(lambda: compiled.forest.predict(row))
+        print(f"{spec.name}: {len(X)} rows identical | single row sklearn "
+              f"{sklearn_time * 1e6:.0f} us, compiled {engine_time * 1e6:.0f} us")
+
+    if failures or not checked:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""Declarative registry of the disease risk models served by main.py
+
+Each disease model is described by a DiseaseModelSpec: where its artifacts
+live, which parameter names map to which feature, how missing features are
+filled and how a prediction is turned into text. At load time every spec is
+compiled into a CompiledModel holding a flat alias -> column index map, so
+feature assembly is a single pass over the request parameters into a
+preallocated NumPy row.
+"""
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import joblib
+import os
+import time
+
+from forest_engine import CompiledForest, compile_forest
+from prediction_metrics import MODEL_LOAD_SECONDS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.getenv("DISEASE_MODELS_DIR", os.path.join(BASE_DIR, "models"))
+# Serve random forests through the array-backed engine (set to 0 to use sklearn)
+USE_FOREST_ENGINE = os.getenv("DISEASE_FOREST_ENGINE", "1") != "0"
+# Prefer a compressed <model>.npz artifact (see forest_compression.py) when it is newer than the pickle
+USE_COMPACT_MODELS = os.getenv("DISEASE_COMPACT_MODELS", "1") != "0"
+
+
+def canonical_name(name: str) -> str:
+    """Normalize a lab parameter or feature name for lookups"""
+    return name.strip().lower().replace(" ", "_")
+
+
+class ParsedParameters:
+    """Lab parameters of one request, normalized once and shared by every model"""
+    __slots__ = ("values",)
+
+    def __init__(self, parameters):
+        self.values = {canonical_name(p.name): p.value for p in parameters}
+
+    def get(self, name: str, default=None):
+        return self.values.get(name, default)
+
+
+def gender_value(request) -> float:
+    # Female=0, Male=1 (LabelEncoder order used by the training scripts)
+    return 1.0 if request.gender == "Male" else 0.0
+
+
+def age_value(request) -> float:
+    return float(request.age or 40)
+
+
+@dataclass(frozen=True)
+class DiseaseModelSpec:
+    name: str
+    label: str
+    route: str
+    model_file: str
+    features_file: str
+    positive_class: int
+    positive_prediction: str
+    negative_prediction: str
+    recommendations: List[str]
+    positive_recommendations: List[str]
+    negative_recommendations: List[str]
+    # Extra parameter names accepted for a feature, keyed by canonical feature name
+    aliases: Dict[str, List[str]] = field(default_factory=dict)
+    # Features taken from the request itself rather than the lab parameters
+    request_fields: Dict[str, Callable] = field(default_factory=dict)
+    # Optional {feature: mean} artifact used to fill missing features (0.0 otherwise)
+    means_file: Optional[str] = None
+    encoders_file: Optional[str] = None
+    # Rule-based answer used when the model is not loaded
+    fallback: Optional[Callable] = None
+    fallback_on_error: bool = False
+
+    @property
+    def compact_file(self) -> str:
+        return os.path.splitext(self.model_file)[0] + ".npz"
+
+
+class CompiledModel:
+    """A loaded model together with its precompiled feature-resolution plan"""
+
+    def __init__(self, spec: DiseaseModelSpec, model, features: List[str], means: Optional[Dict[str, float]] = None, encoders=None):
+        self.spec = spec
+        self.model = model
+        self.features = list(features)
+        self.encoders = encoders
+        self.classes = np.asarray(model.classes_)
+        # A compressed artifact is already a CompiledForest and has no sklearn fallback
+        self.forest = compile_forest(model) if USE_FOREST_ENGINE or isinstance(model, CompiledForest) else None
+
+        self.defaults = np.zeros(len(self.features), dtype=np.float64)
+        if means:
+            for col, feat in enumerate(self.features):
+                if feat in means:
+                    self.defaults[col] = float(means[feat])
+
+        self.request_columns: List[Tuple[int, Callable]] = []
+        self.alias_map: Dict[str, Tuple[int, int]] = {}
+        for col, feat in enumerate(self.features):
+            canonical = canonical_name(feat)
+            if canonical in spec.request_fields:
+                self.request_columns.append((col, spec.request_fields[canonical]))
+                continue
+            names = [canonical] + [canonical_name(a) for a in spec.aliases.get(canonical, [])]
+            for rank, alias in enumerate(names):
+                if alias not in self.alias_map:
+                    self.alias_map[alias] = (col, rank)
+
+        positive = np.flatnonzero(self.classes == spec.positive_class)
+        self.positive_index = int(positive[0]) if len(positive) else None
+
+    def resolve_parameters(self, params: ParsedParameters) -> Dict[int, float]:
+        """Map lab parameters to feature columns; the best-ranked alias wins"""
+        values = {}
+        best_rank = {}
+        alias_map = self.alias_map
+        for name, value in params.values.items():
+            hit = alias_map.get(name)
+            if hit is None:
+                continue
+            col, rank = hit
+            if rank < best_rank.get(col, len(alias_map)):
+                values[col] = value
+                best_rank[col] = rank
+        return values
+
+    def fill_row(self, row: np.ndarray, request, params: ParsedParameters):
+        """Write the features of one request into a row prefilled with defaults"""
+        for col, value in self.resolve_parameters(params).items():
+            row[col] = value
+        for col, resolve in self.request_columns:
+            row[col] = resolve(request)
+        return row
+
+    def build_row(self, request, params: Optional[ParsedParameters] = None) -> np.ndarray:
+        return self.fill_row(self.defaults.copy(), request, params or ParsedParameters(request.parameters))
+
+    def build_matrix(self, requests, params_list: Optional[List[ParsedParameters]] = None) -> np.ndarray:
+        X = np.tile(self.defaults, (len(requests), 1))
+        for i, request in enumerate(requests):
+            params = params_list[i] if params_list is not None else ParsedParameters(request.parameters)
+            self.fill_row(X[i], request, params)
+        return X
+
+    def cache_key(self, X: np.ndarray) -> bytes:
+        """Canonical bytes of a feature row: trees only ever see float32 inputs"""
+        return (np.asarray(X, dtype=np.float32) + np.float32(0.0)).tobytes()
+
+    def predict(self, X: np.ndarray):
+        """Return (classes, probabilities) for a feature matrix from one predict_proba call"""
+        if self.forest is not None:
+            return self.forest.predict(X)
+        proba = self.model.predict_proba(X)
+        return self.classes[np.argmax(proba, axis=1)], proba
+
+    def response(self, pred_class: int, pred_proba) -> dict:
+        spec = self.spec
+        is_positive = int(pred_class) == spec.positive_class
+        risk_score = float(pred_proba[self.positive_index]) if self.positive_index is not None else 0.0
+        recs = list(spec.recommendations)
+        recs.extend(spec.positive_recommendations if is_positive else spec.negative_recommendations)
+        return {
+            "risk_score": risk_score,
+            "risk_level": "High" if is_positive else "Low",
+            "prediction": spec.positive_prediction if is_positive else spec.negative_prediction,
+            "confidence": float(np.max(pred_proba)),
+            "recommendations": recs
+        }
+
+
+def anemia_fallback(request, params: ParsedParameters) -> dict:
+    hb = params.get("hemoglobin", 14)
+    is_anemic = (request.gender == "Male" and hb < 13.5) or (request.gender == "Female" and hb < 12.0)
+    return {
+        "risk_score": 0.8 if is_anemic else 0.2,
+        "risk_level": "High" if is_anemic else "Low",
+        "prediction": "Anemia indicated by low hemoglobin levels (Fallback)." if is_anemic else "Hemoglobin levels within range (Fallback).",
+        "confidence": 0.7,
+        "recommendations": ["Follow standard medical advice"]
+    }
+
+
+def cardio_fallback(request, params: ParsedParameters) -> dict:
+    sys_bp = params.get('sysbp', 120)
+    dia_bp = params.get('diabp', 80)
+    is_high_risk = sys_bp > 140 or dia_bp > 90
+    return {
+        "risk_score": 0.75 if is_high_risk else 0.25,
+        "risk_level": "High" if is_high_risk else "Low",
+        "prediction": "Cardiovascular risk indicated by high blood pressure (Fallback)." if is_high_risk else "Blood pressure within normal range (Fallback).",
+        "confidence": 0.6,
+        "recommendations": ["Regular BP monitoring", "Consult a doctor for full screening"]
+    }
+
+
+SPECS = [
+    DiseaseModelSpec(
+        name="anemia",
+        label="Anemia",
+        route="/predict",
+        model_file="disease_risk_model.pkl",
+        features_file="features.pkl",
+        positive_class=1,
+        positive_prediction="Positive for Anemia symptoms based on hematological indices.",
+        negative_prediction="Negative for Anemia patterns.",
+        recommendations=["Complete blood count (CBC) follow-up"],
+        positive_recommendations=["Consult a hematologist", "Review dietary iron, B12, and folate intake"],
+        negative_recommendations=["Maintain balanced nutrition"],
+        aliases={"hemoglobin": ["HB", "HGB"]},
+        request_fields={"gender": gender_value},
+        fallback=anemia_fallback,
+        fallback_on_error=True,
+    ),
+    DiseaseModelSpec(
+        name="kidney",
+        label="Kidney",
+        route="/predict/kidney",
+        model_file="kidney_model.pkl",
+        features_file="kidney_features.pkl",
+        encoders_file="kidney_encoders.pkl",
+        # train_kidney.py: le_target.fit_transform(['ckd', 'notckd']) -> ckd=0, notckd=1
+        positive_class=0,
+        positive_prediction="High risk of Chronic Kidney Disease detected.",
+        negative_prediction="Low risk of Chronic Kidney Disease detected.",
+        recommendations=["Regular kidney function monitoring (KFT)"],
+        positive_recommendations=[
+            "Consult a nephrologist immediately",
+            "Monitor blood pressure and blood sugar closely",
+            "Follow a kidney-friendly diet (low protein/sodium)"
+        ],
+        negative_recommendations=["Maintain hydration and healthy lifestyle"],
+        request_fields={"age": age_value},
+    ),
+    DiseaseModelSpec(
+        name="liver",
+        label="Liver",
+        route="/predict/liver",
+        model_file="liver_model.pkl",
+        features_file="liver_features.pkl",
+        encoders_file="liver_encoders.pkl",
+        # train_liver.py: 1 for patient, 0 for non-patient
+        positive_class=1,
+        positive_prediction="High risk of Liver Disease detected.",
+        negative_prediction="Low risk of Liver Disease detected.",
+        recommendations=["Complete Liver Function Test (LFT)"],
+        positive_recommendations=[
+            "Consult a hepatologist or gastroenterologist",
+            "Avoid alcohol consumption",
+            "Maintain a healthy weight and monitor diet"
+        ],
+        negative_recommendations=["Maintain a healthy lifestyle and regular checkups"],
+        aliases={
+            "total_bilirubin": ["tb", "bilirubin_total"],
+            "direct_bilirubin": ["db", "bilirubin_direct"],
+            "alkaline_phosphotase": ["alp", "alkaline_phosphatase"],
+            "alamine_aminotransferase": ["sgpt", "alt"],
+            "aspartate_aminotransferase": ["sgot", "ast"],
+            "total_protiens": ["tp", "total_proteins", "protein_total"],
+            "albumin": ["alb"],
+            "albumin_and_globulin_ratio": ["ag_ratio", "a/g_ratio"]
+        },
+        request_fields={"age": age_value, "gender": gender_value},
+    ),
+    DiseaseModelSpec(
+        name="sepsis",
+        label="Sepsis",
+        route="/predict/sepsis",
+        model_file="sepsis_model.pkl",
+        features_file="sepsis_features.pkl",
+        means_file="sepsis_means.pkl",
+        positive_class=1,
+        positive_prediction="High risk of Sepsis detected. Immediate medical attention required.",
+        negative_prediction="Low risk of Sepsis detected.",
+        recommendations=["Monitor vital signs (HR, BP, Temp, Resp)"],
+        positive_recommendations=[
+            "Alert medical emergency team (Sepsis Protocol)",
+            "Start intravenous fluids and broad-spectrum antibiotics",
+            "Monitor lactate levels and organ function"
+        ],
+        negative_recommendations=["Continue regular monitoring of patient status"],
+        request_fields={"age": age_value, "gender": gender_value},
+    ),
+    DiseaseModelSpec(
+        name="cardio",
+        label="Cardio",
+        route="/predict/cardio",
+        model_file="cardio_model.pkl",
+        features_file="cardio_features.pkl",
+        # Framingham dataset: TenYearCHD is 1 for high risk, 0 for low
+        positive_class=1,
+        positive_prediction="High risk of Cardiovascular disease (CHD) in 10 years detected.",
+        negative_prediction="Low risk of Cardiovascular disease (CHD) in 10 years detected.",
+        recommendations=["Monitor blood pressure and cholesterol regularly"],
+        positive_recommendations=[
+            "Consult a cardiologist for a comprehensive evaluation",
+            "Adopt a heart-healthy diet (low saturated fats, high fiber)",
+            "Increase physical activity and manage stress",
+            "Quit smoking if applicable"
+        ],
+        negative_recommendations=["Maintain a healthy lifestyle and regular screenings"],
+        request_fields={"male": gender_value, "age": age_value},
+        fallback=cardio_fallback,
+    ),
+]
+
+SPECS_BY_NAME = {spec.name: spec for spec in SPECS}
+
+
+def load_model(spec: DiseaseModelSpec, models_dir: str = MODELS_DIR) -> Optional[CompiledModel]:
+    """Load and compile one spec, or return None if its artifacts are missing"""
+    model_path = os.path.join(models_dir, spec.model_file)
+    features_path = os.path.join(models_dir, spec.features_file)
+    if not (os.path.exists(model_path) and os.path.exists(features_path)):
+        return None
+
+    compact_path = os.path.join(models_dir, spec.compact_file)
+    if (USE_COMPACT_MODELS and os.path.exists(compact_path)
+            and os.path.getmtime(compact_path) >= os.path.getmtime(model_path)):
+        model = CompiledForest.load(compact_path)
+    else:
+        model = joblib.load(model_path)
+    features = joblib.load(features_path)
+    means = None
+    if spec.means_file and os.path.exists(os.path.join(models_dir, spec.means_file)):
+        means = joblib.load(os.path.join(models_dir, spec.means_file))
+    encoders = None
+    if spec.encoders_file and os.path.exists(os.path.join(models_dir, spec.encoders_file)):
+        encoders = joblib.load(os.path.join(models_dir, spec.encoders_file))
+    return CompiledModel(spec, model, features, means=means, encoders=encoders)
+
+
+def load_models(models_dir: str = MODELS_DIR, strict: bool = False) -> Dict[str, CompiledModel]:
+    """Load every spec whose artifacts are present in models_dir
+
+    With strict=True an artifact that exists but fails to load raises instead
+    of being skipped.
+    """
+    models = {}
+    for spec in SPECS:
+        start = time.perf_counter()
+        try:
+            compiled = load_model(spec, models_dir)
+        except Exception as e:
+            if strict:
+                raise ValueError(f"Error loading {spec.label} model: {str(e)}") from e
+            print(f"Error loading {spec.label} model: {str(e)}")
+            compiled = None
+        if compiled is not None:
+            MODEL_LOAD_SECONDS.set(time.perf_counter() - start, spec.name)
+            models[spec.name] = compiled
+    return models
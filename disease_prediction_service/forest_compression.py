@@ -0,0 +1,328 @@
+"""Compress a trained random forest into a compact CompiledForest artifact
+
+Steps, each optional:
+
+- subtree pruning: an internal node whose leaves all carry (within
+  prune_tolerance) the same class probabilities becomes a leaf. With the
+  default tolerance of 0 only branches that cannot change the output are
+  removed, which is common for deep, pure branches;
+- tree selection: trees are added greedily, best agreement with the full
+  forest first, until the chosen subset agrees with it on tree_agreement of
+  a sample of training rows and jittered copies of them (each tree has
+  memorized much of the training set, so the rows alone flatter it);
+- distillation: a small multi-output regression forest (distill_trees
+  trees of depth distill_depth) is fitted to the forest's probabilities on
+  the training rows plus jittered copies of them, and replaces the forest;
+- float32 storage: thresholds are rounded down to float32 (exact for the
+  float32 inputs trees see) and leaf probabilities are stored as float32.
+
+With the defaults only pruning at tolerance 0 and float32 storage run,
+which keep every class and move probabilities only by float32 rounding.
+
+Fidelity against the original forest is measured on held-out rows:
+class agreement plus mean and max absolute probability error. No artifact
+is written when agreement falls below min_agreement, or when the mean error
+exceeds max_proba_error.
+
+The result is saved next to the pickle as <model>.npz and preferred by
+load_model() while it is newer than the pickle.
+
+Usage: python forest_compression.py [models...] [--prune-tolerance T] [--tree-agreement A]
+                                    [--distill-trees N] [--min-agreement A]
+"""
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+import argparse
+import io
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+
+from forest_engine import TREE_LEAF, CompiledForest, tree_arrays
+
+# Rows used for greedy tree selection
+SELECTION_ROWS = 5000
+
+
+class FidelityError(ValueError):
+    """The compressed forest strays too far from the original"""
+
+
+@dataclass
+class CompressionOptions:
+    prune_tolerance: Optional[float] = 0.0
+    tree_agreement: Optional[float] = None
+    distill_trees: int = 0
+    distill_depth: int = 8
+    distill_copies: int = 2
+    min_agreement: float = 0.99
+    max_proba_error: Optional[float] = None
+    random_state: int = 42
+
+
+def prune_tree(tree: dict, tolerance: float) -> dict:
+    """Collapse subtrees whose leaf probabilities differ by at most tolerance"""
+    left, right, value = tree["left"], tree["right"], tree["value"]
+    n = len(left)
+    low = value.copy()
+    high = value.copy()
+    # sklearn numbers children after their parent, so a reverse pass sees
+    # both children before the node itself
+    for node in range(n - 1, -1, -1):
+        if left[node] != TREE_LEAF:
+            low[node] = np.minimum(low[left[node]], low[right[node]])
+            high[node] = np.maximum(high[left[node]], high[right[node]])
+    collapse = (high - low).max(axis=1) <= tolerance
+
+    keep, new_left, new_right, leaf_value = [], [], [], []
+    stack = [(0, -1, False)]
+    while stack:
+        node, parent, is_right = stack.pop()
+        index = len(keep)
+        if parent >= 0:
+            (new_right if is_right else new_left)[parent] = index
+        keep.append(node)
+        new_left.append(TREE_LEAF)
+        new_right.append(TREE_LEAF)
+        if left[node] == TREE_LEAF or collapse[node]:
+            # With tolerance 0 every leaf below is identical, so low is exact
+            leaf_value.append(low[node] if tolerance == 0 else value[node])
+            continue
+        leaf_value.append(value[node])
+        stack.append((right[node], index, True))
+        stack.append((left[node], index, False))
+
+    keep = np.asarray(keep, dtype=np.intp)
+    is_leaf = np.asarray(new_left) == TREE_LEAF
+    return {
+        "left": np.asarray(new_left, dtype=np.intp),
+        "right": np.asarray(new_right, dtype=np.intp),
+        "feature": np.where(is_leaf, 0, tree["feature"][keep]),
+        "threshold": np.where(is_leaf, np.inf, tree["threshold"][keep]),
+        "missing_left": tree["missing_left"][keep],
+        "value": np.asarray(leaf_value, dtype=np.float64),
+    }
+
+
+def per_tree_proba(trees: List[dict], classes, n_features: int, X: np.ndarray) -> np.ndarray:
+    forest = CompiledForest.from_trees(trees, classes, n_features)
+    return forest.value[forest.leaves(X)]
+
+
+def select_trees(trees: List[dict], classes, n_features: int, X: np.ndarray, target: float) -> List[dict]:
+    """Greedy forward selection of trees until class agreement with the full forest reaches target"""
+    proba = per_tree_proba(trees, classes, n_features, X)
+    reference = proba.mean(axis=0).argmax(axis=1)
+    running = np.zeros(proba.shape[1:], dtype=np.float64)
+    chosen = []
+    remaining = list(range(len(trees)))
+    while remaining:
+        best, best_agreement = None, -1.0
+        for t in remaining:
+            agreement = np.mean((running + proba[t]).argmax(axis=1) == reference)
+            if agreement > best_agreement:
+                best, best_agreement = t, agreement
+        chosen.append(best)
+        remaining.remove(best)
+        running += proba[best]
+        if best_agreement >= target:
+            break
+    return [trees[t] for t in sorted(chosen)]
+
+
+def regressor_tree_arrays(tree) -> dict:
+    n = tree.node_count
+    missing_left = (np.asarray(tree.missing_go_to_left, dtype=bool)
+                    if hasattr(tree, "missing_go_to_left") else np.zeros(n, dtype=bool))
+    value = np.clip(tree.value[:, :, 0].astype(np.float64), 0.0, None)
+    value /= np.maximum(value.sum(axis=1, keepdims=True), np.finfo(np.float64).tiny)
+    return {
+        "left": np.asarray(tree.children_left, dtype=np.intp),
+        "right": np.asarray(tree.children_right, dtype=np.intp),
+        "feature": np.asarray(tree.feature, dtype=np.intp),
+        "threshold": np.asarray(tree.threshold, dtype=np.float64),
+        "missing_left": missing_left,
+        "value": value,
+    }
+
+
+def augment(X: np.ndarray, copies: int, random_state: int) -> np.ndarray:
+    """X followed by copies of it with Gaussian noise of a tenth of each feature's spread"""
+    rng = np.random.default_rng(random_state)
+    scale = (np.nanstd(X, axis=0) * 0.1).astype(np.float32)
+    samples = [X]
+    for _ in range(copies):
+        samples.append(X + rng.standard_normal(X.shape, dtype=np.float32) * scale)
+    return np.vstack(samples)
+
+
+def distill(teacher: CompiledForest, X: np.ndarray, options: CompressionOptions) -> List[dict]:
+    """Fit a small regression forest to the teacher's probabilities"""
+    from sklearn.ensemble import RandomForestRegressor
+
+    X_distill = augment(X, options.distill_copies, options.random_state)
+
+    student = RandomForestRegressor(
+        n_estimators=options.distill_trees,
+        max_depth=options.distill_depth,
+        random_state=options.random_state
+    )
+    student.fit(X_distill, teacher.predict_proba(X_distill))
+    return [regressor_tree_arrays(estimator.tree_) for estimator in student.estimators_]
+
+
+def to_float32(tree: dict) -> dict:
+    threshold = tree["threshold"].astype(np.float32)
+    # Round down so that x <= t32 matches x <= t64 for every float32 x
+    too_high = threshold.astype(np.float64) > tree["threshold"]
+    threshold[too_high] = np.nextafter(threshold[too_high], np.float32(-np.inf))
+    return dict(tree, threshold=threshold, value=tree["value"].astype(np.float32))
+
+
+def fidelity(reference: np.ndarray, proba: np.ndarray) -> dict:
+    error = np.abs(reference.astype(np.float64) - proba.astype(np.float64))
+    return {
+        "agreement": round(float(np.mean(reference.argmax(axis=1) == proba.argmax(axis=1))), 5),
+        "mean_abs_error": float(error.mean()),
+        "max_abs_error": float(error.max()),
+    }
+
+
+def single_row_us(forest: CompiledForest, X: np.ndarray, repeat: int = 50) -> float:
+    row = X[:1]
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        forest.predict_proba(row)
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1e6, 1)
+
+
+def compress(model, X_train, X_holdout, options: Optional[CompressionOptions] = None):
+    """Return (CompiledForest, report); raises FidelityError below the fidelity floor"""
+    options = options or CompressionOptions()
+    X_train = np.ascontiguousarray(X_train, dtype=np.float32)
+    X_holdout = np.ascontiguousarray(X_holdout, dtype=np.float32)
+    original = CompiledForest.from_sklearn(model)
+    classes, n_features = original.classes_, original.n_features_in_
+
+    trees = [tree_arrays(estimator.tree_, len(classes)) for estimator in model.estimators_]
+    if options.distill_trees:
+        trees = distill(original, X_train, options)
+    else:
+        if options.prune_tolerance is not None:
+            trees = [prune_tree(tree, options.prune_tolerance) for tree in trees]
+        if options.tree_agreement is not None and len(trees) > 1:
+            selection = augment(X_train[:SELECTION_ROWS], options.distill_copies, options.random_state)
+            trees = select_trees(trees, classes, n_features, selection, options.tree_agreement)
+    compact = CompiledForest.from_trees([to_float32(tree) for tree in trees], classes, n_features)
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    report = {
+        "options": asdict(options),
+        "trees": [original.n_estimators, compact.n_estimators],
+        "nodes": [original.n_nodes, compact.n_nodes],
+        "max_depth": [original.max_depth, compact.max_depth],
+        "pickle_bytes": buffer.tell(),
+        "single_row_us": [single_row_us(original, X_holdout), single_row_us(compact, X_holdout)],
+        "fidelity": fidelity(original.predict_proba(X_holdout), compact.predict_proba(X_holdout)),
+        "holdout_rows": len(X_holdout),
+    }
+
+    result = report["fidelity"]
+    if result["agreement"] < options.min_agreement:
+        raise FidelityError(f"agreement {result['agreement']:.4f} is below the floor of {options.min_agreement}")
+    if options.max_proba_error is not None and result["mean_abs_error"] > options.max_proba_error:
+        raise FidelityError(f"mean probability error {result['mean_abs_error']:.4g} exceeds {options.max_proba_error}")
+    return compact, report
+
+
+def save_compact(forest: CompiledForest, path: str) -> int:
+    """Atomically write the artifact; returns its size in bytes"""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        forest.save(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return os.path.getsize(path)
+
+
+def print_compression(name: str, report: dict):
+    if "error" in report:
+        print(f"{name:<8} compression refused: {report['error']}")
+        return
+    f = report["fidelity"]
+    print(f"{name:<8} compressed {report['trees'][0]} -> {report['trees'][1]} trees, "
+          f"{report['nodes'][0]} -> {report['nodes'][1]} nodes, "
+          f"{report['pickle_bytes'] / 1024:.0f} KB -> {report['artifact_bytes'] / 1024:.0f} KB, "
+          f"{report['single_row_us'][0]:.0f} -> {report['single_row_us'][1]:.0f} us/row | "
+          f"agreement {f['agreement']:.4f}, mean |dp| {f['mean_abs_error']:.2g}, max |dp| {f['max_abs_error']:.2g}")
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    defaults = CompressionOptions()
+    parser.add_argument("--prune-tolerance", type=float, default=defaults.prune_tolerance,
+                        help="collapse subtrees whose leaf probabilities differ by at most this (default 0)")
+    parser.add_argument("--tree-agreement", type=float, default=defaults.tree_agreement,
+                        help="keep only the trees needed to agree with the full forest on this share of (jittered) training rows")
+    parser.add_argument("--distill-trees", type=int, default=0, help="distill into this many trees (0: off)")
+    parser.add_argument("--distill-depth", type=int, default=defaults.distill_depth)
+    parser.add_argument("--min-agreement", type=float, default=defaults.min_agreement,
+                        help="fidelity floor: held-out class agreement with the original forest")
+    parser.add_argument("--max-proba-error", type=float,
+                        help="fidelity floor: mean absolute probability error on held-out rows")
+
+
+def options_from_args(args) -> CompressionOptions:
+    return CompressionOptions(
+        prune_tolerance=args.prune_tolerance,
+        tree_agreement=args.tree_agreement,
+        distill_trees=args.distill_trees,
+        distill_depth=args.distill_depth,
+        min_agreement=args.min_agreement,
+        max_proba_error=args.max_proba_error,
+    )
+
+
+def main(argv=None):
+    """Compress already trained models, using the training split's held-out rows"""
+    from sklearn.model_selection import train_test_split
+    from disease_models import MODELS_DIR, SPECS_BY_NAME
+    from training import DATA_DIR, RANDOM_STATE, RECIPES, TEST_SIZE, take_rows
+
+    parser = argparse.ArgumentParser(description="Compress trained disease forests into .npz artifacts")
+    parser.add_argument("models", nargs="*", help=f"models to compress: {', '.join(RECIPES)} (default: all)")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    options = options_from_args(args)
+
+    failed = False
+    for name in args.models or list(RECIPES):
+        spec = SPECS_BY_NAME[name]
+        model_path = os.path.join(args.models_dir, spec.model_file)
+        if not os.path.exists(model_path):
+            print(f"{name:<8} no trained model at {model_path}, skipped")
+            continue
+        X, y, _ = RECIPES[name][1](args.data_dir)
+        train_index, test_index = train_test_split(np.arange(len(X)), test_size=TEST_SIZE, random_state=RANDOM_STATE)
+        try:
+            forest, report = compress(joblib.load(model_path), take_rows(X, train_index), take_rows(X, test_index), options)
+            report["artifact_bytes"] = save_compact(forest, os.path.join(args.models_dir, spec.compact_file))
+        except FidelityError as e:
+            failed = True
+            report = {"error": str(e)}
+        print_compression(name, report)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
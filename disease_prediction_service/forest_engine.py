@@ -0,0 +1,218 @@
+"""Array-backed random forest inference
+
+CompiledForest flattens every tree of a fitted RandomForestClassifier into
+contiguous NumPy arrays (feature, threshold, children, leaf value) and walks
+all trees for all rows together, one tree level per step. It reproduces
+sklearn's predict_proba bit for bit:
+
+- inputs are cast to float32 and compared against the float64 thresholds,
+  exactly like sklearn's tree traversal;
+- leaf values are normalized the way DecisionTreeClassifier.predict_proba does;
+- per-tree probabilities are summed in tree order and then divided by the
+  number of trees, matching RandomForestClassifier's accumulation.
+
+The class is taken from the argmax of the probabilities, which is what
+RandomForestClassifier.predict does, so one traversal yields both.
+
+A compiled forest can be saved to and loaded from a compact .npz artifact
+(see forest_compression.py), in which case sklearn is not needed to serve
+it. Float32 thresholds are fine there: for float32 inputs, x <= t64 is
+the same test as x <= t32 when t32 is t64 rounded down to float32.
+
+Two traversal strategies are used. For a single row of a small forest every
+split is evaluated at once into a next-node table, after which each level is
+a single gather. Otherwise all (tree, row) pairs step down one level at a
+time, which touches only the nodes on the visited paths.
+"""
+import numpy as np
+
+TREE_LEAF = -1
+
+# Rough costs (microseconds) used to pick the single-row traversal strategy
+TABLE_COST_PER_NODE = 0.005
+LEVEL_COST_PER_STEP = 6.0
+
+
+class CompiledForest:
+    def __init__(self, feature, threshold, children, missing_left, value, roots, max_depth, classes, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.left = np.ascontiguousarray(children[:, 0])
+        self.right = np.ascontiguousarray(children[:, 1])
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes_ = classes
+        self.n_features_in_ = n_features
+        self.n_estimators = len(roots)
+        self.n_nodes = len(feature)
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """Flatten a fitted RandomForestClassifier (single output) into arrays"""
+        if getattr(forest, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output forests are supported")
+        n_classes = int(forest.n_classes_)
+        trees = [tree_arrays(estimator.tree_, n_classes) for estimator in forest.estimators_]
+        return cls.from_trees(trees, np.asarray(forest.classes_), int(forest.n_features_in_))
+
+    @classmethod
+    def from_trees(cls, trees, classes, n_features):
+        """Concatenate per-tree arrays (see tree_arrays) into one forest"""
+        features, thresholds, children, missing, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for tree in trees:
+            n = len(tree["feature"])
+            ids = np.arange(n, dtype=np.intp)
+            is_leaf = tree["left"] == TREE_LEAF
+
+            left = np.where(is_leaf, ids, tree["left"]) + offset
+            right = np.where(is_leaf, ids, tree["right"]) + offset
+            children.append(np.stack([left, right], axis=1))
+            # Leaves point at themselves, so extra steps are no-ops
+            features.append(np.where(is_leaf, 0, tree["feature"]).astype(np.intp))
+            thresholds.append(np.where(is_leaf, np.inf, tree["threshold"]).astype(tree["threshold"].dtype))
+            missing.append(tree["missing_left"])
+            values.append(tree["value"])
+
+            roots.append(offset)
+            max_depth = max(max_depth, tree_depth(tree["left"], tree["right"]))
+            offset += n
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            children=np.ascontiguousarray(np.concatenate(children)),
+            missing_left=np.concatenate(missing),
+            value=np.ascontiguousarray(np.concatenate(values)),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=int(max_depth),
+            classes=np.asarray(classes),
+            n_features=int(n_features)
+        )
+
+    def save(self, path):
+        """Write the forest as an uncompressed .npz artifact"""
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                feature=self.feature.astype(np.int32),
+                threshold=self.threshold,
+                children=self.children.astype(np.int32),
+                missing_left=self.missing_left,
+                value=self.value,
+                roots=self.roots.astype(np.int32),
+                max_depth=np.int64(self.max_depth),
+                classes=self.classes_,
+                n_features=np.int64(self.n_features_in_)
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                feature=data["feature"].astype(np.intp),
+                threshold=data["threshold"],
+                children=np.ascontiguousarray(data["children"].astype(np.intp)),
+                missing_left=data["missing_left"],
+                value=np.ascontiguousarray(data["value"]),
+                roots=data["roots"].astype(np.intp),
+                max_depth=int(data["max_depth"]),
+                classes=data["classes"],
+                n_features=int(data["n_features"])
+            )
+
+    def leaves(self, X):
+        """Return the leaf index reached in every tree, shape (n_trees, n_samples)"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[-1]} features, but the forest expects {self.n_features_in_}")
+        if X.shape[0] == 1 and self.n_nodes * TABLE_COST_PER_NODE < self.max_depth * LEVEL_COST_PER_STEP:
+            return self._leaves_by_table(X[0])[:, np.newaxis]
+        return self._leaves_by_level(X)
+
+    def _leaves_by_table(self, x):
+        # next_node[j]: child of node j taken by this row
+        x = x.take(self.feature)
+        go_left = x <= self.threshold
+        if np.isnan(x).any():
+            go_left |= np.isnan(x) & self.missing_left
+        next_node = np.where(go_left, self.left, self.right)
+
+        node = self.roots
+        for _ in range(self.max_depth):
+            node = next_node.take(node)
+        return node
+
+    def _leaves_by_level(self, X):
+        n_samples = X.shape[0]
+        # Row-major flat view: sample i, feature f lives at i * n_features + f
+        flat_X = X.ravel()
+        row_offset = (np.arange(n_samples, dtype=np.intp) * self.n_features_in_)[np.newaxis, :]
+        has_nan = bool(np.isnan(flat_X).any())
+
+        node = np.repeat(self.roots[:, np.newaxis], n_samples, axis=1)
+        for _ in range(self.max_depth):
+            x = flat_X.take(self.feature.take(node) + row_offset)
+            go_left = x <= self.threshold.take(node)
+            if has_nan:
+                go_left |= np.isnan(x) & self.missing_left.take(node)
+            node = np.where(go_left, self.left.take(node), self.right.take(node))
+        return node
+
+    def predict_proba(self, X):
+        proba = np.add.reduce(self.value[self.leaves(X)], axis=0)
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X):
+        """Return (classes, probabilities) from a single traversal"""
+        proba = self.predict_proba(X)
+        return self.classes_.take(np.argmax(proba, axis=1)), proba
+
+
+def tree_arrays(tree, n_classes):
+    """Node arrays of one sklearn tree, with leaf values normalized to probabilities"""
+    n = tree.node_count
+    if hasattr(tree, "missing_go_to_left"):
+        missing_left = np.asarray(tree.missing_go_to_left, dtype=bool)
+    else:
+        missing_left = np.zeros(n, dtype=bool)
+
+    # Same normalization as DecisionTreeClassifier.predict_proba
+    proba = tree.value[:, 0, :n_classes].astype(np.float64)
+    normalizer = proba.sum(axis=1)[:, np.newaxis]
+    normalizer[normalizer == 0.0] = 1.0
+    return {
+        "left": np.asarray(tree.children_left, dtype=np.intp),
+        "right": np.asarray(tree.children_right, dtype=np.intp),
+        "feature": np.asarray(tree.feature, dtype=np.intp),
+        "threshold": np.asarray(tree.threshold, dtype=np.float64),
+        "missing_left": missing_left,
+        "value": proba / normalizer,
+    }
+
+
+def tree_depth(left, right):
+    """Depth of a tree given its child arrays (TREE_LEAF marks leaves)"""
+    depth = 0
+    level = np.zeros(1, dtype=np.intp)
+    while True:
+        level = level[left[level] != TREE_LEAF]
+        if not len(level):
+            return depth
+        level = np.concatenate([left[level], right[level]])
+        depth += 1
+
+
+def compile_forest(model):
+    """Return a CompiledForest for random forest classifiers, else None"""
+    if isinstance(model, CompiledForest):
+        return model
+    from sklearn.ensemble import RandomForestClassifier
+    if isinstance(model, RandomForestClassifier) and getattr(model, "n_outputs_", 1) == 1:
+        return CompiledForest.from_sklearn(model)
+    return None
@@ -0,0 +1,116 @@
+"""Bounded executor that keeps CPU-bound model inference off the event loop
+
+Handlers build their feature rows on the event loop and hand the
+predict_proba call to an InferencePool. The pool runs it on a thread or
+process pool and admits at most `workers + max_queue` calls at once; beyond
+that it raises PoolSaturated so the API can answer 503 immediately instead
+of letting requests pile up behind a slow inference.
+
+In process mode each model snapshot gets its own executor whose workers
+receive that snapshot's models, so a request always runs on the model
+version it started with, even across a hot reload.
+"""
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+import os
+import threading
+
+
+class PoolSaturated(Exception):
+    """Raised when the pool already holds its maximum number of calls"""
+
+
+# Models used by process-pool workers, set once per worker by _init_worker
+_worker_models = {}
+
+def _init_worker(models):
+    global _worker_models
+    _worker_models = models
+
+def _predict_in_worker(name, X):
+    return _worker_models[name].predict(X)
+
+
+class InferencePool:
+    def __init__(self, kind="thread", workers=None, max_queue=64):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._executors = {}
+
+    def _get_executor(self, snapshot):
+        # Created lazily so a forked worker never inherits a parent's threads
+        key = snapshot.version if self.kind == "process" else None
+        with self._lock:
+            executor = self._executors.get(key)
+            if executor is None:
+                if self.kind == "process":
+                    executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        initializer=_init_worker,
+                        initargs=(snapshot.models,)
+                    )
+                else:
+                    executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+                self._executors[key] = executor
+        return executor
+
+    def retain(self, versions):
+        """Shut down process executors of snapshots no longer being served"""
+        if self.kind != "process":
+            return
+        with self._lock:
+            stale = [v for v in self._executors if v not in versions]
+            executors = [self._executors.pop(v) for v in stale]
+        for executor in executors:
+            # Calls already submitted still complete
+            executor.shutdown(wait=False)
+
+    def _release(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def submit(self, snapshot, name, X):
+        """Schedule snapshot's model `name` on X, or raise PoolSaturated if the queue is full"""
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PoolSaturated(f"Inference queue full ({self.in_flight} calls in flight)")
+            self.in_flight += 1
+        try:
+            executor = self._get_executor(snapshot)
+            if self.kind == "process":
+                future = executor.submit(_predict_in_worker, name, X)
+            else:
+                future = executor.submit(snapshot.models[name].predict, X)
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, snapshot, name, X):
+        """Await (classes, probabilities) for X without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(snapshot, name, X))
+
+    def stats(self):
+        with self._lock:
+            in_flight = self.in_flight
+            return {
+                "executor": self.kind,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": in_flight,
+                "running": min(in_flight, self.workers),
+                "queued": max(0, in_flight - self.workers),
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
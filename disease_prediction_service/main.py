@@ -1,81 +1,88 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
-import pandas as pd
+from contextlib import asynccontextmanager
 import numpy as np
-import joblib
+import asyncio
 import os
+import signal
+
+import compact_format
+from compact_format import CompactRequestError
+from disease_models import SPECS, SPECS_BY_NAME, ParsedParameters
+from inference_pool import InferencePool, PoolSaturated
+from model_registry import ModelRegistry
+from patient_store import PatientStore, OutOfOrderObservation
+from process_memory import group_usage, memory_usage
+from prediction_cache import PredictionCache
+from prediction_metrics import (
+    metrics, CONTENT_TYPE, MetricsMiddleware,
+    PREDICTIONS, PREDICTION_ERRORS, PHASE_LATENCY, FALLBACKS
+)
+
+# Load models at startup; the registry swaps in retrained artifacts at runtime
+registry = ModelRegistry(watch_interval=float(os.getenv("MODEL_WATCH_INTERVAL", "5")))
+try:
+    registry.reload()
+except Exception as e:
+    print(f"Error loading disease models: {str(e)}")
+    registry.reload(strict=False)
+
+# CPU-bound inference runs here so a slow model never blocks the event loop
+inference_pool = InferencePool(
+    kind=os.getenv("INFERENCE_EXECUTOR", "thread"),
+    workers=int(os.getenv("INFERENCE_WORKERS", "0")) or None,
+    max_queue=int(os.getenv("INFERENCE_QUEUE", "64"))
+)
+RETRY_AFTER_SECONDS = os.getenv("INFERENCE_RETRY_AFTER", "1")
+# Rows scored per predict_proba call by the NDJSON streaming endpoints
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "512"))
+registry.add_listener(lambda new, old: inference_pool.retain({new.version, old.version}))
+
+# Single-row prediction caches, keyed by model version + resolved feature row
+prediction_caches = {
+    spec.name: PredictionCache(
+        max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", "2048")),
+        ttl=float(os.getenv("PREDICTION_CACHE_TTL", "60"))
+    )
+    for spec in SPECS
+}
+
+def clear_prediction_caches(new, old):
+    for cache in prediction_caches.values():
+        cache.clear()
+
+registry.add_listener(clear_prediction_caches)
+
+# Per-patient carried-forward vitals and rolling trends for incremental sepsis scoring
+patient_store = PatientStore(
+    max_patients=int(os.getenv("PATIENT_STORE_SIZE", "10000")),
+    idle_ttl=float(os.getenv("PATIENT_IDLE_TTL", str(6 * 3600))),
+    window=int(os.getenv("PATIENT_WINDOW", "6"))
+)
+
+# Set by serve.py. Reloads and rollbacks must happen in the prefork parent, and the
+# patient store is per process, so it is only consistent with a single worker
+PREFORK_PARENT = int(os.getenv("DISEASE_SERVE_PARENT_PID", "0")) or None
+PREFORK_WORKERS = int(os.getenv("DISEASE_SERVE_WORKERS", "1"))
+
+def require_patient_store():
+    if PREFORK_PARENT and PREFORK_WORKERS > 1:
+        raise HTTPException(
+            status_code=501,
+            detail=f"Patient state is kept per worker and would be split across {PREFORK_WORKERS} prefork workers; "
+                   "serve patient scoring from a single worker"
+        )
+
+@asynccontextmanager
+async def lifespan(app):
+    registry.start_watching()
+    yield
+    registry.stop_watching()
 
-app = FastAPI(title="MediTrack Disease Risk Prediction Service")
-
-# Model paths
-ANEMIA_MODEL_PATH = "models/disease_risk_model.pkl"
-ANEMIA_FEATURES_PATH = "models/features.pkl"
-
-KIDNEY_MODEL_PATH = "models/kidney_model.pkl"
-KIDNEY_FEATURES_PATH = "models/kidney_features.pkl"
-KIDNEY_ENCODERS_PATH = "models/kidney_encoders.pkl"
-
-LIVER_MODEL_PATH = "models/liver_model.pkl"
-LIVER_FEATURES_PATH = "models/liver_features.pkl"
-LIVER_ENCODERS_PATH = "models/liver_encoders.pkl"
-
-SEPSIS_MODEL_PATH = "models/sepsis_model.pkl"
-SEPSIS_FEATURES_PATH = "models/sepsis_features.pkl"
-SEPSIS_MEANS_PATH = "models/sepsis_means.pkl"
-
-CARDIO_MODEL_PATH = "models/cardio_model.pkl"
-CARDIO_FEATURES_PATH = "models/cardio_features.pkl"
-
-anemia_model = None
-anemia_features = None
-
-kidney_model = None
-kidney_features = None
-kidney_encoders = None
-
-liver_model = None
-liver_features = None
-liver_encoders = None
-
-sepsis_model = None
-sepsis_features = None
-sepsis_means = None
-
-cardio_model = None
-cardio_features = None
-
-# Load models at startup
-if os.path.exists(ANEMIA_MODEL_PATH):
-    anemia_model = joblib.load(ANEMIA_MODEL_PATH)
-if os.path.exists(ANEMIA_FEATURES_PATH):
-    anemia_features = joblib.load(ANEMIA_FEATURES_PATH)
-
-if os.path.exists(KIDNEY_MODEL_PATH):
-    kidney_model = joblib.load(KIDNEY_MODEL_PATH)
-if os.path.exists(KIDNEY_FEATURES_PATH):
-    kidney_features = joblib.load(KIDNEY_FEATURES_PATH)
-if os.path.exists(KIDNEY_ENCODERS_PATH):
-    kidney_encoders = joblib.load(KIDNEY_ENCODERS_PATH)
-
-if os.path.exists(LIVER_MODEL_PATH):
-    liver_model = joblib.load(LIVER_MODEL_PATH)
-if os.path.exists(LIVER_FEATURES_PATH):
-    liver_features = joblib.load(LIVER_FEATURES_PATH)
-if os.path.exists(LIVER_ENCODERS_PATH):
-    liver_encoders = joblib.load(LIVER_ENCODERS_PATH)
-
-if os.path.exists(SEPSIS_MODEL_PATH):
-    sepsis_model = joblib.load(SEPSIS_MODEL_PATH)
-if os.path.exists(SEPSIS_FEATURES_PATH):
-    sepsis_features = joblib.load(SEPSIS_FEATURES_PATH)
-if os.path.exists(SEPSIS_MEANS_PATH):
-    sepsis_means = joblib.load(SEPSIS_MEANS_PATH)
-
-if os.path.exists(CARDIO_MODEL_PATH):
-    cardio_model = joblib.load(CARDIO_MODEL_PATH)
-if os.path.exists(CARDIO_FEATURES_PATH):
-    cardio_features = joblib.load(CARDIO_FEATURES_PATH)
+app = FastAPI(title="MediTrack Disease Risk Prediction Service", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 class ParameterResult(BaseModel):
     name: str
@@ -94,360 +101,496 @@ class PredictionResponse(BaseModel):
     prediction: str
     confidence: float
     recommendations: List[str]
+    model_version: Optional[str] = None
+
+class BatchPredictionRequest(BaseModel):
+    requests: List[PredictionRequest]
+
+class BatchPredictionItem(BaseModel):
+    index: int
+    patientId: str
+    result: Optional[PredictionResponse] = None
+    error: Optional[str] = None
+
+class BatchPredictionResponse(BaseModel):
+    results: List[BatchPredictionItem]
+    model_version: Optional[str] = None
+
+class PanelPredictionResponse(BaseModel):
+    patientId: str
+    results: Dict[str, PredictionResponse]
+    errors: Dict[str, str]
+
+# Request-derived features (age, gender) of compact payloads that do not name them
+DEFAULT_REQUEST = PredictionRequest(patientId="", parameters=[])
+
+class ObservationRequest(BaseModel):
+    parameters: List[ParameterResult]
+    hour: Optional[float] = None
+    gender: Optional[str] = None
+    age: Optional[int] = None
+    discharged: bool = False
+
+class FeatureTrend(BaseModel):
+    last: float
+    mean: float
+    min: float
+    max: float
+    delta: Optional[float] = None
+    count: int
+
+class PatientSummary(BaseModel):
+    patientId: str
+    hour: Optional[float] = None
+    observations: int
+    gender: Optional[str] = None
+    age: Optional[int] = None
+    trends: Dict[str, FeatureTrend]
+
+class PatientPredictionResponse(PredictionResponse):
+    patient: PatientSummary
 
 @app.get("/")
 async def root():
+    status = {"message": "Disease Prediction Service is running"}
+    snapshot = registry.current
+    for spec in SPECS:
+        status[f"{spec.name}_model_loaded"] = spec.name in snapshot.models
+    status["model_version"] = snapshot.version
+    status["inference_pool"] = inference_pool.stats()
+    return status
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/schema")
+async def feature_schema(model: Optional[str] = None):
+    """Feature order and accepted names of the loaded models, for compact payloads"""
+    snapshot = registry.current
+    names = [model] if model else [spec.name for spec in SPECS if spec.name in snapshot.models]
+    schemas = {}
+    for name in names:
+        compiled = snapshot.get(name)
+        if compiled is None:
+            raise HTTPException(status_code=404, detail=f"{model} model not loaded")
+        schemas[name] = compact_format.schema(compiled, DEFAULT_REQUEST)
+        schemas[name]["route"] = f"{compiled.spec.route}/compact"
+    return {"model_version": snapshot.version, "models": schemas}
+
+@app.get("/admin/cache")
+async def cache_status():
+    return {name: cache.stats() for name, cache in prediction_caches.items()}
+
+@app.get("/admin/patients")
+async def patient_store_status():
+    return patient_store.stats()
+
+@app.get("/admin/memory")
+async def memory_status():
+    """Unique and shared memory of this process, and of every prefork worker under serve.py"""
     return {
-        "message": "Disease Prediction Service is running",
-        "anemia_model_loaded": anemia_model is not None,
-        "kidney_model_loaded": kidney_model is not None,
-        "cardio_model_loaded": cardio_model is not None
+        "process": memory_usage(),
+        "prefork": group_usage(PREFORK_PARENT) if PREFORK_PARENT else None
     }
 
-@app.post("/predict", response_model=PredictionResponse)
-async def predict_anemia(request: PredictionRequest):
-    try:
-        input_data = {p.name.strip(): p.value for p in request.parameters}
-        gender_val = 1 if request.gender == "Male" else 0
-        input_data["Gender"] = gender_val
+@app.get("/admin/models")
+async def model_status():
+    return registry.status()
 
-        if anemia_model is not None and anemia_features is not None:
-            try:
-                feature_mapping = {
-                    "Hemoglobin": ["Hemoglobin", "HB", "HGB"],
-                    "MCH": ["MCH"],
-                    "MCHC": ["MCHC"],
-                    "MCV": ["MCV"]
-                }
-                
-                ordered_features = []
-                for feat_name in anemia_features:
-                    if feat_name == "Gender":
-                        ordered_features.append(gender_val)
-                    else:
-                        found = False
-                        for alias in feature_mapping.get(feat_name, [feat_name]):
-                            if alias in input_data:
-                                ordered_features.append(input_data[alias])
-                                found = True
-                                break
-                            for k, v in input_data.items():
-                                if k.lower() == alias.lower():
-                                    ordered_features.append(v)
-                                    found = True
-                                    break
-                            if found: break
-                        if not found:
-                            ordered_features.append(0.0)
-
-                pred_class = int(anemia_model.predict([ordered_features])[0])
-                pred_proba = anemia_model.predict_proba([ordered_features])[0]
-                confidence = float(np.max(pred_proba))
-                
-                risk_level = "High" if pred_class == 1 else "Low"
-                risk_score = float(pred_proba[1])
-                prediction = "Positive for Anemia symptoms based on hematological indices." if pred_class == 1 else "Negative for Anemia patterns."
-                
-                recs = ["Complete blood count (CBC) follow-up"]
-                if pred_class == 1:
-                    recs.extend(["Consult a hematologist", "Review dietary iron, B12, and folate intake"])
-                else:
-                    recs.append("Maintain balanced nutrition")
-                    
-                return PredictionResponse(
-                    risk_score=risk_score,
-                    risk_level=risk_level,
-                    prediction=prediction,
-                    confidence=confidence,
-                    recommendations=recs
-                )
-            except Exception as e:
-                print(f"Anemia Prediction Error: {str(e)}")
-        
-        # Fallback
-        hb = input_data.get("Hemoglobin", 14)
-        is_anemic = (request.gender == "Male" and hb < 13.5) or (request.gender == "Female" and hb < 12.0)
-        return PredictionResponse(
-            risk_score=0.8 if is_anemic else 0.2,
-            risk_level="High" if is_anemic else "Low",
-            prediction="Anemia indicated by low hemoglobin levels (Fallback)." if is_anemic else "Hemoglobin levels within range (Fallback).",
-            confidence=0.7,
-            recommendations=["Follow standard medical advice"]
-        )
+def signal_prefork_parent(signum: int, action: str):
+    """Ask the serve.py parent to reload or roll back and replace every worker"""
+    try:
+        os.kill(PREFORK_PARENT, signum)
+    except OSError as e:
+        raise HTTPException(status_code=503, detail=f"Could not signal prefork parent {PREFORK_PARENT}: {str(e)}")
+    return JSONResponse(status_code=202, content={
+        "status": f"{action} requested from prefork parent {PREFORK_PARENT}; workers are replaced once it is done",
+        **registry.status()
+    })
+
+@app.post("/admin/models/reload")
+async def reload_models():
+    if PREFORK_PARENT:
+        return signal_prefork_parent(signal.SIGHUP, "reload")
+    try:
+        await asyncio.to_thread(registry.reload)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=422, detail=f"Model reload rejected: {str(e)}")
+    return registry.status()
 
-@app.post("/predict/kidney", response_model=PredictionResponse)
-async def predict_kidney(request: PredictionRequest):
+@app.post("/admin/models/rollback")
+async def rollback_models():
+    if PREFORK_PARENT:
+        return signal_prefork_parent(signal.SIGUSR2, "rollback")
     try:
-        input_data = {p.name.strip().lower(): p.value for p in request.parameters}
-        
-        if kidney_model is not None and kidney_features is not None:
-            try:
-                ordered_features = []
-                for feat in kidney_features:
-                    # Map common names to feature names
-                    val = 0.0
-                    if feat == 'age': val = float(request.age or 40)
-                    elif feat in input_data: val = input_data[feat]
-                    # Handle some categorical defaults if missing (mode encoding)
-                    elif feat in ['sg', 'al', 'su']: val = 0.0
-                    
-                    ordered_features.append(val)
-
-                pred_class = int(kidney_model.predict([ordered_features])[0])
-                pred_proba = kidney_model.predict_proba([ordered_features])[0]
-                confidence = float(np.max(pred_proba))
-                
-                # In kidney dataset, classification was likely encoded as 0 for ckd, 1 for notckd or vice versa
-                # Based on train_kidney.py: le_target.fit_transform(['ckd', 'notckd']) -> ckd=0, notckd=1
-                is_ckd = (pred_class == 0)
-                
-                risk_level = "High" if is_ckd else "Low"
-                risk_score = float(pred_proba[0]) # Prob of being class 0 (CKD)
-                
-                prediction = "High risk of Chronic Kidney Disease detected." if is_ckd else "Low risk of Chronic Kidney Disease detected."
-                
-                recs = ["Regular kidney function monitoring (KFT)"]
-                if is_ckd:
-                    recs.extend([
-                        "Consult a nephrologist immediately",
-                        "Monitor blood pressure and blood sugar closely",
-                        "Follow a kidney-friendly diet (low protein/sodium)"
-                    ])
-                else:
-                    recs.append("Maintain hydration and healthy lifestyle")
-                    
-                return PredictionResponse(
-                    risk_score=risk_score,
-                    risk_level=risk_level,
-                    prediction=prediction,
-                    confidence=confidence,
-                    recommendations=recs
+        registry.rollback()
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return registry.status()
+
+
+def saturated_error() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Inference queue is full, retry shortly",
+        headers={"Retry-After": RETRY_AFTER_SECONDS}
+    )
+
+async def predict_one(name: str, request: PredictionRequest, params: Optional[ParsedParameters] = None,
+                      snapshot=None, mode: str = "single") -> PredictionResponse:
+    """Score one request with the named model, applying the spec's fallback rules"""
+    spec = SPECS_BY_NAME[name]
+    if params is None:
+        with PHASE_LATENCY.time(name, "parse"):
+            params = ParsedParameters(request.parameters)
+    snapshot = snapshot or registry.current
+    compiled = snapshot.get(name)
+    if compiled is not None:
+        try:
+            with PHASE_LATENCY.time(name, "resolve"):
+                X = compiled.build_row(request, params).reshape(1, -1)
+                key = (snapshot.version, compiled.cache_key(X))
+            with PHASE_LATENCY.time(name, "inference"):
+                classes, proba = await prediction_caches[name].get_or_compute(
+                    key, lambda: inference_pool.submit(snapshot, name, X)
                 )
+            with PHASE_LATENCY.time(name, "serialize"):
+                response = PredictionResponse(**compiled.response(classes[0], proba[0]), model_version=snapshot.version)
+            PREDICTIONS.inc(name, mode)
+            return response
+        except PoolSaturated:
+            PREDICTION_ERRORS.inc(name, "saturated")
+            raise saturated_error()
+        except Exception as e:
+            PREDICTION_ERRORS.inc(name, "prediction")
+            print(f"{spec.label} Prediction Error: {str(e)}")
+            if not (spec.fallback_on_error and spec.fallback):
+                raise HTTPException(status_code=500, detail=f"{spec.label} Prediction Error: {str(e)}")
+            FALLBACKS.inc(name, "model_error")
+    if spec.fallback is None:
+        PREDICTION_ERRORS.inc(name, "not_loaded")
+        raise HTTPException(status_code=404, detail=f"{spec.label} model not loaded")
+    if compiled is None:
+        FALLBACKS.inc(name, "model_missing")
+    response = PredictionResponse(**spec.fallback(request, params), model_version="fallback")
+    PREDICTIONS.inc(name, mode)
+    return response
+
+async def score_batch(name: str, requests: List[PredictionRequest], snapshot=None,
+                      mode: str = "batch") -> BatchPredictionResponse:
+    """Score many requests with one feature matrix and a single predict_proba call.
+
+    Rows that fail feature assembly or response building are reported with an
+    error instead of failing the whole batch. Results keep the input order.
+    """
+    spec = SPECS_BY_NAME[name]
+    snapshot = snapshot or registry.current
+    compiled = snapshot.get(name)
+    items: List[Optional[BatchPredictionItem]] = [None] * len(requests)
+    with PHASE_LATENCY.time(name, "parse"):
+        params_list = [ParsedParameters(req.parameters) for req in requests]
+
+    if compiled is None:
+        if spec.fallback is None:
+            PREDICTION_ERRORS.inc(name, "not_loaded")
+            raise HTTPException(status_code=404, detail=f"{spec.label} model not loaded")
+        for i, req in enumerate(requests):
+            try:
+                result = PredictionResponse(**spec.fallback(req, params_list[i]), model_version="fallback")
+                items[i] = BatchPredictionItem(index=i, patientId=req.patientId, result=result)
             except Exception as e:
-                print(f"Kidney Prediction Error: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Kidney Prediction Error: {str(e)}")
-        
-        raise HTTPException(status_code=404, detail="Kidney model not loaded")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+                items[i] = BatchPredictionItem(index=i, patientId=req.patientId, error=str(e))
+        record_batch(name, mode, items)
+        FALLBACKS.inc(name, "model_missing", amount=len(requests))
+        return BatchPredictionResponse(results=items, model_version="fallback")
+
+    with PHASE_LATENCY.time(name, "resolve"):
+        X = np.tile(compiled.defaults, (len(requests), 1))
+        row_index = []
+        for i, req in enumerate(requests):
+            try:
+                compiled.fill_row(X[len(row_index)], req, params_list[i])
+                row_index.append(i)
+            except Exception as e:
+                X[len(row_index)] = compiled.defaults
+                items[i] = BatchPredictionItem(index=i, patientId=req.patientId, error=str(e))
+
+    if row_index:
+        try:
+            with PHASE_LATENCY.time(name, "inference"):
+                classes, proba = await inference_pool.run(snapshot, name, X[:len(row_index)])
+        except PoolSaturated:
+            PREDICTION_ERRORS.inc(name, "saturated")
+            raise saturated_error()
+        with PHASE_LATENCY.time(name, "serialize"):
+            for i, pred_class, pred_proba in zip(row_index, classes, proba):
+                req = requests[i]
+                try:
+                    result = PredictionResponse(**compiled.response(pred_class, pred_proba), model_version=snapshot.version)
+                    items[i] = BatchPredictionItem(index=i, patientId=req.patientId, result=result)
+                except Exception as e:
+                    items[i] = BatchPredictionItem(index=i, patientId=req.patientId, error=str(e))
+
+    record_batch(name, mode, items)
+    return BatchPredictionResponse(results=items, model_version=snapshot.version)
+
+def record_batch(name: str, mode: str, items: List[BatchPredictionItem]):
+    failed = sum(1 for item in items if item.error is not None)
+    if failed:
+        PREDICTION_ERRORS.inc(name, "row", amount=failed)
+    if len(items) > failed:
+        PREDICTIONS.inc(name, mode, amount=len(items) - failed)
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body generator itself reads the request body
+
+    The stock response listens for client disconnects on receive() while it
+    streams, which would swallow request body chunks the generator has not
+    read yet. Here the generator owns receive(); a disconnect surfaces as
+    ClientDisconnect from request.stream() instead.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+async def read_ndjson_lines(http_request: Request):
+    """Yield non-empty lines of the request body as they arrive"""
+    buffer = b""
+    async for block in http_request.stream():
+        buffer += block
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+async def score_ndjson_chunk(name: str, lines: List[bytes], first_index: int, snapshot) -> bytes:
+    """Parse and score one chunk of NDJSON lines, returning NDJSON results"""
+    items: List[Optional[BatchPredictionItem]] = [None] * len(lines)
+    requests = []
+    positions = []
+    with PHASE_LATENCY.time(name, "parse"):
+        for i, line in enumerate(lines):
+            try:
+                requests.append(PredictionRequest(**compact_format.loads(line)))
+                positions.append(i)
+            except Exception as e:
+                items[i] = BatchPredictionItem(index=first_index + i, patientId="", error=f"Invalid request line: {str(e)}")
+    if len(requests) < len(lines):
+        PREDICTION_ERRORS.inc(name, "invalid_line", amount=len(lines) - len(requests))
 
+    if requests:
+        while True:
+            try:
+                batch = await score_batch(name, requests, snapshot, mode="stream")
+                break
+            except HTTPException as e:
+                if e.status_code != 503:
+                    raise
+                # Bulk jobs wait for capacity instead of failing mid-stream
+                await asyncio.sleep(float(RETRY_AFTER_SECONDS))
+        for item in batch.results:
+            item.index = first_index + positions[item.index]
+            items[item.index - first_index] = item
+
+    with PHASE_LATENCY.time(name, "serialize"):
+        return b"".join(item.model_dump_json().encode() + b"\n" for item in items)
+
+async def stream_scores(name: str, http_request: Request, chunk_size: int):
+    snapshot = registry.current
+    first_index = 0
+    chunk = []
+    async for line in read_ndjson_lines(http_request):
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield await score_ndjson_chunk(name, chunk, first_index, snapshot)
+            first_index += len(chunk)
+            chunk = []
+    if chunk:
+        yield await score_ndjson_chunk(name, chunk, first_index, snapshot)
+
+@app.post("/predict/all", response_model=PanelPredictionResponse)
+async def predict_all(request: PredictionRequest, models: Optional[str] = None):
+    """Run the full risk panel (or a comma-separated subset via ?models=) in one call"""
+    snapshot = registry.current
+    if models:
+        names = [m.strip().lower() for m in models.split(",") if m.strip()]
+        unknown = [m for m in names if m not in SPECS_BY_NAME]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown models: {', '.join(unknown)}")
+    else:
+        names = [spec.name for spec in SPECS if spec.name in snapshot.models or spec.fallback is not None]
 
-@app.post("/predict/liver", response_model=PredictionResponse)
-async def predict_liver(request: PredictionRequest):
     try:
-        # Map parameters to feature names (case-insensitive and handling potential variations)
-        input_data = {p.name.strip().lower().replace(" ", "_"): p.value for p in request.parameters}
-        
-        # Gender encoding: Female=0, Male=1 (from LabelEncoder in train_liver.py)
-        gender_val = 1 if request.gender == "Male" else 0
-        
-        if liver_model is not None and liver_features is not None:
-            try:
-                feature_mapping = {
-                    "age": ["age"],
-                    "gender": ["gender"],
-                    "total_bilirubin": ["total_bilirubin", "tb", "bilirubin_total"],
-                    "direct_bilirubin": ["direct_bilirubin", "db", "bilirubin_direct"],
-                    "alkaline_phosphotase": ["alkaline_phosphotase", "alp", "alkaline_phosphatase"],
-                    "alamine_aminotransferase": ["alamine_aminotransferase", "sgpt", "alt"],
-                    "aspartate_aminotransferase": ["aspartate_aminotransferase", "sgot", "ast"],
-                    "total_protiens": ["total_protiens", "tp", "total_proteins", "protein_total"],
-                    "albumin": ["albumin", "alb"],
-                    "albumin_and_globulin_ratio": ["albumin_and_globulin_ratio", "ag_ratio", "a/g_ratio"]
-                }
-                
-                ordered_features = []
-                for feat in liver_features:
-                    feat_lower = feat.lower()
-                    if feat_lower == "age":
-                        ordered_features.append(float(request.age or 40))
-                    elif feat_lower == "gender":
-                        ordered_features.append(float(gender_val))
-                    else:
-                        found = False
-                        # Try mapping
-                        for alias in feature_mapping.get(feat_lower, [feat_lower]):
-                            if alias in input_data:
-                                ordered_features.append(input_data[alias])
-                                found = True
-                                break
-                        if not found:
-                            # Try direct name match in input_data
-                            if feat_lower in input_data:
-                                ordered_features.append(input_data[feat_lower])
-                                found = True
-                        if not found:
-                            # Use default value or mean (0.0 is safe fallback if mean isn't known)
-                            ordered_features.append(0.0)
-
-                pred_class = int(liver_model.predict([ordered_features])[0])
-                pred_proba = liver_model.predict_proba([ordered_features])[0]
-                confidence = float(np.max(pred_proba))
-                
-                # In train_liver.py: 1 for patient, 0 for non-patient
-                is_patient = (pred_class == 1)
-                
-                risk_level = "High" if is_patient else "Low"
-                risk_score = float(pred_proba[1]) # Prob of being class 1 (Patient)
-                
-                prediction = "High risk of Liver Disease detected." if is_patient else "Low risk of Liver Disease detected."
-                
-                recs = ["Complete Liver Function Test (LFT)"]
-                if is_patient:
-                    recs.extend([
-                        "Consult a hepatologist or gastroenterologist",
-                        "Avoid alcohol consumption",
-                        "Maintain a healthy weight and monitor diet"
-                    ])
-                else:
-                    recs.append("Maintain a healthy lifestyle and regular checkups")
-                    
-                return PredictionResponse(
-                    risk_score=risk_score,
-                    risk_level=risk_level,
-                    prediction=prediction,
-                    confidence=confidence,
-                    recommendations=recs
-                )
-            except Exception as e:
-                print(f"Liver Prediction Error: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Liver Prediction Error: {str(e)}")
-        
-        raise HTTPException(status_code=404, detail="Liver model not loaded")
+        with PHASE_LATENCY.time("panel", "parse"):
+            params = ParsedParameters(request.parameters)
     except Exception as e:
+        PREDICTION_ERRORS.inc("panel", "parse")
         raise HTTPException(status_code=500, detail=str(e))
 
+    outcomes = await asyncio.gather(
+        *(predict_one(name, request, params, snapshot, mode="panel") for name in names),
+        return_exceptions=True
+    )
+
+    results = {}
+    errors = {}
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, HTTPException) and outcome.status_code == 503:
+            raise outcome
+        if isinstance(outcome, HTTPException):
+            errors[name] = str(outcome.detail)
+        elif isinstance(outcome, Exception):
+            errors[name] = str(outcome)
+        else:
+            results[name] = outcome
+    return PanelPredictionResponse(patientId=request.patientId, results=results, errors=errors)
+
+@app.post("/predict/sepsis/patients/{patient_id}", response_model=PatientPredictionResponse)
+async def observe_patient(patient_id: str, observation: ObservationRequest):
+    """Add one observation to the patient's state and score the carried-forward vitals"""
+    require_patient_store()
+    name = "sepsis"
+    spec = SPECS_BY_NAME[name]
+    snapshot = registry.current
+    compiled = snapshot.get(name)
+    if compiled is None:
+        PREDICTION_ERRORS.inc(name, "not_loaded")
+        raise HTTPException(status_code=404, detail=f"{spec.label} model not loaded")
 
-@app.post("/predict/sepsis", response_model=PredictionResponse)
-async def predict_sepsis(request: PredictionRequest):
     try:
-        input_data = {p.name.strip().lower(): p.value for p in request.parameters}
-        gender_val = 1 if request.gender == "Male" else 0
-        
-        if sepsis_model is not None and sepsis_features is not None:
-            try:
-                ordered_features = []
-                for feat in sepsis_features:
-                    feat_lower = feat.lower()
-                    if feat_lower == 'age':
-                        ordered_features.append(float(request.age or 40))
-                    elif feat_lower == 'gender':
-                        ordered_features.append(float(gender_val))
-                    elif feat_lower in input_data:
-                        ordered_features.append(input_data[feat_lower])
-                    else:
-                        # Fallback for missing features - use mean values from dataset
-                        val = 0.0
-                        if sepsis_means and feat in sepsis_means:
-                            val = float(sepsis_means[feat])
-                        ordered_features.append(val)
-
-                pred_class = int(sepsis_model.predict([ordered_features])[0])
-                pred_proba = sepsis_model.predict_proba([ordered_features])[0]
-                confidence = float(np.max(pred_proba))
-                
-                is_sepsis = (pred_class == 1)
-                
-                risk_level = "High" if is_sepsis else "Low"
-                risk_score = float(pred_proba[1]) # Prob of being class 1 (Sepsis)
-                
-                prediction = "High risk of Sepsis detected. Immediate medical attention required." if is_sepsis else "Low risk of Sepsis detected."
-                
-                recs = ["Monitor vital signs (HR, BP, Temp, Resp)"]
-                if is_sepsis:
-                    recs.extend([
-                        "Alert medical emergency team (Sepsis Protocol)",
-                        "Start intravenous fluids and broad-spectrum antibiotics",
-                        "Monitor lactate levels and organ function"
-                    ])
-                else:
-                    recs.append("Continue regular monitoring of patient status")
-                    
-                return PredictionResponse(
-                    risk_score=risk_score,
-                    risk_level=risk_level,
-                    prediction=prediction,
-                    confidence=confidence,
-                    recommendations=recs
-                )
-            except Exception as e:
-                print(f"Sepsis Prediction Error: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Sepsis Prediction Error: {str(e)}")
-        
-        raise HTTPException(status_code=404, detail="Sepsis model not loaded")
+        with PHASE_LATENCY.time(name, "parse"):
+            params = ParsedParameters(observation.parameters)
+        with PHASE_LATENCY.time(name, "resolve"):
+            values = {compiled.features[col]: value for col, value in compiled.resolve_parameters(params).items()}
+            # Stored only once scoring succeeded, so a failed request can be retried
+            pending = patient_store.prepare(patient_id, values, observation.hour, observation.gender, observation.age)
+            state = pending.summary()
+            request = PredictionRequest(
+                patientId=patient_id, parameters=[],
+                gender=state["gender"] or "Male", age=state["age"] or 40
+            )
+            X = compiled.defaults.copy()
+            for col, feature in enumerate(compiled.features):
+                if feature in state["trends"]:
+                    X[col] = state["trends"][feature]["last"]
+            for col, resolve in compiled.request_columns:
+                X[col] = resolve(request)
+            X = X.reshape(1, -1)
+            key = (snapshot.version, compiled.cache_key(X))
+        with PHASE_LATENCY.time(name, "inference"):
+            classes, proba = await prediction_caches[name].get_or_compute(
+                key, lambda: inference_pool.submit(snapshot, name, X)
+            )
+        state = patient_store.commit(pending)
+        with PHASE_LATENCY.time(name, "serialize"):
+            response = PatientPredictionResponse(
+                **compiled.response(classes[0], proba[0]), model_version=snapshot.version, patient=state
+            )
+    except OutOfOrderObservation as e:
+        PREDICTION_ERRORS.inc(name, "out_of_order")
+        raise HTTPException(status_code=409, detail=str(e))
+    except PoolSaturated:
+        PREDICTION_ERRORS.inc(name, "saturated")
+        raise saturated_error()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        PREDICTION_ERRORS.inc(name, "prediction")
+        print(f"{spec.label} Prediction Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"{spec.label} Prediction Error: {str(e)}")
+    finally:
+        if observation.discharged:
+            patient_store.discharge(patient_id)
+    PREDICTIONS.inc(name, "patient")
+    return response
+
+@app.get("/predict/sepsis/patients/{patient_id}", response_model=PatientSummary)
+async def patient_state(patient_id: str):
+    require_patient_store()
+    state = patient_store.get(patient_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"No state for patient {patient_id}")
+    return state
+
+@app.delete("/predict/sepsis/patients/{patient_id}")
+async def discharge_patient(patient_id: str):
+    """Drop the patient's state, e.g. after discharge"""
+    require_patient_store()
+    if not patient_store.discharge(patient_id):
+        raise HTTPException(status_code=404, detail=f"No state for patient {patient_id}")
+    return {"patientId": patient_id, "discharged": True}
+
+async def score_compact(name: str, body: bytes) -> Response:
+    """Score a compact names/values or rows payload (see compact_format.py)"""
+    spec = SPECS_BY_NAME[name]
+    snapshot = registry.current
+    compiled = snapshot.get(name)
+    if compiled is None:
+        PREDICTION_ERRORS.inc(name, "not_loaded")
+        raise HTTPException(status_code=404, detail=f"{spec.label} model not loaded")
+    try:
+        with PHASE_LATENCY.time(name, "parse"):
+            payload = compact_format.loads(body)
+            X = compact_format.parse_matrix(payload, compiled, DEFAULT_REQUEST)
+    except (CompactRequestError, ValueError) as e:
+        PREDICTION_ERRORS.inc(name, "parse")
+        raise HTTPException(status_code=422, detail=str(e))
+    version = payload.get("model_version")
+    if version is not None and version != snapshot.version:
+        raise HTTPException(status_code=409, detail=f"Schema is for model version {version}, serving {snapshot.version}")
 
-@app.post("/predict/cardio", response_model=PredictionResponse)
-async def predict_cardio(request: PredictionRequest):
     try:
-        input_data = {p.name.strip().lower(): p.value for p in request.parameters}
-        gender_val = 1 if request.gender == "Male" else 0
-        
-        if cardio_model is not None and cardio_features is not None:
-            try:
-                ordered_features = []
-                for feat in cardio_features:
-                    feat_lower = feat.lower()
-                    if feat_lower == 'male':
-                        ordered_features.append(float(gender_val))
-                    elif feat_lower == 'age':
-                        ordered_features.append(float(request.age or 40))
-                    elif feat_lower in input_data:
-                        ordered_features.append(input_data[feat_lower])
-                    else:
-                        ordered_features.append(0.0)
-
-                pred_class = int(cardio_model.predict([ordered_features])[0])
-                pred_proba = cardio_model.predict_proba([ordered_features])[0]
-                confidence = float(np.max(pred_proba))
-                
-                # In Framingham dataset, TenYearCHD is 1 for high risk, 0 for low
-                is_cardio = (pred_class == 1)
-                
-                risk_level = "High" if is_cardio else "Low"
-                risk_score = float(pred_proba[1]) # Prob of being class 1
-                
-                prediction = "High risk of Cardiovascular disease (CHD) in 10 years detected." if is_cardio else "Low risk of Cardiovascular disease (CHD) in 10 years detected."
-                
-                recs = ["Monitor blood pressure and cholesterol regularly"]
-                if is_cardio:
-                    recs.extend([
-                        "Consult a cardiologist for a comprehensive evaluation",
-                        "Adopt a heart-healthy diet (low saturated fats, high fiber)",
-                        "Increase physical activity and manage stress",
-                        "Quit smoking if applicable"
-                    ])
-                else:
-                    recs.append("Maintain a healthy lifestyle and regular screenings")
-                    
-                return PredictionResponse(
-                    risk_score=risk_score,
-                    risk_level=risk_level,
-                    prediction=prediction,
-                    confidence=confidence,
-                    recommendations=recs
-                )
-            except Exception as e:
-                print(f"Cardio Prediction Error: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Cardio Prediction Error: {str(e)}")
-        
-        # Fallback if model not loaded
-        sys_bp = input_data.get('sysbp', 120)
-        dia_bp = input_data.get('diabp', 80)
-        is_high_risk = sys_bp > 140 or dia_bp > 90
-        
-        return PredictionResponse(
-            risk_score=0.75 if is_high_risk else 0.25,
-            risk_level="High" if is_high_risk else "Low",
-            prediction="Cardiovascular risk indicated by high blood pressure (Fallback)." if is_high_risk else "Blood pressure within normal range (Fallback).",
-            confidence=0.6,
-            recommendations=["Regular BP monitoring", "Consult a doctor for full screening"]
-        )
+        with PHASE_LATENCY.time(name, "inference"):
+            classes, proba = await inference_pool.run(snapshot, name, X)
+    except PoolSaturated:
+        PREDICTION_ERRORS.inc(name, "saturated")
+        raise saturated_error()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        PREDICTION_ERRORS.inc(name, "prediction")
+        print(f"{spec.label} Prediction Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"{spec.label} Prediction Error: {str(e)}")
+    with PHASE_LATENCY.time(name, "serialize"):
+        content = compact_format.dumps(compact_format.compact_response(compiled, classes, proba, snapshot.version))
+    PREDICTIONS.inc(name, "compact", amount=len(X))
+    return Response(content, media_type="application/json")
+
+def register_routes(name: str):
+    """Expose /predict/<name> and its /batch, /stream and /compact variants for one spec"""
+    spec = SPECS_BY_NAME[name]
+
+    async def predict(request: PredictionRequest):
+        return await predict_one(name, request)
+
+    async def predict_batch(batch: BatchPredictionRequest):
+        try:
+            return await score_batch(name, batch.requests)
+        except HTTPException:
+            raise
+        except Exception as e:
+            PREDICTION_ERRORS.inc(name, "batch")
+            print(f"{spec.label} Batch Prediction Error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"{spec.label} Prediction Error: {str(e)}")
+
+    async def predict_stream(http_request: Request, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Score NDJSON PredictionRequest lines in chunks, streaming NDJSON results back"""
+        if name not in registry.current.models and spec.fallback is None:
+            raise HTTPException(status_code=404, detail=f"{spec.label} model not loaded")
+        chunk_size = max(1, chunk_size)
+        return NDJSONStreamingResponse(stream_scores(name, http_request, chunk_size))
+
+    async def predict_compact(http_request: Request):
+        """Score a compact columnar payload without per-parameter validation"""
+        return await score_compact(name, await http_request.body())
+
+    app.post(spec.route, response_model=PredictionResponse, name=f"predict_{name}")(predict)
+    app.post(f"{spec.route}/batch", response_model=BatchPredictionResponse, name=f"predict_{name}_batch")(predict_batch)
+    app.post(f"{spec.route}/stream", name=f"predict_{name}_stream")(predict_stream)
+    app.post(f"{spec.route}/compact", name=f"predict_{name}_compact")(predict_compact)
+
+for spec in SPECS:
+    register_routes(spec.name)
 
 if __name__ == "__main__":
     import uvicorn
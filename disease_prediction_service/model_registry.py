@@ -0,0 +1,188 @@
+"""Versioned, hot-reloadable set of disease models
+
+The registry serves one immutable ModelSnapshot at a time. A reload loads
+the artifacts in models/ into a brand new snapshot, validates it with a
+smoke prediction per model and only then swaps it in, so requests that
+already picked up the old snapshot finish on it undisturbed. The replaced
+snapshot is kept in memory for rollback.
+
+Reloads are triggered by the admin endpoints or by a background thread that
+polls models/ for changed artifacts (MODEL_WATCH_INTERVAL seconds, 0 to
+disable). A change is only picked up once the files have stopped changing
+for one poll, so a training script that is still writing is not loaded.
+"""
+from typing import Callable, Dict, List, Optional
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+
+from disease_models import SPECS, MODELS_DIR, CompiledModel, load_models
+from prediction_metrics import MODEL_RELOADS, MODEL_RELOAD_LATENCY
+
+
+class ModelSnapshot:
+    """One loaded artifact set, identified by a content hash"""
+
+    def __init__(self, version: str, models: Dict[str, CompiledModel], signature):
+        self.version = version
+        self.models = models
+        self.signature = signature
+        self.loaded_at = time.time()
+
+    def get(self, name: str) -> Optional[CompiledModel]:
+        return self.models.get(name)
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "models": sorted(self.models)
+        }
+
+
+def artifact_paths(models_dir: str) -> List[str]:
+    paths = []
+    for spec in SPECS:
+        for filename in (spec.model_file, spec.compact_file, spec.features_file, spec.means_file, spec.encoders_file):
+            if filename:
+                paths.append(os.path.join(models_dir, filename))
+    return paths
+
+
+def artifact_signature(models_dir: str):
+    """Cheap change detector: (path, mtime, size) of every artifact present"""
+    signature = []
+    for path in artifact_paths(models_dir):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        signature.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def artifact_version(models_dir: str) -> str:
+    """Content hash of the artifact set, used as the model version"""
+    digest = hashlib.sha256()
+    for path in artifact_paths(models_dir):
+        if not os.path.exists(path):
+            continue
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def validate_snapshot(snapshot: ModelSnapshot):
+    """Smoke-test every model on its default row; raise if any misbehaves"""
+    for name, compiled in snapshot.models.items():
+        X = compiled.defaults.reshape(1, -1)
+        classes, proba = compiled.predict(X)
+        if proba.shape != (1, len(compiled.classes)) or not np.all(np.isfinite(proba)):
+            raise ValueError(f"{name} model returned invalid probabilities {proba!r}")
+        if not np.isclose(proba.sum(), 1.0):
+            raise ValueError(f"{name} model probabilities do not sum to 1")
+        compiled.response(classes[0], proba[0])
+
+
+class ModelRegistry:
+    def __init__(self, models_dir: str = MODELS_DIR, watch_interval: float = 0):
+        self.models_dir = models_dir
+        self.watch_interval = watch_interval
+        self.current = ModelSnapshot("none", {}, ())
+        self.previous: Optional[ModelSnapshot] = None
+        self.last_error: Optional[str] = None
+        self._listeners: List[Callable] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        # Artifact signature last loaded (or rejected); rollbacks leave it alone
+        self._seen_signature = ()
+
+    def add_listener(self, listener: Callable):
+        """Call listener(new_snapshot, old_snapshot) after every swap"""
+        self._listeners.append(listener)
+
+    def _publish(self, snapshot: ModelSnapshot):
+        with self._lock:
+            old = self.current
+            self.current = snapshot
+            if old.version != "none":
+                self.previous = old
+        for listener in self._listeners:
+            try:
+                listener(snapshot, old)
+            except Exception as e:
+                print(f"Model swap listener error: {str(e)}")
+        print(f"Serving disease models version {snapshot.version} ({', '.join(sorted(snapshot.models)) or 'none'})")
+
+    def reload(self, strict: bool = True) -> ModelSnapshot:
+        """Load, validate and publish the artifacts currently in models_dir
+
+        strict=False skips artifacts that fail to load instead of rejecting
+        the whole set (used at startup so the service still comes up).
+        """
+        signature = artifact_signature(self.models_dir)
+        self._seen_signature = signature
+        start = time.perf_counter()
+        try:
+            version = artifact_version(self.models_dir)
+            snapshot = ModelSnapshot(version, load_models(self.models_dir, strict=strict), signature)
+            validate_snapshot(snapshot)
+        except Exception as e:
+            MODEL_RELOADS.inc("rejected")
+            self.last_error = str(e)
+            raise
+        MODEL_RELOAD_LATENCY.observe(time.perf_counter() - start)
+        MODEL_RELOADS.inc("published")
+        self.last_error = None
+        self._publish(snapshot)
+        return snapshot
+
+    def rollback(self) -> ModelSnapshot:
+        """Swap back to the previously served snapshot"""
+        if self.previous is None:
+            raise LookupError("No previous model version to roll back to")
+        self._publish(self.previous)
+        return self.current
+
+    def _watch(self):
+        pending = None
+        while not self._stop.wait(self.watch_interval):
+            signature = artifact_signature(self.models_dir)
+            if signature == self._seen_signature:
+                pending = None
+                continue
+            if signature != pending:
+                # Changed since the last poll; wait until it settles
+                pending = signature
+                continue
+            pending = None
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"Model reload failed, keeping version {self.current.version}: {str(e)}")
+
+    def start_watching(self):
+        if self.watch_interval <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def status(self) -> dict:
+        return {
+            "current": self.current.describe(),
+            "previous": self.previous.describe() if self.previous else None,
+            "watch_interval": self.watch_interval,
+            "last_error": self.last_error
+        }
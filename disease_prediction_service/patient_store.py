@@ -0,0 +1,286 @@
+"""Bounded in-memory per-patient state for incremental sepsis scoring
+
+ICU vitals arrive hourly and usually only a few at a time. Instead of
+resending the whole history, a client posts each new observation; the store
+keeps, per patient and feature:
+
+- the last known value, carried forward until a newer one arrives (features
+  never observed fall back to the model's training means);
+- rolling aggregates over the last `window` observations: mean, min, max and
+  the delta from the previous observation.
+
+Every update is O(1) per observed feature: the mean is a running sum over a
+fixed-size window, and min/max come from monotonic deques, which are
+amortized O(1).
+
+An observation is applied in two steps: prepare() computes the updated
+state on a copy, and commit() stores it once the caller has scored it, so
+a request that fails after prepare() leaves the stored history untouched
+and can be retried. An observation for the same hour as the patient's
+latest one, with exactly the same values, is treated as a retry of it and
+not applied again; one with different values is rejected like an
+out-of-order observation rather than silently dropped.
+
+State is dropped when a patient is discharged, after idle_ttl seconds
+without an observation, or least recently updated first once max_patients
+is reached. Idle patients are swept on every update, oldest first, so
+eviction never scans the whole store.
+"""
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+import threading
+import time
+
+
+class OutOfOrderObservation(ValueError):
+    """An observation is older than the patient's latest one, or differs from it for the same hour"""
+
+
+class FeatureWindow:
+    """Last value and rolling aggregates of one feature"""
+    __slots__ = ("values", "total", "seen", "minima", "maxima", "last", "previous")
+
+    def __init__(self, size: int):
+        self.values = deque(maxlen=size)
+        self.total = 0.0
+        self.seen = 0
+        # (sequence number, value), increasing / decreasing values
+        self.minima = deque()
+        self.maxima = deque()
+        self.last = None
+        self.previous = None
+
+    def add(self, value: float):
+        if len(self.values) == self.values.maxlen:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+        self.previous, self.last = self.last, value
+
+        seq = self.seen
+        self.seen += 1
+        oldest = seq - self.values.maxlen
+        minima, maxima = self.minima, self.maxima
+        while minima and minima[-1][1] >= value:
+            minima.pop()
+        while maxima and maxima[-1][1] <= value:
+            maxima.pop()
+        minima.append((seq, value))
+        maxima.append((seq, value))
+        # The newest entry is always inside the window, so these never empty
+        while minima[0][0] <= oldest:
+            minima.popleft()
+        while maxima[0][0] <= oldest:
+            maxima.popleft()
+
+    def copy(self) -> "FeatureWindow":
+        window = FeatureWindow(self.values.maxlen)
+        window.values = self.values.copy()
+        window.total = self.total
+        window.seen = self.seen
+        window.minima = self.minima.copy()
+        window.maxima = self.maxima.copy()
+        window.last = self.last
+        window.previous = self.previous
+        return window
+
+    def summary(self) -> dict:
+        return {
+            "last": self.last,
+            "mean": self.total / len(self.values),
+            "min": self.minima[0][1],
+            "max": self.maxima[0][1],
+            "delta": None if self.previous is None else self.last - self.previous,
+            "count": len(self.values),
+        }
+
+
+class PatientState:
+    __slots__ = ("patient_id", "features", "hour", "observations", "gender", "age", "updated_at", "last_values")
+
+    def __init__(self, patient_id: str):
+        self.patient_id = patient_id
+        self.features: Dict[str, FeatureWindow] = {}
+        self.hour = None
+        self.observations = 0
+        self.gender = None
+        self.age = None
+        self.updated_at = 0.0
+        # Values of the latest observation, to recognize a retry of it
+        self.last_values: Dict[str, float] = {}
+
+    def copy(self) -> "PatientState":
+        state = PatientState(self.patient_id)
+        state.features = {name: window.copy() for name, window in self.features.items()}
+        state.hour = self.hour
+        state.observations = self.observations
+        state.gender = self.gender
+        state.age = self.age
+        state.updated_at = self.updated_at
+        state.last_values = self.last_values
+        return state
+
+    def summary(self) -> dict:
+        return {
+            "patientId": self.patient_id,
+            "hour": self.hour,
+            "observations": self.observations,
+            "gender": self.gender,
+            "age": self.age,
+            "trends": {name: window.summary() for name, window in self.features.items()},
+        }
+
+
+class PendingObservation:
+    """An observation applied to a copy of the patient's state, not yet stored"""
+    __slots__ = ("patient_id", "base", "state", "args", "duplicate")
+
+    def __init__(self, patient_id: str, base: Optional[PatientState], state: PatientState, args: tuple,
+                 duplicate: bool = False):
+        self.patient_id = patient_id
+        # The stored state the copy was made from (None for a new patient)
+        self.base = base
+        self.state = state
+        self.args = args
+        self.duplicate = duplicate
+
+    def summary(self) -> dict:
+        return self.state.summary()
+
+
+class PatientStore:
+    def __init__(self, max_patients=10000, idle_ttl=6 * 3600.0, window=6):
+        self.max_patients = max_patients
+        self.idle_ttl = idle_ttl
+        self.window = window
+        self.updates = 0
+        self.discharges = 0
+        self.expirations = 0
+        self.evictions = 0
+        # Least recently updated first
+        self._patients: "OrderedDict[str, PatientState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def prepare(self, patient_id: str, values: Dict[str, float], hour: Optional[float] = None,
+                gender: Optional[str] = None, age: Optional[int] = None) -> PendingObservation:
+        """The patient's state with this observation applied, without storing it
+
+        Raises OutOfOrderObservation if hour is earlier than the patient's last
+        observation, or equal to it with different values. The same values
+        for the patient's current hour are a retry: the stored state is
+        returned unchanged and commit() does nothing.
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            base = self._patients.get(patient_id)
+            if base is not None and self._is_retry(base, values, hour):
+                return PendingObservation(patient_id, base, base.copy(), (), duplicate=True)
+            state = base.copy() if base is not None else PatientState(patient_id)
+        args = (values, hour, gender, age)
+        self._apply(state, *args)
+        return PendingObservation(patient_id, base, state, args)
+
+    def commit(self, pending: PendingObservation) -> dict:
+        """Store a prepared observation and return the patient's summary
+
+        If another observation for the patient was stored in the meantime,
+        this one is applied on top of it instead (or raises
+        OutOfOrderObservation if it is now out of order).
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            current = self._patients.get(pending.patient_id)
+            if pending.duplicate:
+                if current is not None:
+                    return current.summary()
+                return pending.summary()
+            if current is pending.base:
+                state = pending.state
+            else:
+                state = current.copy() if current is not None else PatientState(pending.patient_id)
+                values, hour = pending.args[:2]
+                if self._is_retry(state, values, hour):
+                    return state.summary()
+                self._apply(state, *pending.args)
+            state.updated_at = now
+            self.updates += 1
+
+            self._patients[pending.patient_id] = state
+            self._patients.move_to_end(pending.patient_id)
+            while len(self._patients) > self.max_patients:
+                self._patients.popitem(last=False)
+                self.evictions += 1
+            return state.summary()
+
+    def observe(self, patient_id: str, values: Dict[str, float], hour: Optional[float] = None,
+                gender: Optional[str] = None, age: Optional[int] = None) -> dict:
+        """Apply and store one observation; returns the patient's summary with carried-forward values"""
+        return self.commit(self.prepare(patient_id, values, hour, gender, age))
+
+    @staticmethod
+    def _is_retry(state: PatientState, values: Dict[str, float], hour: Optional[float]) -> bool:
+        """Whether the observation repeats the latest one; raises OutOfOrderObservation if it conflicts"""
+        if hour is None or state.hour is None or hour > state.hour:
+            return False
+        if hour < state.hour:
+            raise OutOfOrderObservation(f"Observation for hour {hour} is older than the last one (hour {state.hour})")
+        if {name: float(value) for name, value in values.items()} != state.last_values:
+            raise OutOfOrderObservation(
+                f"Observation for hour {hour} differs from the one already stored for that hour; "
+                "send a correction as a new hour"
+            )
+        return True
+
+    def _apply(self, state: PatientState, values: Dict[str, float], hour: Optional[float],
+               gender: Optional[str], age: Optional[int]):
+        for name, value in values.items():
+            window = state.features.get(name)
+            if window is None:
+                window = state.features[name] = FeatureWindow(self.window)
+            window.add(float(value))
+        state.last_values = {name: float(value) for name, value in values.items()}
+        if hour is not None:
+            state.hour = hour
+        elif state.hour is not None:
+            state.hour += 1
+        if gender is not None:
+            state.gender = gender
+        if age is not None:
+            state.age = age
+        state.observations += 1
+
+    def get(self, patient_id: str) -> Optional[dict]:
+        with self._lock:
+            self._expire(time.monotonic())
+            state = self._patients.get(patient_id)
+            return state.summary() if state is not None else None
+
+    def discharge(self, patient_id: str) -> bool:
+        with self._lock:
+            if self._patients.pop(patient_id, None) is None:
+                return False
+            self.discharges += 1
+            return True
+
+    def _expire(self, now: float):
+        while self._patients:
+            state = next(iter(self._patients.values()))
+            if now - state.updated_at < self.idle_ttl:
+                break
+            self._patients.popitem(last=False)
+            self.expirations += 1
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                "patients": len(self._patients),
+                "max_patients": self.max_patients,
+                "idle_ttl_seconds": self.idle_ttl,
+                "window": self.window,
+                "updates": self.updates,
+                "discharges": self.discharges,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+            }
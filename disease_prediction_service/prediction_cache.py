@@ -0,0 +1,122 @@
+"""Per-model LRU + TTL cache of single-row predictions with single-flight
+
+Keys are built from the model version and the resolved feature row, so two
+requests whose lab values resolve to the same features share one entry no
+matter how the parameters were named or ordered. While a key is being
+computed, identical requests wait on the same future instead of running
+the model again. Each waiter gets its own asyncio future chained from the
+shared one, so a cancelled request (e.g. a client disconnect) never
+cancels the computation the others are waiting for.
+"""
+from collections import OrderedDict
+import asyncio
+import threading
+import time
+
+
+class PredictionCache:
+    def __init__(self, max_entries=2048, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._generation = 0
+        # Re-entrant: a future that is already done runs its callback inline
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _store(self, key, generation, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if future.cancelled() or future.exception() is not None:
+                return
+            # Results computed before an invalidation are dropped
+            if generation != self._generation:
+                return
+            self._entries[key] = (future.result(), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    @staticmethod
+    def _waiter(future):
+        """A future on the running loop that follows future but can be cancelled alone"""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+
+        def settle(f):
+            if waiter.done():
+                return
+            if f.cancelled():
+                waiter.cancel()
+            elif f.exception() is not None:
+                waiter.set_exception(f.exception())
+            else:
+                waiter.set_result(f.result())
+
+        def forward(f):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(settle, f)
+
+        future.add_done_callback(forward)
+        return waiter
+
+    async def get_or_compute(self, key, submit):
+        """Return the cached value for key, or await submit() (a concurrent Future)"""
+        if not self.enabled:
+            return await asyncio.wrap_future(submit())
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                future = submit()
+                self.misses += 1
+                self._inflight[key] = future
+                generation = self._generation
+                future.add_done_callback(lambda f: self._store(key, generation, f))
+        return await self._waiter(future)
+
+    def clear(self):
+        """Invalidate every entry, including results still being computed"""
+        with self._lock:
+            self._entries.clear()
+            self._inflight.clear()
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "in_flight": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,214 @@
+"""Prometheus-style counters, gauges and latency histograms
+
+Hand-rolled instead of depending on prometheus_client: each metric is a dict
+of label tuple -> value guarded by one lock, so recording a sample costs a
+dict lookup and an add. render() produces the text exposition format served
+by GET /metrics.
+"""
+from bisect import bisect_left
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; tuned for sub-millisecond phases up to multi-second batches
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label tuple -> [per-bucket counts (+Inf last), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][slot] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def count(self, *labels):
+        entry = self._values.get(labels)
+        return entry[2] if entry else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, (list(counts), total, n)) for labels, (counts, total, n) in self._values.items())
+        for labels, (counts, total, n) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = format_labels(self.labels, labels, f'le="{format_value(float(bound))}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labels, labels)} {format_value(total)}"
+            yield f"{self.name}_count{format_labels(self.labels, labels)} {n}"
+
+
+class Timer:
+    """Context manager observing the elapsed wall time into a histogram"""
+
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUESTS = metrics.counter(
+    "disease_http_requests_total", "HTTP requests by route template, method and status",
+    ("endpoint", "method", "status"))
+HTTP_LATENCY = metrics.histogram(
+    "disease_http_request_duration_seconds", "End-to-end request latency by route template",
+    ("endpoint", "method"))
+PREDICTIONS = metrics.counter(
+    "disease_predictions_total", "Rows scored by model and mode (single, batch, stream, panel, patient, compact)",
+    ("model", "mode"))
+PREDICTION_ERRORS = metrics.counter(
+    "disease_prediction_errors_total", "Failed predictions by model and error kind",
+    ("model", "kind"))
+PHASE_LATENCY = metrics.histogram(
+    "disease_prediction_phase_seconds",
+    "Per-call latency of each prediction phase (parse, resolve, inference, serialize)",
+    ("model", "phase"))
+FALLBACKS = metrics.counter(
+    "disease_fallback_predictions_total", "Rule-based fallback predictions by model and reason",
+    ("model", "reason"))
+MODEL_LOAD_SECONDS = metrics.gauge(
+    "disease_model_load_seconds", "Time spent loading and compiling each model on the last reload",
+    ("model",))
+MODEL_RELOADS = metrics.counter(
+    "disease_model_reloads_total", "Model reload attempts by outcome",
+    ("outcome",))
+MODEL_RELOAD_LATENCY = metrics.histogram(
+    "disease_model_reload_seconds", "Wall time of full model reloads (load, compile, validate)",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware recording request counts and latency per route
+
+    Labels use the matched route template (e.g. /predict/kidney/batch) so
+    cardinality stays bounded; unmatched paths are grouped as "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            method = scope.get("method", "")
+            HTTP_LATENCY.observe(time.perf_counter() - start, endpoint, method)
+            HTTP_REQUESTS.inc(endpoint, method, str(status[0]))
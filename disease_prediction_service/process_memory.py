@@ -0,0 +1,80 @@
+"""Unique vs. shared memory of serving processes (Linux /proc)
+
+For prefork serving (serve.py) the interesting numbers are per process:
+
+- uss: private pages (Private_Clean + Private_Dirty), what the process
+  alone costs and what would be freed by stopping it;
+- shared: pages also mapped by another process, e.g. model arrays inherited
+  copy-on-write from the parent;
+- pss: proportional share, unique pages plus shared pages divided by the
+  number of sharers; summing pss over all processes gives the real total.
+
+Values come from /proc/<pid>/smaps_rollup (Linux 4.14+) and are reported in
+MB. On other platforms memory_usage() returns None.
+"""
+from typing import List, Optional
+import os
+
+ROLLUP_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+
+
+def smaps_rollup(pid="self") -> Optional[dict]:
+    """{field: kB} from /proc/<pid>/smaps_rollup, or None if unavailable"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    fields = {}
+    for line in lines[1:]:
+        key, _, rest = line.partition(":")
+        if key in ROLLUP_FIELDS:
+            fields[key] = int(rest.split()[0])
+    return fields
+
+
+def memory_usage(pid="self") -> Optional[dict]:
+    fields = smaps_rollup(pid)
+    if fields is None:
+        return None
+    mb = lambda kb: round(kb / 1024, 1)
+    return {
+        "pid": os.getpid() if pid == "self" else int(pid),
+        "rss_mb": mb(fields.get("Rss", 0)),
+        "pss_mb": mb(fields.get("Pss", 0)),
+        "uss_mb": mb(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)),
+        "shared_mb": mb(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)),
+        "swap_mb": mb(fields.get("Swap", 0)),
+    }
+
+
+def child_pids(parent: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces; fields resume after its ")"
+        if int(stat.rsplit(")", 1)[1].split()[1]) == parent:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def group_usage(parent: int) -> Optional[dict]:
+    """Usage of a prefork parent and each of its workers, plus totals"""
+    parent_usage = memory_usage(parent)
+    if parent_usage is None:
+        return None
+    workers = [usage for usage in (memory_usage(pid) for pid in child_pids(parent)) if usage is not None]
+    processes = [parent_usage] + workers
+    return {
+        "parent": parent_usage,
+        "workers": workers,
+        "total_rss_mb": round(sum(p["rss_mb"] for p in processes), 1),
+        "total_pss_mb": round(sum(p["pss_mb"] for p in processes), 1),
+        "total_uss_mb": round(sum(p["uss_mb"] for p in processes), 1),
+    }
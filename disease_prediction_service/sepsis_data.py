@@ -0,0 +1,129 @@
+"""Chunked, float32 ingestion of the sepsis training CSV
+
+The ICU export is far larger than the other datasets, so it is never held as
+a float64 DataFrame. Two streaming passes over the CSV read only the feature
+and label columns as float32, in chunks of CHUNK_ROWS rows:
+
+1. count the labelled rows and accumulate per-feature sums and counts
+   (in float64) to get the fill means;
+2. write each chunk, with NaNs replaced by those means, straight into a
+   preallocated float32 matrix.
+
+The matrix, labels and means are cached as .npy/.json files under
+data/cache/ and reused (memory-mapped) while the CSV is unchanged, so
+repeated training runs skip CSV parsing entirely.
+"""
+from typing import Dict, List, Tuple
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = int(os.getenv("SEPSIS_CHUNK_ROWS", "200000"))
+LABEL = "SepsisLabel"
+# Identifiers and bookkeeping columns that are not model features
+DROP_COLUMNS = ["Unnamed: 0", "Patient_ID", "Unit1", "Unit2", "HospAdmTime", "ICULOS", "Hour"]
+CACHE_FORMAT = 1
+
+
+def cache_paths(data_dir: str) -> Dict[str, str]:
+    cache_dir = os.path.join(data_dir, "cache")
+    return {
+        "X": os.path.join(cache_dir, "sepsis_X.npy"),
+        "y": os.path.join(cache_dir, "sepsis_y.npy"),
+        "meta": os.path.join(cache_dir, "sepsis_meta.json"),
+    }
+
+
+def source_stamp(csv_path: str) -> dict:
+    stat = os.stat(csv_path)
+    return {"format": CACHE_FORMAT, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def feature_columns(csv_path: str) -> List[str]:
+    header = pd.read_csv(csv_path, nrows=0).columns
+    return [c for c in header if c not in DROP_COLUMNS and c != LABEL]
+
+
+def read_chunks(csv_path: str, features: List[str], chunk_rows: int):
+    """Yield (features float32 matrix, labels) for the labelled rows of each chunk"""
+    reader = pd.read_csv(
+        csv_path,
+        usecols=features + [LABEL],
+        dtype={column: np.float32 for column in features + [LABEL]},
+        chunksize=chunk_rows,
+    )
+    for chunk in reader:
+        labels = chunk[LABEL].to_numpy()
+        labelled = ~np.isnan(labels)
+        values = chunk[features].to_numpy(dtype=np.float32)
+        if not labelled.all():
+            values = values[labelled]
+            labels = labels[labelled]
+        yield values, labels
+
+
+def parse_csv(csv_path: str, chunk_rows: int = CHUNK_ROWS) -> Tuple[np.ndarray, np.ndarray, List[str], Dict[str, float]]:
+    features = feature_columns(csv_path)
+
+    n_rows = 0
+    sums = np.zeros(len(features), dtype=np.float64)
+    counts = np.zeros(len(features), dtype=np.int64)
+    for values, _ in read_chunks(csv_path, features, chunk_rows):
+        n_rows += len(values)
+        present = ~np.isnan(values)
+        sums += np.where(present, values, 0.0).sum(axis=0, dtype=np.float64)
+        counts += present.sum(axis=0)
+    # A column that is empty everywhere stays NaN, as with DataFrame.mean()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+
+    X = np.empty((n_rows, len(features)), dtype=np.float32)
+    y = np.empty(n_rows, dtype=np.int8)
+    fill = means.astype(np.float32)
+    offset = 0
+    for values, labels in read_chunks(csv_path, features, chunk_rows):
+        block = X[offset:offset + len(values)]
+        block[...] = values
+        np.copyto(block, np.broadcast_to(fill, block.shape), where=np.isnan(block))
+        y[offset:offset + len(values)] = labels
+        offset += len(values)
+
+    return X, y, features, {f: float(m) for f, m in zip(features, means)}
+
+
+def load_sepsis_matrix(data_dir: str, chunk_rows: int = CHUNK_ROWS, use_cache: bool = True):
+    """Return (X float32, y, feature names, fill means), parsing the CSV only on a cache miss
+
+    X and y come back memory-mapped read-only when served from the cache.
+    """
+    csv_path = os.path.join(data_dir, "sepsis.csv")
+    paths = cache_paths(data_dir)
+    stamp = source_stamp(csv_path)
+
+    if use_cache and all(os.path.exists(p) for p in paths.values()):
+        with open(paths["meta"]) as f:
+            meta = json.load(f)
+        if meta.get("source") == stamp:
+            X = np.load(paths["X"], mmap_mode="r")
+            y = np.load(paths["y"], mmap_mode="r")
+            return X, y, meta["features"], meta["means"]
+
+    X, y, features, means = parse_csv(csv_path, chunk_rows)
+    if use_cache:
+        write_cache(paths, X, y, {"source": stamp, "features": features, "means": means})
+    return X, y, features, means
+
+
+def write_cache(paths: Dict[str, str], X: np.ndarray, y: np.ndarray, meta: dict):
+    os.makedirs(os.path.dirname(paths["X"]), exist_ok=True)
+    # Arrays first, metadata last: a cache without matching metadata is ignored
+    for key, array in (("X", X), ("y", y)):
+        tmp_path = f"{paths[key]}.tmp-{os.getpid()}.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, paths[key])
+    tmp_path = f"{paths['meta']}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, paths["meta"])
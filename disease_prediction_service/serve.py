@@ -0,0 +1,259 @@
+"""Prefork multi-worker server for the disease prediction service
+
+`uvicorn main:app --workers N` starts N interpreters that each import main
+and joblib.load every model, so memory and cold-start time grow with N.
+Here the parent imports main once, loads and warms every model, freezes
+the garbage collector and binds the listening socket; then it forks the
+workers. Each worker serves the shared socket with uvicorn and inherits the
+model arrays copy-on-write. Those pages are only ever read, so they stay
+shared and the per-worker cost is mostly interpreter and request state.
+
+gc.freeze() moves every object that exists at fork time into a permanent
+generation. Workers' collections then never touch those objects' headers,
+which would otherwise dirty (and copy) the pages they live on.
+
+Model hot reload runs in the parent. SIGHUP reloads and warms the new
+artifacts, then replaces the workers one at a time; SIGUSR2 does the same
+after rolling back to the previous version. POST /admin/models/reload and
+/admin/models/rollback, answered by any worker, send these signals to the
+parent rather than changing that worker alone. Workers do not watch
+the models directory themselves (MODEL_WATCH_INTERVAL defaults to 0 here),
+because a reload inside a worker would give it a private copy of every
+model. Crashed workers are restarted. SIGTERM or SIGINT stops all workers
+gracefully.
+
+Per-process state is not shared between workers: each has its own
+prediction caches (only a lower hit rate) and its own sepsis patient
+store. Consecutive observations of one patient would land on different
+workers and be scored against partial histories, so with more than one
+worker the /predict/sepsis/patients routes answer 501; serve them from a
+single worker (--workers 1, which still loses patient state whenever the
+worker is replaced) or a plain uvicorn process.
+
+GET /admin/memory, answered by any worker, reports unique (USS), shared and
+proportional (PSS) memory of the parent and every worker; see
+process_memory.py. --report-interval also prints it periodically.
+
+Usage: python serve.py [--workers N] [--host 0.0.0.0] [--port 8000] [--report-interval 60]
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+# Set before main is imported: its registry reads this at import time
+os.environ.setdefault("MODEL_WATCH_INTERVAL", "0")
+
+import numpy as np
+
+from process_memory import group_usage
+
+# Rows per warm-up call, so both the single-row and batch paths run once
+WARMUP_ROWS = (1, 64)
+
+
+def warm_models(registry):
+    """Run every model once so lazily built state exists before the fork"""
+    for name, compiled in registry.current.models.items():
+        for rows in WARMUP_ROWS:
+            compiled.predict(np.tile(compiled.defaults, (rows, 1)))
+
+
+def prepare_parent(registry):
+    warm_models(registry)
+    gc.collect()
+    gc.freeze()
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def spawn_worker(app, sock: socket.socket, log_level: str) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    # Worker: restore default signal handling, uvicorn installs its own
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGUSR1, signal.SIGUSR2):
+        signal.signal(sig, signal.SIG_DFL)
+    import uvicorn
+
+    status = 0
+    try:
+        config = uvicorn.Config(app, log_level=log_level, access_log=False, lifespan="on")
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException as e:
+        print(f"Worker {os.getpid()} failed: {str(e)}")
+        status = 1
+    finally:
+        sys.stdout.flush()
+        os._exit(status)
+
+
+def print_memory(parent: int):
+    usage = group_usage(parent)
+    if usage is None:
+        print("Memory report unavailable (needs /proc/<pid>/smaps_rollup)")
+        return
+    for role, p in [("parent", usage["parent"])] + [("worker", w) for w in usage["workers"]]:
+        print(f"{role:<6} {p['pid']:>7} | rss {p['rss_mb']:8.1f} MB | uss {p['uss_mb']:8.1f} MB | "
+              f"shared {p['shared_mb']:8.1f} MB | pss {p['pss_mb']:8.1f} MB")
+    print(f"total  rss {usage['total_rss_mb']:.1f} MB | uss {usage['total_uss_mb']:.1f} MB | "
+          f"pss {usage['total_pss_mb']:.1f} MB (actual footprint)")
+    sys.stdout.flush()
+
+
+class Supervisor:
+    def __init__(self, app, registry, sock, workers: int, log_level: str, report_interval: float):
+        self.app = app
+        self.registry = registry
+        self.sock = sock
+        self.n_workers = workers
+        self.log_level = log_level
+        self.report_interval = report_interval
+        self.workers = set()
+        self.stopping = False
+        self.reload_requested = False
+        self.rollback_requested = False
+        self.report_requested = False
+
+    def on_stop(self, signum, frame):
+        self.stopping = True
+
+    def on_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def on_rollback(self, signum, frame):
+        self.rollback_requested = True
+
+    def on_report(self, signum, frame):
+        self.report_requested = True
+
+    def spawn(self) -> int:
+        pid = spawn_worker(self.app, self.sock, self.log_level)
+        self.workers.add(pid)
+        return pid
+
+    def stop_worker(self, pid: int, timeout: float = 30.0):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                break
+            time.sleep(0.05)
+        else:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.discard(pid)
+
+    def reap(self):
+        """Collect exited workers; returns how many died unexpectedly"""
+        died = 0
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            if pid in self.workers:
+                self.workers.discard(pid)
+                died += 1
+                print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}")
+        return died
+
+    def reload(self):
+        """Reload models in the parent, then replace the workers one by one"""
+        try:
+            self.registry.reload()
+        except Exception as e:
+            print(f"Model reload rejected, keeping version {self.registry.current.version}: {str(e)}")
+            return
+        print(f"Reloaded models version {self.registry.current.version}, restarting workers")
+        self.roll_workers()
+
+    def rollback(self):
+        """Roll back to the previous models in the parent, then replace the workers"""
+        try:
+            self.registry.rollback()
+        except LookupError as e:
+            print(f"Model rollback rejected: {str(e)}")
+            return
+        print(f"Rolled back to models version {self.registry.current.version}, restarting workers")
+        self.roll_workers()
+
+    def roll_workers(self):
+        gc.unfreeze()
+        prepare_parent(self.registry)
+        for pid in list(self.workers):
+            self.spawn()
+            self.stop_worker(pid)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.on_stop)
+        signal.signal(signal.SIGINT, self.on_stop)
+        signal.signal(signal.SIGHUP, self.on_reload)
+        signal.signal(signal.SIGUSR1, self.on_report)
+        signal.signal(signal.SIGUSR2, self.on_rollback)
+
+        for _ in range(self.n_workers):
+            self.spawn()
+        print(f"Serving {len(self.workers)} workers from parent {os.getpid()}")
+        sys.stdout.flush()
+
+        next_report = time.monotonic() + self.report_interval
+        while not self.stopping:
+            time.sleep(0.2)
+            for _ in range(self.reap()):
+                if not self.stopping:
+                    self.spawn()
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            if self.rollback_requested:
+                self.rollback_requested = False
+                self.rollback()
+            if self.report_interval > 0 and time.monotonic() >= next_report:
+                self.report_requested = True
+                next_report = time.monotonic() + self.report_interval
+            if self.report_requested:
+                self.report_requested = False
+                print_memory(os.getpid())
+
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prefork server with models shared between workers")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--host", default=os.getenv("SERVE_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVE_PORT", "8000")))
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="warning")
+    parser.add_argument("--report-interval", type=float, default=0,
+                        help="print per-process memory every N seconds (0: only on SIGUSR1)")
+    args = parser.parse_args(argv)
+
+    # Workers find the parent through this to report the whole group's memory and
+    # forward model reloads; the worker count decides whether patient state is usable
+    os.environ["DISEASE_SERVE_PARENT_PID"] = str(os.getpid())
+    os.environ["DISEASE_SERVE_WORKERS"] = str(max(1, args.workers))
+    import main as service
+
+    prepare_parent(service.registry)
+    sock = bind_socket(args.host, args.port, args.backlog)
+    print(f"Listening on {args.host}:{args.port}, models version {service.registry.current.version}")
+    Supervisor(service.app, service.registry, sock, max(1, args.workers), args.log_level, args.report_interval).run()
+
+
+if __name__ == "__main__":
+    main()
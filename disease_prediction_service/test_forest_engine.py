@@ -0,0 +1,40 @@
+"""CompiledForest must match sklearn bit for bit on every stored disease model
+
+Uses the artifacts in DISEASE_MODELS_DIR (default models/); a model whose
+artifacts are missing, that is not a random forest or that is stored as a
+compressed forest is skipped. Run with: python -m pytest test_forest_engine.py
+"""
+import numpy as np
+import pytest
+
+from check_forest_engine import sample_rows
+from disease_models import SPECS, load_model
+from forest_engine import CompiledForest
+
+
+@pytest.fixture(params=SPECS, ids=lambda spec: spec.name)
+def compiled(request):
+    spec = request.param
+    compiled = load_model(spec)
+    if compiled is None:
+        pytest.skip(f"{spec.name}: model not found")
+    if compiled.forest is None:
+        pytest.skip(f"{spec.name}: not a random forest")
+    if isinstance(compiled.model, CompiledForest):
+        pytest.skip(f"{spec.name}: compressed artifact")
+    return compiled
+
+
+def test_matches_sklearn(compiled):
+    X = sample_rows(compiled.spec.name, compiled.features)
+    classes, proba = compiled.forest.predict(X)
+    assert np.array_equal(proba, compiled.model.predict_proba(X))
+    assert np.array_equal(classes, compiled.model.predict(X))
+
+
+def test_single_row_matches_sklearn(compiled):
+    X = sample_rows(compiled.spec.name, compiled.features, n_random=50)
+    for row in X[-50:]:
+        classes, proba = compiled.forest.predict(row.reshape(1, -1))
+        assert np.array_equal(proba, compiled.model.predict_proba(row.reshape(1, -1)))
+        assert classes[0] == compiled.model.predict(row.reshape(1, -1))[0]
@@ -0,0 +1,113 @@
+"""Rolling aggregates, ordering, retries and eviction of PatientStore"""
+import time
+
+import numpy as np
+import pytest
+
+from patient_store import PatientStore, OutOfOrderObservation
+
+
+def test_rolling_aggregates_match_a_recomputed_window():
+    store = PatientStore(window=4)
+    values = np.random.default_rng(0).normal(80, 15, 50)
+    for hour, value in enumerate(values):
+        trend = store.observe("p", {"HR": value}, hour=hour)["trends"]["HR"]
+        window = values[max(0, hour - 3):hour + 1]
+        assert trend["last"] == value
+        assert trend["mean"] == pytest.approx(window.mean())
+        assert trend["min"] == window.min()
+        assert trend["max"] == window.max()
+        assert trend["count"] == len(window)
+        assert trend["delta"] == (None if hour == 0 else value - values[hour - 1])
+
+
+def test_values_are_carried_forward_and_hours_advance():
+    store = PatientStore()
+    store.observe("p", {"HR": 80, "O2Sat": 95}, hour=1, gender="Female", age=60)
+    state = store.observe("p", {"HR": 90}, age=61)
+    assert state["hour"] == 2
+    assert state["observations"] == 2
+    assert (state["gender"], state["age"]) == ("Female", 61)
+    assert state["trends"]["O2Sat"]["last"] == 95
+    assert state["trends"]["HR"]["last"] == 90
+
+
+def test_older_observation_is_rejected():
+    store = PatientStore()
+    store.observe("p", {"HR": 80}, hour=5)
+    with pytest.raises(OutOfOrderObservation):
+        store.observe("p", {"HR": 85}, hour=4)
+    assert store.get("p")["observations"] == 1
+
+
+def test_exact_repeat_of_the_current_hour_is_a_retry():
+    store = PatientStore()
+    store.observe("p", {"HR": 80, "O2Sat": 95}, hour=1)
+    state = store.observe("p", {"HR": 80.0, "O2Sat": 95}, hour=1)
+    assert state["observations"] == 1
+    assert state["trends"]["HR"]["count"] == 1
+
+
+@pytest.mark.parametrize("values", [{"HR": 90, "O2Sat": 95}, {"HR": 80}, {"HR": 80, "O2Sat": 95, "Temp": 37.0}])
+def test_different_values_for_the_current_hour_are_rejected(values):
+    store = PatientStore()
+    store.observe("p", {"HR": 80, "O2Sat": 95}, hour=1)
+    with pytest.raises(OutOfOrderObservation):
+        store.observe("p", values, hour=1)
+    assert store.get("p")["trends"]["HR"]["last"] == 80
+
+
+def test_prepared_observation_is_stored_only_on_commit():
+    store = PatientStore()
+    store.observe("p", {"HR": 80}, hour=1)
+    pending = store.prepare("p", {"HR": 100}, hour=2)
+    assert pending.summary()["trends"]["HR"]["last"] == 100
+    assert store.get("p")["observations"] == 1
+    # A failed request never commits; its retry is applied exactly once
+    retry = store.prepare("p", {"HR": 100}, hour=2)
+    store.commit(retry)
+    assert store.commit(store.prepare("p", {"HR": 100}, hour=2))["observations"] == 2
+
+
+def test_commit_applies_on_top_of_a_concurrent_update():
+    store = PatientStore()
+    store.observe("p", {"HR": 80}, hour=1)
+    first = store.prepare("p", {"HR": 90}, hour=2)
+    second = store.prepare("p", {"O2Sat": 97}, hour=3)
+    store.commit(first)
+    state = store.commit(second)
+    assert state["observations"] == 3
+    assert state["trends"]["HR"]["last"] == 90
+    assert state["trends"]["O2Sat"]["last"] == 97
+
+
+def test_commit_rejects_a_conflicting_concurrent_update():
+    store = PatientStore()
+    first = store.prepare("p", {"HR": 90}, hour=2)
+    second = store.prepare("p", {"HR": 91}, hour=2)
+    store.commit(first)
+    with pytest.raises(OutOfOrderObservation):
+        store.commit(second)
+    assert store.get("p")["trends"]["HR"]["last"] == 90
+
+
+def test_least_recently_updated_patient_is_evicted():
+    store = PatientStore(max_patients=2)
+    for patient in ("a", "b"):
+        store.observe(patient, {"HR": 80}, hour=1)
+    store.observe("a", {"HR": 81}, hour=2)
+    store.observe("c", {"HR": 80}, hour=1)
+    assert store.get("b") is None
+    assert store.get("a") is not None
+    assert store.stats()["evictions"] == 1
+
+
+def test_idle_patients_expire_and_discharge_drops_state():
+    store = PatientStore(idle_ttl=0.05)
+    store.observe("a", {"HR": 80}, hour=1)
+    time.sleep(0.06)
+    store.observe("b", {"HR": 80}, hour=1)
+    assert store.get("a") is None
+    assert store.stats()["expirations"] == 1
+    assert store.discharge("b")
+    assert not store.discharge("b")
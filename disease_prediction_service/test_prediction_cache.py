@@ -0,0 +1,157 @@
+"""Single-flight, cancellation and eviction behavior of PredictionCache"""
+from concurrent.futures import Future
+import asyncio
+import threading
+import time
+
+import pytest
+
+from prediction_cache import PredictionCache
+
+
+class Submitter:
+    """submit() for get_or_compute: counts calls and hands out futures that stay
+    pending, like a request queued behind a busy pool, until finish(); after
+    that, new calls return finished futures"""
+
+    def __init__(self, value=42):
+        self.value = value
+        self.calls = 0
+        self.futures = []
+        self.finished = False
+
+    def __call__(self):
+        self.calls += 1
+        future = Future()
+        self.futures.append(future)
+        if self.finished:
+            self.settle(future)
+        return future
+
+    def settle(self, future):
+        if not future.set_running_or_notify_cancel():
+            return
+        if isinstance(self.value, Exception):
+            future.set_exception(self.value)
+        else:
+            future.set_result(self.value)
+
+    def finish(self):
+        self.finished = True
+        # From another thread, as an executor would
+        thread = threading.Thread(target=lambda: [self.settle(future) for future in self.futures])
+        thread.start()
+        thread.join()
+
+
+def test_hit_after_miss():
+    cache = PredictionCache()
+    submit = Submitter()
+    submit.finish()
+
+    async def run():
+        return [await cache.get_or_compute("k", submit) for _ in range(3)]
+
+    assert asyncio.run(run()) == [42, 42, 42]
+    assert submit.calls == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"]) == (1, 2)
+
+
+def test_concurrent_requests_share_one_computation():
+    cache = PredictionCache()
+    submit = Submitter()
+
+    async def run():
+        tasks = [asyncio.create_task(cache.get_or_compute("k", submit)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        submit.finish()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(run()) == [42] * 5
+    assert submit.calls == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_cancelled_waiter_does_not_cancel_computation():
+    cache = PredictionCache()
+    submit = Submitter()
+
+    async def run():
+        first = asyncio.create_task(cache.get_or_compute("k", submit))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(cache.get_or_compute("k", submit))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        await asyncio.sleep(0.05)
+        submit.finish()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, await cache.get_or_compute("k", submit)
+
+    assert asyncio.run(run()) == (42, 42)
+    assert submit.calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    cache = PredictionCache()
+    submit = Submitter(ValueError("boom"))
+
+    async def run():
+        tasks = [asyncio.create_task(cache.get_or_compute("k", submit)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        submit.finish()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    outcomes = asyncio.run(run())
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["in_flight"] == 0
+
+
+def test_clear_drops_results_still_being_computed():
+    cache = PredictionCache()
+    submit = Submitter()
+
+    async def run():
+        task = asyncio.create_task(cache.get_or_compute("k", submit))
+        await asyncio.sleep(0.05)
+        cache.clear()
+        submit.finish()
+        return await task
+
+    assert asyncio.run(run()) == 42
+    assert cache.stats()["entries"] == 0
+
+
+def test_ttl_and_lru_eviction():
+    cache = PredictionCache(max_entries=2, ttl=0.05)
+
+    def submit(value):
+        future = Future()
+        future.set_result(value)
+        return lambda: future
+
+    async def run():
+        for key in ("a", "b", "c"):
+            await cache.get_or_compute(key, submit(key))
+        assert cache.stats()["evictions"] == 1
+        assert await cache.get_or_compute("a", submit("a2")) == "a2"
+        time.sleep(0.06)
+        assert await cache.get_or_compute("a", submit("a3")) == "a3"
+
+    asyncio.run(run())
+    assert cache.stats()["expirations"] == 1
+
+
+def test_disabled_cache_always_computes():
+    cache = PredictionCache(max_entries=0)
+    submit = Submitter()
+    submit.finish()
+
+    async def run():
+        return [await cache.get_or_compute("k", submit) for _ in range(2)]
+
+    assert asyncio.run(run()) == [42, 42]
+    assert submit.calls == 2
@@ -0,0 +1,353 @@
+"""Train the disease risk models in parallel
+
+Each model has a prepare function that loads and cleans its CSV from
+data/ and returns the feature frame, the target and any extra artifacts
+(label encoders, feature means). train_model() fits one random forest on an
+80/20 split and writes the artifact set named by its DiseaseModelSpec.
+
+The orchestrator runs every requested model in its own worker process
+(one task per process, so peak RSS is per model), and divides the CPU cores
+between them in proportion to their dataset sizes. A full retrain takes
+about as long as the slowest model.
+
+Artifacts are written to temporary files and moved into place with
+os.replace, so the service never loads a half-written pickle. The model
+registry's debounce covers the short window between the files of one set.
+
+With --compress the fitted forest is also compressed (forest_compression.py)
+and written as <model>.npz, which the service then prefers; the held-out
+split measures its fidelity, and a stale .npz is removed when compression
+is off or falls below the fidelity floor.
+
+Usage: python training.py [anemia kidney liver sepsis cardio] [--workers N] [--cpus N] [--report report.json]
+       python training.py anemia --tune --max-latency-us 150 --max-size-kb 100
+       python training.py sepsis --compress --tree-agreement 0.995 --min-agreement 0.99
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+import argparse
+import json
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from disease_models import BASE_DIR, MODELS_DIR, SPECS, SPECS_BY_NAME
+from forest_compression import (CompressionOptions, FidelityError, add_arguments, compress, options_from_args,
+                                print_compression, save_compact)
+from sepsis_data import load_sepsis_matrix
+from tuning import Budget, print_tuning, tune
+
+DATA_DIR = os.path.join(BASE_DIR, "data")
+N_ESTIMATORS = 100
+RANDOM_STATE = 42
+TEST_SIZE = 0.2
+
+
+def prepare_anemia(data_dir):
+    df = pd.read_csv(os.path.join(data_dir, "anemia.csv"))
+    # Features: Gender, Hemoglobin, MCH, MCHC, MCV; Result 0: No Anemia, 1: Anemia
+    return df.drop("Result", axis=1), df["Result"], {}
+
+
+def prepare_kidney(data_dir):
+    from sklearn.preprocessing import LabelEncoder
+
+    df = pd.read_csv(os.path.join(data_dir, "kidney_disease.csv"))
+    df = df.drop("id", axis=1)
+
+    # PCV, WC, RC sometimes have tabs/newlines
+    for col in ["pcv", "wc", "rc"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    numeric_cols = df.select_dtypes(include=[np.number]).columns
+    df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].mean())
+
+    # Fill missing categorical values with the mode and encode
+    label_encoders = {}
+    for col in ["rbc", "pc", "pcc", "ba", "htn", "dm", "cad", "appet", "pe", "ane"]:
+        df[col] = df[col].astype(str).str.strip()
+        df[col] = df[col].replace("nan", df[col].mode()[0])
+        le = LabelEncoder()
+        df[col] = le.fit_transform(df[col])
+        label_encoders[col] = le
+
+    # Labels like 'ckd\t' count as ckd; ckd=0, notckd=1
+    df["classification"] = df["classification"].astype(str).str.strip()
+    df["classification"] = df["classification"].apply(lambda x: "ckd" if "ckd" in x else "notckd")
+    le_target = LabelEncoder()
+    df["classification"] = le_target.fit_transform(df["classification"])
+    label_encoders["classification"] = le_target
+
+    return df.drop("classification", axis=1), df["classification"], {"encoders": label_encoders}
+
+
+def prepare_liver(data_dir):
+    from sklearn.preprocessing import LabelEncoder
+
+    df = pd.read_csv(os.path.join(data_dir, "liver.csv"))
+    df["Albumin_and_Globulin_Ratio"] = df["Albumin_and_Globulin_Ratio"].fillna(df["Albumin_and_Globulin_Ratio"].mean())
+
+    # Female=0, Male=1 (alphabetical)
+    le_gender = LabelEncoder()
+    df["Gender"] = le_gender.fit_transform(df["Gender"])
+
+    # Dataset is 1 for a liver patient, 2 otherwise; train on 1/0
+    df["Dataset"] = df["Dataset"].map({1: 1, 2: 0})
+    return df.drop("Dataset", axis=1), df["Dataset"], {"encoders": {"Gender": le_gender}}
+
+
+def prepare_sepsis(data_dir):
+    # Chunked float32 ingestion; the means fill missing features here and at prediction time
+    X, y, features, means = load_sepsis_matrix(data_dir)
+    return X, y, {"features": features, "means": means}
+
+
+def prepare_cardio(data_dir):
+    df = pd.read_csv(os.path.join(data_dir, "cardiovascular.csv"))
+    numeric_cols = df.select_dtypes(include=[np.number]).columns
+    df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].mean())
+    df = df.fillna(0)
+
+    target_col = next((col for col in df.columns if col.lower() == "tenyearchd"), "TenYearCHD")
+    return df.drop(target_col, axis=1), df[target_col], {}
+
+
+# name -> (dataset file, prepare function)
+RECIPES: Dict[str, tuple] = {
+    "anemia": ("anemia.csv", prepare_anemia),
+    "kidney": ("kidney_disease.csv", prepare_kidney),
+    "liver": ("liver.csv", prepare_liver),
+    "sepsis": ("sepsis.csv", prepare_sepsis),
+    "cardio": ("cardiovascular.csv", prepare_cardio),
+}
+
+
+def take_rows(data, index):
+    return data.iloc[index] if hasattr(data, "iloc") else data[index]
+
+
+def atomic_dump(obj, path: str):
+    """joblib.dump to a temporary file next to path, then rename over it"""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        joblib.dump(obj, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_artifacts(spec, models_dir: str, model, features: List[str], extras: dict) -> List[str]:
+    """Write every file of one artifact set, model last; return their paths"""
+    os.makedirs(models_dir, exist_ok=True)
+    written = []
+    if spec.encoders_file and "encoders" in extras:
+        written.append((extras["encoders"], os.path.join(models_dir, spec.encoders_file)))
+    if spec.means_file and "means" in extras:
+        written.append((extras["means"], os.path.join(models_dir, spec.means_file)))
+    written.append((features, os.path.join(models_dir, spec.features_file)))
+    written.append((model, os.path.join(models_dir, spec.model_file)))
+    for obj, path in written:
+        atomic_dump(obj, path)
+    return [path for _, path in written]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process, or None where unavailable (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def train_model(name: str, n_jobs: int = 1, data_dir: str = DATA_DIR, models_dir: str = MODELS_DIR,
+                tuning: Optional[dict] = None, compression: Optional[CompressionOptions] = None) -> dict:
+    """Fit and save one disease model; returns its report entry
+
+    tuning ({"budget": Budget, "grid": ..., "folds": ...}) first searches
+    hyperparameters on the training split and fits the selected ones.
+    compression also writes a compressed artifact that passes its fidelity floor.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+
+    spec = SPECS_BY_NAME[name]
+    dataset, prepare = RECIPES[name]
+    start = time.perf_counter()
+    if not os.path.exists(os.path.join(data_dir, dataset)):
+        raise FileNotFoundError(f"Dataset not found at {os.path.join(data_dir, dataset)}")
+
+    # X is a DataFrame, or a float32 matrix with its column names in extras
+    X, y, extras = prepare(data_dir)
+    features = extras.pop("features", None) or X.columns.tolist()
+
+    # Splitting row indices gives the same split as splitting X itself,
+    # without an extra copy of the full matrix
+    train_index, test_index = train_test_split(np.arange(len(X)), test_size=TEST_SIZE, random_state=RANDOM_STATE)
+    X_train, y_train = take_rows(X, train_index), take_rows(y, train_index)
+
+    params = {"n_estimators": N_ESTIMATORS}
+    search = None
+    if tuning is not None:
+        search = tune(X_train, y_train, n_jobs=n_jobs, random_state=RANDOM_STATE, **tuning)
+        if search["selected"] is not None:
+            params = search["selected"]["params"]
+
+    model = RandomForestClassifier(random_state=RANDOM_STATE, n_jobs=n_jobs, **params)
+    model.fit(X_train, y_train)
+    X_test = take_rows(X, test_index)
+    accuracy = model.score(X_test, take_rows(y, test_index))
+
+    paths = write_artifacts(spec, models_dir, model, features, extras)
+    compact_path = os.path.join(models_dir, spec.compact_file)
+    compressed = None
+    if compression is not None:
+        try:
+            forest, compressed = compress(model, X_train, X_test, compression)
+            compressed["artifact_bytes"] = save_compact(forest, compact_path)
+        except FidelityError as e:
+            compressed = {"error": str(e)}
+    if (compressed is None or "error" in compressed) and os.path.exists(compact_path):
+        # An older compressed artifact no longer matches the new model
+        os.remove(compact_path)
+    peak = peak_rss_mb()
+    report = {
+        "model": name,
+        "n_jobs": n_jobs,
+        "params": params,
+        "rows": int(len(X)),
+        "features": int(X.shape[1]),
+        "accuracy": round(float(accuracy), 4),
+        "wall_seconds": round(time.perf_counter() - start, 3),
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+        "artifact_bytes": sum(os.path.getsize(p) for p in paths),
+    }
+    if search is not None:
+        report["tuning"] = search
+    if compressed is not None:
+        report["compression"] = compressed
+    return report
+
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def allocate_cores(names: List[str], cpus: int, data_dir: str = DATA_DIR) -> Dict[str, int]:
+    """Split cpus between models in proportion to their dataset sizes (at least one each)"""
+    sizes = {}
+    for name in names:
+        path = os.path.join(data_dir, RECIPES[name][0])
+        sizes[name] = os.path.getsize(path) if os.path.exists(path) else 1
+    cores = {name: 1 for name in names}
+    spare = cpus - len(names)
+    if spare > 0:
+        total = sum(sizes.values())
+        shares = {name: spare * sizes[name] / total for name in names}
+        for name in names:
+            cores[name] += int(shares[name])
+        # Hand out the cores lost to rounding, largest remainder first
+        leftover = spare - sum(int(s) for s in shares.values())
+        for name in sorted(names, key=lambda n: shares[n] - int(shares[n]), reverse=True)[:leftover]:
+            cores[name] += 1
+    return cores
+
+
+def train_models(names: Optional[List[str]] = None, workers: Optional[int] = None, cpus: Optional[int] = None,
+                 data_dir: str = DATA_DIR, models_dir: str = MODELS_DIR,
+                 on_result: Optional[Callable[[dict], None]] = None, tuning: Optional[dict] = None,
+                 compression: Optional[CompressionOptions] = None) -> List[dict]:
+    """Train the named models concurrently, one worker process per model"""
+    names = names or [spec.name for spec in SPECS]
+    cpus = cpus or available_cpus()
+    workers = min(workers or cpus, len(names))
+    cores = allocate_cores(names, max(cpus, workers), data_dir)
+
+    reports = []
+    # max_tasks_per_child=1: a fresh process per model, so memory is returned
+    # as soon as it finishes and ru_maxrss measures that model alone
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as pool:
+        futures = {
+            pool.submit(train_model, name, cores[name], data_dir, models_dir, tuning, compression): name
+            for name in names
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                report = {"model": name, "n_jobs": cores[name], "error": str(e)}
+            reports.append(report)
+            if on_result:
+                on_result(report)
+    reports.sort(key=lambda r: names.index(r["model"]))
+    return reports
+
+
+def print_report(report: dict):
+    if "error" in report:
+        print(f"{report['model']:<8} FAILED: {report['error']}")
+        return
+    if "tuning" in report:
+        print_tuning(report["model"], report["tuning"])
+    peak = f"{report['peak_rss_mb']:7.1f} MB" if report["peak_rss_mb"] is not None else "    n/a"
+    print(f"{report['model']:<8} accuracy {report['accuracy']:.4f} | {report['wall_seconds']:8.2f} s "
+          f"on {report['n_jobs']} cores | peak RSS {peak} | "
+          f"artifacts {report['artifact_bytes'] / (1024 * 1024):7.2f} MB | {report['rows']} rows")
+    if "compression" in report:
+        print_compression(report["model"], report["compression"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train disease risk models in parallel")
+    parser.add_argument("models", nargs="*", help=f"models to train: {', '.join(RECIPES)} (default: all)")
+    parser.add_argument("--workers", type=int, help="concurrent training processes (default: one per model, up to --cpus)")
+    parser.add_argument("--cpus", type=int, help="cores to divide between models (default: all)")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--report", help="also write the per-model report as JSON")
+    parser.add_argument("--tune", action="store_true",
+                        help="search n_estimators/max_depth/min_samples_leaf/max_features before fitting")
+    parser.add_argument("--cv-folds", type=int, default=5)
+    parser.add_argument("--max-latency-us", type=float, help="tuning budget: single-row inference latency")
+    parser.add_argument("--max-batch-ms", type=float, help="tuning budget: latency of a 1000-row batch")
+    parser.add_argument("--max-size-kb", type=float, help="tuning budget: pickled model size")
+    parser.add_argument("--compress", action="store_true", help="also write a compressed .npz artifact")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.models if name not in RECIPES]
+    if unknown:
+        parser.error(f"unknown models: {', '.join(unknown)}")
+
+    tuning = None
+    if args.tune:
+        tuning = {
+            "budget": Budget(args.max_latency_us, args.max_batch_ms, args.max_size_kb),
+            "folds": args.cv_folds,
+        }
+
+    compression = options_from_args(args) if args.compress else None
+
+    start = time.perf_counter()
+    reports = train_models(args.models or None, args.workers, args.cpus, args.data_dir, args.models_dir,
+                           on_result=print_report, tuning=tuning, compression=compression)
+    print(f"Trained {sum('error' not in r for r in reports)}/{len(reports)} models "
+          f"in {time.perf_counter() - start:.2f} s")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(reports, f, indent=2)
+    if any("error" in r for r in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
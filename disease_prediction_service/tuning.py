@@ -0,0 +1,163 @@
+"""Latency- and size-budgeted hyperparameter search for the disease forests
+
+Every candidate in the grid (n_estimators, max_depth, min_samples_leaf,
+max_features) is scored with stratified k-fold cross-validation, all
+(candidate, fold) fits running in parallel. Each candidate is then fitted
+once on the training split and measured the way it would be served:
+single-row and batch latency through the compiled forest engine, and the
+size of its pickled artifact.
+
+The selected configuration is the most accurate one within the budget
+(ties go to the faster, then smaller model). The report also lists the
+Pareto front over accuracy, single-row latency and size, so the cost of
+tightening the budget is visible.
+"""
+from dataclasses import dataclass, asdict
+from itertools import product
+from typing import Dict, List, Optional
+import io
+import time
+
+import joblib
+import numpy as np
+
+from disease_models import USE_FOREST_ENGINE
+from forest_engine import compile_forest
+
+DEFAULT_GRID = {
+    "n_estimators": [25, 50, 100],
+    "max_depth": [None, 6, 12],
+    "min_samples_leaf": [1, 5],
+    "max_features": ["sqrt", 0.5],
+}
+BATCH_ROWS = 1000
+
+
+@dataclass
+class Budget:
+    max_latency_us: Optional[float] = None
+    max_batch_ms: Optional[float] = None
+    max_size_kb: Optional[float] = None
+
+    def allows(self, result: dict) -> bool:
+        return (
+            (self.max_latency_us is None or result["single_row_us"] <= self.max_latency_us)
+            and (self.max_batch_ms is None or result["batch_ms"] <= self.max_batch_ms)
+            and (self.max_size_kb is None or result["size_kb"] <= self.max_size_kb)
+        )
+
+
+def candidates(grid: Dict[str, list]) -> List[dict]:
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in product(*(grid[k] for k in keys))]
+
+
+def make_forest(params: dict, random_state: int, n_jobs: int = 1):
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(random_state=random_state, n_jobs=n_jobs, **params)
+
+
+def fold_score(X, y, params, train_index, test_index, random_state):
+    model = make_forest(params, random_state)
+    model.fit(X[train_index], y[train_index])
+    return model.score(X[test_index], y[test_index])
+
+
+def cv_scores(X, y, params_list: List[dict], folds: int, n_jobs: int, random_state: int) -> List[float]:
+    """Mean k-fold accuracy of every candidate, fitting all folds in parallel"""
+    from joblib import Parallel, delayed
+    from sklearn.model_selection import StratifiedKFold
+
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=random_state).split(X, y))
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(fold_score)(X, y, params, train, test, random_state)
+        for params in params_list
+        for train, test in splits
+    )
+    return [float(np.mean(scores[i * folds:(i + 1) * folds])) for i in range(len(params_list))]
+
+
+def best_time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure(model, X_sample: np.ndarray) -> dict:
+    """Serving latency (best of several runs) and pickled size of a fitted model"""
+    forest = compile_forest(model) if USE_FOREST_ENGINE else None
+    predict = forest.predict_proba if forest is not None else model.predict_proba
+    row = X_sample[:1]
+    batch = X_sample[np.arange(BATCH_ROWS) % len(X_sample)]
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return {
+        "single_row_us": round(best_time(lambda: predict(row), 50) * 1e6, 1),
+        "batch_ms": round(best_time(lambda: predict(batch), 5) * 1e3, 3),
+        "size_kb": round(buffer.tell() / 1024, 1),
+    }
+
+
+def pareto_front(results: List[dict]) -> List[dict]:
+    """Candidates not beaten on accuracy, single-row latency and size at once"""
+    def dominates(a, b):
+        no_worse = (a["cv_accuracy"] >= b["cv_accuracy"] and a["single_row_us"] <= b["single_row_us"]
+                    and a["size_kb"] <= b["size_kb"])
+        better = (a["cv_accuracy"] > b["cv_accuracy"] or a["single_row_us"] < b["single_row_us"]
+                  or a["size_kb"] < b["size_kb"])
+        return no_worse and better
+
+    front = [r for r in results if not any(dominates(other, r) for other in results)]
+    return sorted(front, key=lambda r: (-r["cv_accuracy"], r["single_row_us"]))
+
+
+def tune(X_train, y_train, grid: Optional[Dict[str, list]] = None, budget: Optional[Budget] = None,
+         folds: int = 5, n_jobs: int = 1, random_state: int = 42) -> dict:
+    """Search the grid; returns the selected params, every candidate and the Pareto front"""
+    grid = grid or DEFAULT_GRID
+    budget = budget or Budget()
+    X = np.ascontiguousarray(X_train, dtype=np.float32)
+    y = np.asarray(y_train)
+    # Fewer folds when a class is too small for the requested split
+    folds = max(2, min(folds, int(np.bincount(np.unique(y, return_inverse=True)[1]).min())))
+
+    params_list = candidates(grid)
+    scores = cv_scores(X, y, params_list, folds, n_jobs, random_state)
+
+    results = []
+    for params, score in zip(params_list, scores):
+        model = make_forest(params, random_state, n_jobs=1).fit(X, y)
+        result = {"params": params, "cv_accuracy": round(score, 4)}
+        result.update(measure(model, X))
+        result["within_budget"] = budget.allows(result)
+        results.append(result)
+
+    eligible = [r for r in results if r["within_budget"]]
+    selected = None
+    if eligible:
+        selected = min(eligible, key=lambda r: (-r["cv_accuracy"], r["single_row_us"], r["size_kb"]))
+    return {
+        "folds": folds,
+        "budget": asdict(budget),
+        "selected": selected,
+        "candidates": results,
+        "pareto_front": pareto_front(results),
+    }
+
+
+def print_tuning(name: str, tuning: dict):
+    print(f"{name}: {len(tuning['candidates'])} candidates, {tuning['folds']}-fold CV, Pareto front:")
+    for r in tuning["pareto_front"]:
+        marker = "*" if r == tuning["selected"] else " " if r["within_budget"] else "x"
+        print(f"  {marker} cv {r['cv_accuracy']:.4f} | {r['single_row_us']:8.1f} us/row | "
+              f"{r['batch_ms']:8.2f} ms/{BATCH_ROWS} rows | {r['size_kb']:9.1f} KB | {r['params']}")
+    selected = tuning["selected"]
+    if selected is None:
+        print("  no candidate fits the budget")
+    elif selected not in tuning["pareto_front"]:
+        print(f"  * selected cv {selected['cv_accuracy']:.4f} | {selected['single_row_us']:8.1f} us/row | "
+              f"{selected['size_kb']:9.1f} KB | {selected['params']}")
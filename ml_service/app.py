@@ -1,14 +1,30 @@
 """Flask API for ML Models"""
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from ml_models import ml_engine, doctor_performance_knn, depression_risk_model
+from ml_models import ml_engine, doctor_performance_knn, depression_risk_model, REFIT_INTERVAL
+from training_jobs import training_jobs
+import ml_metrics
+from ml_metrics import PHASE_LATENCY
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Whether /api/ml/predict-multi cascades when a request does not say
+CASCADE_DEFAULT = os.getenv('ML_CASCADE', 'false').lower() in ('1', 'true', 'yes')
+
 app = Flask(__name__)
 CORS(app)
+ml_metrics.init_app(app)
+# ml_engine is None in training children, which import this module too
+if REFIT_INTERVAL > 0 and ml_engine is not None:
+    training_jobs.schedule('lab_models_refit', ml_engine.refit, ml_engine.refit_due,
+                           poll=min(REFIT_INTERVAL, 60.0))
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(ml_metrics.render(), content_type=ml_metrics.CONTENT_TYPE)
 
 @app.route('/api/ml/health', methods=['GET'])
 def health():
@@ -19,9 +35,30 @@ def health():
         'trained': ml_engine.is_trained
     })
 
+def wants_wait(data):
+    """Whether a training request asked to block until its job finishes (wait=true)"""
+    value = request.args.get('wait', data.get('wait', False))
+    return value is True or str(value).lower() in ('1', 'true', 'yes')
+
+def job_accepted(job):
+    response = jsonify({
+        'status': 'accepted',
+        'jobId': job.id,
+        'statusUrl': f'/api/ml/jobs/{job.id}'
+    })
+    response.headers['Location'] = f'/api/ml/jobs/{job.id}'
+    return response, 202
+
 @app.route('/api/ml/train', methods=['POST'])
 def train_models():
-    """Train ML models with lab data"""
+    """Train ML models with lab data as a background job
+
+    Returns 202 with a job id; the new models replace the current ones only
+    once all of them are trained. With wait=true the request blocks until
+    the job finishes and returns the results directly. trainingData is a
+    list of consultations or the same data as parallel arrays per parameter
+    (see MLModels.prepare_data).
+    """
     try:
         data = request.get_json()
         # Support both old format (lab_results) and new format (trainingData)
@@ -30,42 +67,116 @@ def train_models():
         if not training_data:
             return jsonify({'error': 'No training data provided'}), 400
         
-        results = ml_engine.train(training_data)
-        
+        job = training_jobs.submit('lab_models', lambda progress: ml_engine.train(training_data, progress))
+        if not wants_wait(data):
+            return job_accepted(job)
+
+        job.done.wait()
+        if job.result is None:
+            return jsonify({'error': job.error, 'jobId': job.id}), 500
+        return jsonify({
+            'status': 'success',
+            'trained': True,
+            'results': job.result,
+            'jobId': job.id
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ml/train/incremental', methods=['POST'])
+def update_models():
+    """Update the lab models with new consultations only, as a background job
+
+    trainingData holds consultations not sent before. The scaler and the
+    models that support partial_fit learn from them right away; the others
+    are refitted on all data every ML_REFIT_INTERVAL seconds or by
+    POST /api/ml/refit. wait=true blocks as for /api/ml/train.
+    """
+    try:
+        data = request.get_json()
+        training_data = data.get('trainingData') or data.get('lab_results', [])
+
+        if not training_data:
+            return jsonify({'error': 'No training data provided'}), 400
+
+        job = training_jobs.submit('lab_models_update', lambda progress: ml_engine.update(training_data, progress))
+        if not wants_wait(data):
+            return job_accepted(job)
+
+        job.done.wait()
+        if job.result is None:
+            return jsonify({'error': job.error, 'jobId': job.id}), 500
         return jsonify({
             'status': 'success',
             'trained': True,
-            'results': results
+            'results': job.result,
+            'jobId': job.id
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/ml/refit', methods=['POST'])
+def refit_models():
+    """Refit the models without partial_fit on all data now, as a background job"""
+    job = training_jobs.submit('lab_models_refit', ml_engine.refit)
+    return job_accepted(job)
+
+@app.route('/api/ml/jobs', methods=['GET'])
+def list_training_jobs():
+    """Recent training jobs, newest last (without their results)"""
+    return jsonify({
+        'status': 'success',
+        'data': [job.to_dict(include_result=False) for job in training_jobs.list()]
+    })
+
+@app.route('/api/ml/jobs/<job_id>', methods=['GET'])
+def training_job_status(job_id):
+    """Status, progress and (once finished) result of a training job"""
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    return jsonify({
+        'status': 'success',
+        'data': job.to_dict()
+    })
+
 @app.route('/api/ml/predict', methods=['POST'])
 def predict():
     """Predict if a value is abnormal"""
     try:
-        data = request.get_json()
-        value = data.get('value')
+        with PHASE_LATENCY.time('predict', 'parse'):
+            data = request.get_json()
+            value = data.get('value')
         
         if value is None:
             return jsonify({'error': 'Value required'}), 400
         
         predictions = ml_engine.predict(value)
         
-        return jsonify({
-            'status': 'success',
-            'predictions': predictions
-        })
+        with PHASE_LATENCY.time('predict', 'serialize'):
+            return jsonify({
+                'status': 'success',
+                'predictions': predictions
+            })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/ml/predict-multi', methods=['POST'])
 def predict_multi():
-    """Predict using multiple features (e.g., Hemoglobin, WBC, Glucose)"""
+    """Predict using multiple features (e.g., Hemoglobin, WBC, Glucose)
+
+    features is one row [hemoglobin, wbc, glucose] or a list of such rows;
+    for a list, predictions holds one result per row, in order. Naming a
+    model runs only that model. Otherwise cascade=true (default
+    ML_CASCADE) runs the cheap models first and the expensive ones only for
+    rows they are unsure about (see MLModels.predict_cascade).
+    """
     try:
-        data = request.get_json()
-        features = data.get('features')  # [hemoglobin, wbc, glucose]
-        model_name = data.get('model')   # Specific model to use, optional
+        with PHASE_LATENCY.time('predict_multi', 'parse'):
+            data = request.get_json()
+            features = data.get('features')  # [hemoglobin, wbc, glucose] or [[...], ...]
+            model_name = data.get('model')   # Specific model to use, optional
+            cascade = data.get('cascade', CASCADE_DEFAULT)
         
         if not features:
             return jsonify({'error': 'Features array required'}), 400
@@ -73,21 +184,43 @@ def predict_multi():
         if not isinstance(features, list) or len(features) == 0:
             return jsonify({'error': 'Features must be a non-empty array'}), 400
         
-        predictions = ml_engine.predict_multi_feature(features)
-        
-        # If specific model requested, return only that
-        if model_name and model_name in predictions:
-            result = {
-                'model': model_name,
-                'prediction': predictions[model_name]
-            }
+        batch = isinstance(features[0], list)
+        rows = features if batch else [features]
+        snapshot = ml_engine.snapshot
+        if model_name and snapshot is not None and model_name in snapshot.models:
+            predictions = ml_engine.predict_batch(rows, models=(model_name,))
+            if isinstance(predictions, dict):
+                result = {'predictions': predictions}
+            elif batch:
+                result = {
+                    'model': model_name,
+                    'predictions': [row[model_name] for row in predictions]
+                }
+            else:
+                result = {
+                    'model': model_name,
+                    'prediction': predictions[0][model_name]
+                }
+        elif cascade is True or str(cascade).lower() in ('1', 'true', 'yes'):
+            predictions = ml_engine.predict_cascade(rows)
+            if isinstance(predictions, dict):
+                result = {'predictions': predictions}
+            elif batch:
+                result = {'mode': 'cascade', 'predictions': predictions}
+            else:
+                result = {'mode': 'cascade', 'prediction': predictions[0]}
         else:
-            result = {'predictions': predictions}
+            predictions = ml_engine.predict_batch(rows)
+            if isinstance(predictions, dict) or batch:
+                result = {'predictions': predictions}
+            else:
+                result = {'predictions': predictions[0]}
         
-        return jsonify({
-            'status': 'success',
-            'data': result
-        })
+        with PHASE_LATENCY.time('predict_multi', 'serialize'):
+            return jsonify({
+                'status': 'success',
+                'data': result
+            })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -107,16 +240,22 @@ def get_metrics():
 @app.route('/api/ml/status', methods=['GET'])
 def status():
     """Get ML engine status"""
+    snapshot = ml_engine.snapshot
     return jsonify({
-        'trained': ml_engine.is_trained,
+        'trained': snapshot is not None,
         'models': list(ml_engine.models.keys()),
-        'data_points': len(ml_engine.scaler.scale_) if ml_engine.is_trained else 0
+        'data_points': len(snapshot.scaler.scale_) if snapshot is not None else 0,
+        'version': snapshot.version if snapshot is not None else None,
+        'trained_at': snapshot.trained_at if snapshot is not None else None,
+        'samples': snapshot.samples if snapshot is not None else 0,
+        'pending_refit_samples': snapshot.pending if snapshot is not None else 0,
+        'refitted_at': snapshot.refitted_at if snapshot is not None else None
     })
 
 # Doctor Performance KNN Endpoints
 @app.route('/api/ml/doctor-performance/train', methods=['POST'])
 def train_doctor_performance():
-    """Train KNN model on doctor performance metrics"""
+    """Train KNN model on doctor performance metrics as a background job (wait=true blocks)"""
     try:
         data = request.get_json()
         doctors_data = data.get('doctors', [])
@@ -124,11 +263,17 @@ def train_doctor_performance():
         if not doctors_data:
             return jsonify({'error': 'No doctor data provided'}), 400
         
-        result = doctor_performance_knn.train(doctors_data)
-        
+        job = training_jobs.submit('doctor_performance', lambda progress: doctor_performance_knn.train(doctors_data, progress))
+        if not wants_wait(data):
+            return job_accepted(job)
+
+        job.done.wait()
+        if job.result is None:
+            return jsonify({'error': job.error, 'jobId': job.id}), 500
         return jsonify({
             'status': 'success',
-            'data': result
+            'data': job.result,
+            'jobId': job.id
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -170,6 +315,7 @@ def doctor_performance_status():
             'data': {
                 'trained': doctor_performance_knn.is_trained,
                 'doctors_count': len(doctor_performance_knn.doctor_data),
+                'version': doctor_performance_knn.snapshot.version if doctor_performance_knn.is_trained else None,
                 'model_type': 'KNN (K-Nearest Neighbors)',
                 'n_neighbors': doctor_performance_knn.n_neighbors
             }
@@ -0,0 +1,8 @@
+"""Test settings, applied before ml_models is imported"""
+import os
+
+# Never read, write or prune the service's real model snapshots
+os.environ['ML_SNAPSHOT_DIR'] = ''
+# Train in the test process; evaluation tests start their own pools
+os.environ.setdefault('ML_TRAIN_WORKERS', '0')
+os.environ.setdefault('ML_CV_WORKERS', '0')
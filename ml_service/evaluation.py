@@ -0,0 +1,264 @@
+"""Cross-validated model evaluation for the ML service
+
+Metrics computed on the training data itself say little about which model
+generalizes best. evaluate() runs stratified k-fold cross-validation for
+several estimators at once: every (model, fold) pair is an independent task
+on a process pool. The feature matrix and labels are placed in shared
+memory once and every worker maps them as NumPy arrays, so no task pickles
+the data.
+
+Pools are started with forkserver (spawn where it is unavailable), never
+fork: they are created from training job threads, and a forked child would
+inherit whatever locks other threads held at that moment. The code children
+run lives here, and the fork server preloads this module. Each child still
+re-imports the parent's main script (e.g. app.py, and through it
+ml_models); modules with import-time side effects check is_child_process()
+so that only the serving process loads snapshots or schedules refits.
+
+Fold results are cached per dataset fingerprint (a hash of X and y) and
+estimator, so retraining on unchanged data reuses the previous evaluation
+instead of fitting k more copies of every model. Estimators should include
+their preprocessing (e.g. a scaler in a Pipeline) so it is fitted on each
+training fold only.
+"""
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
+from sklearn.model_selection import StratifiedKFold
+
+# Folds per model (fewer if the rarer class has fewer samples)
+CV_FOLDS = int(os.getenv('ML_CV_FOLDS', '5'))
+# Pool size for fold tasks (0: run them one after another in the calling thread)
+CV_WORKERS = int(os.getenv('ML_CV_WORKERS', str(os.cpu_count() or 1)))
+# Datasets whose fold results are kept
+CV_CACHE_DATASETS = int(os.getenv('ML_CV_CACHE_DATASETS', '8'))
+CV_RANDOM_STATE = 42
+
+METRICS = ('accuracy', 'precision', 'recall', 'f1_score')
+
+
+def classification_metrics(y, y_pred):
+    tn, fp, fn, tp = confusion_matrix(y, y_pred, labels=[0, 1]).ravel()
+    return {
+        'accuracy': round(accuracy_score(y, y_pred), 4),
+        'precision': round(precision_score(y, y_pred, zero_division=0), 4),
+        'recall': round(recall_score(y, y_pred, zero_division=0), 4),
+        'f1_score': round(f1_score(y, y_pred, zero_division=0), 4),
+        'confusion_matrix': {
+            'true_positives': int(tp),
+            'false_positives': int(fp),
+            'true_negatives': int(tn),
+            'false_negatives': int(fn)
+        }
+    }
+
+
+def fit_and_evaluate(model, X, y):
+    """Fit one model and score it on the training data; returns (model, metrics, fit seconds)"""
+    start = time.perf_counter()
+    model.fit(X, y)
+    seconds = time.perf_counter() - start
+    return model, classification_metrics(y, model.predict(X)), seconds
+
+
+def fit_in_child(conn, model, X, y):
+    """Process target of ml_models.fit_models_concurrently: sends ('ok', result) or ('error', message)"""
+    try:
+        conn.send(('ok', fit_and_evaluate(model, X, y)))
+    except Exception as e:
+        conn.send(('error', str(e)))
+    finally:
+        conn.close()
+
+
+def is_child_process():
+    """Whether this process was started by multiprocessing (a training or CV child)
+
+    Checked by name: while a spawn or forkserver child re-imports the main
+    script, multiprocessing.parent_process() is not set yet but the name is.
+    """
+    return multiprocessing.current_process().name != 'MainProcess'
+
+
+def process_context():
+    """Multiprocessing context for pools started from worker threads"""
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    ctx = multiprocessing.get_context('forkserver')
+    # Children fork from a server that has already imported this module and scikit-learn
+    ctx.set_forkserver_preload([__name__])
+    return ctx
+
+
+def dataset_fingerprint(X, y):
+    digest = hashlib.sha1()
+    for array in (X, y):
+        array = np.ascontiguousarray(array)
+        digest.update(f'{array.dtype}{array.shape}'.encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def fold_count(y, folds=CV_FOLDS):
+    """Folds usable with stratification (0 if there are not enough samples of each class)"""
+    counts = np.unique(y, return_counts=True)[1]
+    if len(counts) < 2:
+        return 0
+    folds = min(folds, int(counts.min()))
+    return folds if folds >= 2 else 0
+
+
+def split(y, folds, fold):
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=CV_RANDOM_STATE)
+    return list(splitter.split(np.zeros(len(y)), y))[fold]
+
+
+def evaluate_fold(model, X, y, folds, fold):
+    train, test = split(y, folds, fold)
+    model = clone(model)
+    model.fit(X[train], y[train])
+    return classification_metrics(y[test], model.predict(X[test]))
+
+
+# Worker side: the shared arrays, attached once per process by _attach
+_shared = {}
+
+
+def _attach(X_spec, y_spec):
+    for key, (name, shape, dtype) in (('X', X_spec), ('y', y_spec)):
+        block = shared_memory.SharedMemory(name=name)
+        _shared[key + '_block'] = block
+        _shared[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _evaluate_shared_fold(model, folds, fold):
+    return evaluate_fold(model, _shared['X'], _shared['y'], folds, fold)
+
+
+def _share(array):
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def summarize(fold_metrics, folds):
+    """Mean metrics over the folds, with the out-of-fold confusion matrix"""
+    summary = {name: round(float(np.mean([m[name] for m in fold_metrics])), 4) for name in METRICS}
+    summary['f1_std'] = round(float(np.std([m['f1_score'] for m in fold_metrics])), 4)
+    summary['confusion_matrix'] = {
+        key: int(sum(m['confusion_matrix'][key] for m in fold_metrics))
+        for key in fold_metrics[0]['confusion_matrix']
+    }
+    summary['evaluation'] = f'stratified_{folds}_fold'
+    return summary
+
+
+class EvaluationCache:
+    """Fold metrics per dataset fingerprint, for the last CV_CACHE_DATASETS datasets"""
+
+    def __init__(self, datasets=CV_CACHE_DATASETS):
+        self.datasets = datasets
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint, key):
+        with self._lock:
+            results = self._results.get(fingerprint)
+            if results is None:
+                return None
+            self._results.move_to_end(fingerprint)
+            return results.get(key)
+
+    def put(self, fingerprint, key, metrics):
+        with self._lock:
+            self._results.setdefault(fingerprint, {})[key] = metrics
+            self._results.move_to_end(fingerprint)
+            while len(self._results) > self.datasets:
+                self._results.popitem(last=False)
+
+
+cache = EvaluationCache()
+
+
+def evaluate(models, X, y, folds=CV_FOLDS, workers=CV_WORKERS, progress=None):
+    """Cross-validated metrics of every model: {name: summary or {'error': message}}
+
+    models maps names to (unfitted) estimators. Returns None if y has too
+    few samples of a class for two stratified folds. progress(finished,
+    total) is called as fold tasks complete; cached folds count as done.
+    """
+    folds = fold_count(y, folds)
+    if folds == 0:
+        return None
+
+    X = np.ascontiguousarray(X)
+    y = np.ascontiguousarray(y)
+    fingerprint = dataset_fingerprint(X, y)
+    fold_metrics = {name: [None] * folds for name in models}
+    errors = {}
+    pending = []
+    for name, model in models.items():
+        model_key = (name, joblib.hash(clone(model)), folds)
+        for fold in range(folds):
+            cached = cache.get(fingerprint, model_key + (fold,))
+            if cached is not None:
+                fold_metrics[name][fold] = cached
+            else:
+                pending.append((name, model, model_key, fold))
+
+    total = len(models) * folds
+    finished = total - len(pending)
+    if progress:
+        progress(finished, total)
+
+    def record(name, model_key, fold, metrics):
+        nonlocal finished
+        fold_metrics[name][fold] = metrics
+        cache.put(fingerprint, model_key + (fold,), metrics)
+        finished += 1
+        if progress:
+            progress(finished, total)
+
+    if pending and workers > 0:
+        blocks = []
+        try:
+            X_block, X_spec = _share(X)
+            blocks.append(X_block)
+            y_block, y_spec = _share(y)
+            blocks.append(y_block)
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=process_context(),
+                                     initializer=_attach, initargs=(X_spec, y_spec)) as pool:
+                futures = [(pool.submit(_evaluate_shared_fold, model, folds, fold), name, model_key, fold)
+                           for name, model, model_key, fold in pending]
+                for future, name, model_key, fold in futures:
+                    try:
+                        record(name, model_key, fold, future.result())
+                    except Exception as e:
+                        errors[name] = str(e)
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+    else:
+        for name, model, model_key, fold in pending:
+            if name in errors:
+                continue
+            try:
+                record(name, model_key, fold, evaluate_fold(model, X, y, folds, fold))
+            except Exception as e:
+                errors[name] = str(e)
+
+    return {
+        name: {'error': f'Cross-validation failed: {errors[name]}'} if name in errors else summarize(metrics, folds)
+        for name, metrics in fold_metrics.items()
+    }
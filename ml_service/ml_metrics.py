@@ -0,0 +1,168 @@
+"""Request and model timing metrics for the ML API, served at /metrics
+
+Counters and histograms are plain dicts behind a lock, rendered in the
+Prometheus text format. Flask's before/after request hooks record per-route
+counts and latency; ml_models records scaling, inference and load timings.
+"""
+from bisect import bisect_left
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+TRAINING_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _labels(names, values, extra=None):
+    pairs = ['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def values(self):
+        """{label values: count}"""
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return ['%s%s %s' % (self.name, _labels(self.labels, labels), value) for labels, value in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][slot] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, (list(counts), total, n)) for labels, (counts, total, n) in self._values.items())
+        lines = []
+        for labels, (counts, total, n) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % ('+Inf' if bound == float('inf') else repr(float(bound)))
+                lines.append('%s_bucket%s %d' % (self.name, _labels(self.labels, labels, le), cumulative))
+            lines.append('%s_sum%s %r' % (self.name, _labels(self.labels, labels), total))
+            lines.append('%s_count%s %d' % (self.name, _labels(self.labels, labels), n))
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+_metrics = []
+
+
+def _register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.append('# HELP %s %s' % (metric.name, metric.help))
+        lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+HTTP_REQUESTS = _register(Counter(
+    'ml_http_requests_total', 'HTTP requests by route, method and status', ('endpoint', 'method', 'status')))
+HTTP_ERRORS = _register(Counter(
+    'ml_http_errors_total', 'HTTP responses with a 4xx/5xx status by route', ('endpoint', 'status')))
+HTTP_LATENCY = _register(Histogram(
+    'ml_http_request_duration_seconds', 'End-to-end request latency by route', ('endpoint', 'method')))
+PHASE_LATENCY = _register(Histogram(
+    'ml_prediction_phase_seconds',
+    'Latency of each prediction phase (parse, scale, inference, serialize) by endpoint or model',
+    ('model', 'phase')))
+PREDICTION_ERRORS = _register(Counter(
+    'ml_prediction_errors_total', 'Per-model prediction failures', ('model',)))
+CASCADE_EXITS = _register(Counter(
+    'ml_cascade_exits_total', 'Rows resolved by the cascade at each stage (0: cheapest models)', ('stage',)))
+MODEL_LOAD_SECONDS = _register(Gauge(
+    'ml_model_load_seconds', 'Time spent loading a persisted model on the last load', ('model',)))
+MODEL_TRAIN_SECONDS = _register(Histogram(
+    'ml_model_train_seconds', 'Time spent fitting each model', ('model',), buckets=TRAINING_BUCKETS))
+
+
+def init_app(app):
+    """Record request counts and latency for every Flask route"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        if start is not None:
+            HTTP_LATENCY.observe(time.perf_counter() - start, endpoint, request.method)
+        HTTP_REQUESTS.inc(endpoint, request.method, str(response.status_code))
+        if response.status_code >= 400:
+            HTTP_ERRORS.inc(endpoint, str(response.status_code))
+        return response
@@ -1,6 +1,7 @@
 """ML Models for lab anomaly detection and doctor performance analysis"""
 import numpy as np
 import pandas as pd
+from sklearn.base import clone
 from sklearn.preprocessing import StandardScaler
 from sklearn.neighbors import KNeighborsClassifier, NearestNeighbors
 from sklearn.tree import DecisionTreeClassifier
@@ -8,24 +9,231 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.naive_bayes import GaussianNB
 from sklearn.svm import SVC
 from sklearn.neural_network import MLPClassifier
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.pipeline import make_pipeline
+from multiprocessing.connection import wait
+import copy
 import os
+import threading
+import time
 import joblib
 
+from evaluation import classification_metrics, fit_and_evaluate
+import evaluation
+from model_store import SnapshotStore
+from ml_metrics import PHASE_LATENCY, PREDICTION_ERRORS, MODEL_LOAD_SECONDS, MODEL_TRAIN_SECONDS, CASCADE_EXITS
+
+# Models fitted at once by MLModels.train (0: one after another in the calling thread)
+TRAIN_WORKERS = int(os.getenv('ML_TRAIN_WORKERS', str(min(5, os.cpu_count() or 1))))
+# Seconds a single model may take to fit and evaluate before it is abandoned
+MODEL_TIMEOUT = float(os.getenv('ML_MODEL_TIMEOUT', '300'))
+# Seconds between scheduled full refits of the models without partial_fit (0: only on request)
+REFIT_INTERVAL = float(os.getenv('ML_REFIT_INTERVAL', '3600'))
+
+# Models updated in place by MLModels.update; the others wait for a full refit
+INCREMENTAL_MODELS = ('naive_bayes', 'neural_network', 'sgd')
+
+# Cascade stages, cheapest first: stages separated by "|", models within one by ","
+CASCADE_STAGES = [[name.strip() for name in stage.split(',') if name.strip()]
+                  for stage in os.getenv('ML_CASCADE_STAGES', 'naive_bayes,decision_tree|knn|neural_network,svm').split('|')]
+# A stage settles a row only if each of its models is at least this confident
+CASCADE_CONFIDENCE = float(os.getenv('ML_CASCADE_CONFIDENCE', '0.9'))
+
+
+def fit_models_concurrently(models, X, y, workers=TRAIN_WORKERS, timeout=MODEL_TIMEOUT, on_done=None):
+    """Fit and evaluate models in up to `workers` child processes
+
+    Each model gets its own process and its own timeout, counted from when it
+    starts; a model that times out is terminated, and one that fails or
+    crashes is reported, without holding up the others. on_done(name,
+    finished count) is called as each model finishes. Returns
+    {name: ('ok', (model, metrics, seconds)) or ('error', message)}.
+    """
+    ctx = evaluation.process_context()
+    pending = list(models.items())
+    running = {}
+    outcomes = {}
+    while pending or running:
+        while pending and len(running) < workers:
+            name, model = pending.pop(0)
+            receiver, sender = ctx.Pipe(duplex=False)
+            process = ctx.Process(target=evaluation.fit_in_child, args=(sender, model, X, y), name=f'train-{name}', daemon=True)
+            process.start()
+            sender.close()
+            running[name] = (process, receiver, time.monotonic())
+
+        ready = wait([receiver for _, receiver, _ in running.values()], timeout=0.1)
+        now = time.monotonic()
+        for name, (process, receiver, started) in list(running.items()):
+            if receiver in ready:
+                try:
+                    outcomes[name] = receiver.recv()
+                except EOFError:
+                    outcomes[name] = ('error', f'Training process exited with code {process.exitcode}')
+            elif now - started > timeout:
+                process.terminate()
+                outcomes[name] = ('error', f'Training timed out after {timeout:g} s')
+            else:
+                continue
+            process.join()
+            receiver.close()
+            del running[name]
+            if on_done:
+                on_done(name, len(outcomes))
+    return outcomes
+
+
+# Lab parameters of a training consultation, in feature order
+LAB_PARAMETERS = ('hemoglobin', 'wbc', 'glucose')
+
+
+def consultation_columns(training_data):
+    """{parameter: {'value': [...], 'isAbnormal': [...]}} of row or columnar training data
+
+    Columnar data (a dict of parameters) is returned as it is. Row data gets
+    None for every value or flag it lacks.
+    """
+    if isinstance(training_data, dict):
+        return training_data
+    columns = {}
+    for name in LAB_PARAMETERS:
+        params = [row.get(name) if isinstance(row, dict) else None for row in training_data]
+        params = [param if isinstance(param, dict) else {} for param in params]
+        columns[name] = {
+            'value': [param.get('value') for param in params],
+            'isAbnormal': [param.get('isAbnormal') for param in params],
+        }
+    return columns
+
+
+def numeric_column(values):
+    """float64 array of values; anything that is not a number becomes NaN"""
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def columnar_features(columns):
+    """(float32 X, int32 y) from consultation columns, dropping incomplete consultations by mask
+
+    A consultation is abnormal if any of its parameters is flagged abnormal.
+    Raises ValueError if a parameter is missing or the columns differ in length.
+    """
+    values = []
+    flags = []
+    for name in LAB_PARAMETERS:
+        column = columns.get(name)
+        if not isinstance(column, dict) or 'value' not in column or 'isAbnormal' not in column:
+            raise ValueError(f"{name} needs 'value' and 'isAbnormal' arrays")
+        values.append(numeric_column(column['value']))
+        flags.append(np.asarray(column['isAbnormal'], dtype=object))
+    lengths = {len(column) for column in values + flags}
+    if len(lengths) > 1 or any(column.ndim != 1 for column in values + flags):
+        raise ValueError('Parameter arrays must all have one entry per consultation')
+
+    values = np.column_stack(values)
+    flags = np.column_stack(flags)
+    keep = np.isfinite(values).all(axis=1) & np.not_equal(flags, None).all(axis=1)
+    X = values[keep].astype(np.float32)
+    y = flags[keep].astype(bool).any(axis=1).astype(np.int32)
+    return X, y
+
+
+def no_progress(stage, fraction):
+    pass
+
+
+class LabModelSnapshot:
+    """A scaler, the models fitted on its output and their metrics; never modified once published
+
+    scaler keeps running statistics of every sample seen and is what the
+    incremental models are updated with. The other models were fitted at the
+    last full refit and keep the scaler of that time, batch_scaler, until the
+    next one. data holds the raw training chunks ((X, y), ...) for that refit.
+    """
+
+    def __init__(self, version, scaler, models, results, data, batch_scaler=None, refitted_at=None, pending=0,
+                 trained_at=None):
+        self.version = version
+        self.scaler = scaler
+        self.batch_scaler = batch_scaler if batch_scaler is not None else scaler
+        self.models = models
+        self.results = results
+        self.data = data
+        self.samples = sum(len(y) for _, y in data)
+        # Samples added by updates that the refit models have not seen
+        self.pending = pending
+        self.trained_at = trained_at if trained_at is not None else time.time()
+        self.refitted_at = refitted_at if refitted_at is not None else self.trained_at
+
+    def state(self):
+        """Everything but the version and data, as saved by SnapshotStore"""
+        return {
+            'scaler': self.scaler,
+            'batch_scaler': self.batch_scaler,
+            'models': self.models,
+            'results': self.results,
+            'pending': self.pending,
+            'trained_at': self.trained_at,
+            'refitted_at': self.refitted_at,
+        }
+
+    def scale(self, X):
+        """{model name: X scaled for that model}"""
+        X_scaled = self.scaler.transform(X)
+        X_batch = X_scaled if self.batch_scaler is self.scaler else self.batch_scaler.transform(X)
+        return {name: X_scaled if name in INCREMENTAL_MODELS else X_batch for name in self.models}
+
+
 class MLModels:
-    def __init__(self):
+    def __init__(self, store=None):
         self.models = {
             'knn': KNeighborsClassifier(n_neighbors=3),
             'decision_tree': DecisionTreeClassifier(random_state=42),
             'naive_bayes': GaussianNB(),
             'svm': SVC(kernel='rbf', random_state=42),
-            'neural_network': MLPClassifier(hidden_layer_sizes=(100, 50), max_iter=1000, random_state=42)
+            'neural_network': MLPClassifier(hidden_layer_sizes=(100, 50), max_iter=1000, random_state=42),
+            # Linear alternative to the SVM that can be updated with partial_fit
+            'sgd': SGDClassifier(loss='modified_huber', random_state=42)
         }
-        self.scaler = StandardScaler()
-        self.is_trained = False
-        self.results = {}
+        # Training fits clones of the estimators above and publishes them, with
+        # their scaler, as a new snapshot in a single assignment. Predictions
+        # read self.snapshot once, so they never mix a new scaler with old models.
+        self.snapshot = None
+        self._versions = 0
+        # Serializes train, update and refit, which each start from the current snapshot
+        self._lock = threading.Lock()
+        self.store = store if store is not None else SnapshotStore('lab_models')
+        self.load_snapshot()
+
+    def load_snapshot(self):
+        """Serve the latest saved snapshot, if any; its arrays stay memory-mapped"""
+        start = time.perf_counter()
+        saved = self.store.load_latest()
+        if saved is None:
+            return False
+        version, state, data = saved
+        self._versions = version
+        self.snapshot = LabModelSnapshot(version, data=data, **state)
+        MODEL_LOAD_SECONDS.set(time.perf_counter() - start, 'lab_models')
+        print(f"Loaded lab models snapshot v{version} ({self.snapshot.samples} samples)")
+        return True
+
+    @property
+    def is_trained(self):
+        return self.snapshot is not None
+
+    @property
+    def results(self):
+        return self.snapshot.results if self.snapshot is not None else {}
 
-    def prepare_data(self, training_data):
+    @property
+    def scaler(self):
+        return self.snapshot.scaler if self.snapshot is not None else None
+
+    def prepare_data(self, training_data, min_samples=2):
         """Convert consultation training data to ML features
         
         training_data format: list of consultations with hemoglobin, wbc, glucose
@@ -34,35 +242,25 @@ class MLModels:
             'wbc': {'value': float, 'isAbnormal': bool},
             'glucose': {'value': float, 'isAbnormal': bool}
         }
+        or the same data as parallel arrays (see consultation_columns):
+        {
+            'hemoglobin': {'value': [float, ...], 'isAbnormal': [bool, ...]},
+            'wbc': {...},
+            'glucose': {...}
+        }
+        Consultations with a missing, non-numeric or non-finite value or a
+        missing flag are dropped.
         """
-        X = []
-        y = []
-        
-        for consultation in training_data:
-            try:
-                # Extract values from structured consultation data
-                hemo_value = float(consultation['hemoglobin']['value'])
-                wbc_value = float(consultation['wbc']['value'])
-                glucose_value = float(consultation['glucose']['value'])
-                
-                # Create sample from this consultation
-                X.append([hemo_value, wbc_value, glucose_value])
-                
-                # Label as abnormal if ANY parameter is abnormal
-                is_abnormal = (consultation['hemoglobin']['isAbnormal'] or 
-                              consultation['wbc']['isAbnormal'] or 
-                              consultation['glucose']['isAbnormal'])
-                y.append(1 if is_abnormal else 0)
-                    
-            except (ValueError, TypeError, KeyError) as e:
-                continue
+        try:
+            columns = consultation_columns(training_data)
+            X, y = columnar_features(columns)
+        except ValueError as e:
+            print(f"Invalid training data: {e}")
+            return None, None
         
-        if len(X) < 2:
-            print(f"Insufficient data: need at least 2 complete consultations")
+        if len(X) < min_samples:
+            print(f"Insufficient data: need at least {min_samples} complete consultations")
             return None, None
-
-        X = np.array(X, dtype=np.float32)
-        y = np.array(y, dtype=np.int32)
         
         print(f"Prepared {len(X)} training samples")
         print(f"  Normal samples: {np.sum(y == 0)}")
@@ -71,119 +269,408 @@ class MLModels:
               f"WBC: {X[:, 1].min():.2f}-{X[:, 1].max():.2f}, "
               f"Glucose: {X[:, 2].min():.2f}-{X[:, 2].max():.2f}")
 
-        # Scale features
-        X_scaled = self.scaler.fit_transform(X)
-        return X_scaled, y
+        return X, y
+
+    def fit_models(self, models, X, y, progress, start=0.1, end=1.0):
+        """Fit and evaluate models, returning ({name: fitted model}, {name: metrics or error})
 
-    def train(self, lab_results):
-        """Train all models"""
+        Models are fitted concurrently in child processes unless
+        ML_TRAIN_WORKERS is 0. progress runs from start to end as they finish.
+        """
+        progress('fitting', start)
+        on_done = lambda model_name, finished: progress(f'fitted {model_name}', start + (end - start) * finished / len(models))
+        if TRAIN_WORKERS > 0:
+            outcomes = fit_models_concurrently(models, X, y, TRAIN_WORKERS, MODEL_TIMEOUT, on_done)
+        else:
+            outcomes = {}
+            for model_name, model in models.items():
+                try:
+                    outcomes[model_name] = ('ok', fit_and_evaluate(model, X, y))
+                except Exception as e:
+                    outcomes[model_name] = ('error', str(e))
+                on_done(model_name, len(outcomes))
+
+        results = {}
+        fitted = {}
+        for model_name in models:
+            status, payload = outcomes[model_name]
+            if status != 'ok':
+                print(f"Training {model_name} failed: {payload}")
+                results[model_name] = {'error': payload}
+                continue
+            model, metrics, seconds = payload
+            MODEL_TRAIN_SECONDS.observe(seconds, model_name)
+            fitted[model_name] = model
+            results[model_name] = metrics
+        return fitted, results
+
+    def cross_validate(self, results, X, y, progress, start=0.5):
+        """results with the metrics of every fitted model replaced by cross-validated ones
+
+        Each model is evaluated as a scaler + model pipeline on the raw
+        features X (see evaluation.evaluate). Where cross-validation is not
+        possible the training-data metrics stay, marked as such.
+        """
+        names = [model_name for model_name, metrics in results.items() if 'error' not in metrics]
+        candidates = {model_name: make_pipeline(StandardScaler(), clone(self.models[model_name])) for model_name in names}
+        report = lambda finished, total: progress('cross-validating', start + (1 - start) * finished / total)
+        scores = evaluation.evaluate(candidates, X, y, progress=report) or {}
+        results = dict(results)
+        for model_name in names:
+            score = scores.get(model_name)
+            if score is None or 'error' in score:
+                if score is not None:
+                    print(f"{model_name}: {score['error']}")
+                results[model_name] = dict(results[model_name], evaluation='training_data')
+            else:
+                results[model_name] = score
+        return results
+
+    def publish(self, scaler, models, results, data, **kwargs):
+        """Serve a new snapshot, then save it; a failed save only costs the warm start"""
+        self._versions += 1
+        snapshot = LabModelSnapshot(self._versions, scaler, models, results, data, **kwargs)
+        self.snapshot = snapshot
+        try:
+            self.store.save(snapshot.version, snapshot.state(), snapshot.data)
+        except Exception as e:
+            print(f"Error saving lab models snapshot v{snapshot.version}: {e}")
+
+    def train(self, lab_results, progress=no_progress):
+        """Train all models from scratch into a new snapshot and publish it
+
+        lab_results replaces all earlier training data. The current snapshot
+        keeps serving until the new one is complete, and stays if no model
+        trains successfully. progress(stage, fraction) is called as training
+        advances.
+        """
+        progress('preparing', 0.0)
         X, y = self.prepare_data(lab_results)
 
         if X is None or len(np.unique(y)) < 2:
             return {'error': 'Insufficient training data. Need at least 2 samples with both normal and abnormal values.'}
 
-        self.results = {}
+        with self._lock:
+            scaler = StandardScaler()
+            X_scaled = scaler.fit_transform(X)
+            models = {model_name: clone(model) for model_name, model in self.models.items()}
+            fitted, results = self.fit_models(models, X_scaled, y, progress, end=0.5)
+            if fitted:
+                results = self.cross_validate(results, X, y, progress)
+                self.publish(scaler, fitted, results, ((X, y),))
+        return results
 
-        for model_name, model in self.models.items():
-            try:
-                model.fit(X, y)
-                
-                # Get predictions
-                y_pred = model.predict(X)
-                
-                # Calculate metrics
-                tn, fp, fn, tp = confusion_matrix(y, y_pred).ravel() if len(np.unique(y)) > 1 else [0, 0, 0, 0]
-                
-                accuracy = accuracy_score(y, y_pred)
-                precision = precision_score(y, y_pred, zero_division=0)
-                recall = recall_score(y, y_pred, zero_division=0)
-                f1 = f1_score(y, y_pred, zero_division=0)
-
-                self.results[model_name] = {
-                    'accuracy': round(accuracy, 4),
-                    'precision': round(precision, 4),
-                    'recall': round(recall, 4),
-                    'f1_score': round(f1, 4),
-                    'confusion_matrix': {
-                        'true_positives': int(tp),
-                        'false_positives': int(fp),
-                        'true_negatives': int(tn),
-                        'false_negatives': int(fn)
-                    }
-                }
-            except Exception as e:
-                self.results[model_name] = {'error': str(e)}
+    def update(self, lab_results, progress=no_progress):
+        """Learn from new consultations only, without revisiting earlier ones
 
-        self.is_trained = True
-        return self.results
+        The scaler's running mean and variance are updated with the new
+        samples, then the incremental models (INCREMENTAL_MODELS) take one
+        partial_fit pass over them, so the cost depends on the number of new
+        samples only. The other models keep serving as they are until the next
+        full refit (see refit). Every model keeps its cross-validated metrics,
+        marked stale by pending_samples until that refit; the incremental ones
+        also report their score on the new samples before the update under
+        last_update, which get_metrics does not rank. Without a trained
+        snapshot this is a full train.
+        """
+        if self.snapshot is None:
+            return self.train(lab_results, progress)
+
+        progress('preparing', 0.0)
+        X, y = self.prepare_data(lab_results, min_samples=1)
+        if X is None:
+            return {'error': 'No complete consultations in the update.'}
+
+        with self._lock:
+            snapshot = self.snapshot
+            scaler = copy.deepcopy(snapshot.scaler).partial_fit(X)
+            X_scaled = scaler.transform(X)
+            models = dict(snapshot.models)
+            results = dict(snapshot.results)
+            incremental = [model_name for model_name in INCREMENTAL_MODELS if model_name in models]
+            for done, model_name in enumerate(incremental):
+                progress(f'updating {model_name}', 0.1 + 0.9 * done / len(incremental))
+                model = copy.deepcopy(models[model_name])
+                try:
+                    batch_metrics = classification_metrics(y, model.predict(X_scaled))
+                    start = time.perf_counter()
+                    model.partial_fit(X_scaled, y)
+                    MODEL_TRAIN_SECONDS.observe(time.perf_counter() - start, model_name)
+                except Exception as e:
+                    print(f"Updating {model_name} failed: {e}")
+                    results[model_name] = dict(results[model_name], last_update={'error': str(e)})
+                    continue
+                models[model_name] = model
+                results[model_name] = dict(results[model_name], samples_seen=snapshot.samples + len(X),
+                                           last_update=dict(batch_metrics, samples=len(X)))
+            pending = snapshot.pending + len(X)
+            for model_name in models:
+                results[model_name] = dict(results[model_name], pending_samples=pending)
+            self.publish(scaler, models, results, snapshot.data + ((X, y),),
+                         batch_scaler=snapshot.batch_scaler, refitted_at=snapshot.refitted_at, pending=pending)
+        return results
+
+    def refit_due(self, interval=REFIT_INTERVAL):
+        """Whether updates are waiting for a refit and the last one is interval seconds old"""
+        snapshot = self.snapshot
+        return (interval > 0 and snapshot is not None and snapshot.pending > 0
+                and time.time() - snapshot.refitted_at >= interval)
+
+    def refit(self, progress=no_progress):
+        """Refit the models without partial_fit on all training data seen so far
+
+        The incremental models are kept as they are, but their metrics are
+        cross-validated again on all the data. Afterwards every model uses
+        the running scaler again.
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {'error': 'Models not trained yet'}
+
+        with self._lock:
+            snapshot = self.snapshot
+            progress('preparing', 0.0)
+            X = np.concatenate([X for X, _ in snapshot.data])
+            y = np.concatenate([y for _, y in snapshot.data])
+            scaler = snapshot.scaler
+            models = {model_name: clone(model) for model_name, model in self.models.items()
+                      if model_name not in INCREMENTAL_MODELS}
+            fitted, refit_results = self.fit_models(models, scaler.transform(X), y, progress, end=0.5)
+            if len(fitted) < len(models):
+                # A model that failed could not keep serving with the old batch_scaler gone
+                return {'error': 'Refit failed; previous models kept', 'results': refit_results}
+            incremental = {model_name: snapshot.results[model_name] for model_name in INCREMENTAL_MODELS
+                           if 'error' not in snapshot.results.get(model_name, {'error': None})}
+            refit_results = self.cross_validate(dict(refit_results, **incremental), X, y, progress)
+            for model_name, previous in incremental.items():
+                kept = {key: previous[key] for key in ('samples_seen', 'last_update') if key in previous}
+                metrics = dict(refit_results[model_name], **kept)
+                metrics.pop('pending_samples', None)
+                refit_results[model_name] = metrics
+            models = dict(snapshot.models, **fitted)
+            results = dict(snapshot.results, **refit_results)
+            self.publish(scaler, models, results, ((X, y),))
+        return results
 
     def predict(self, value):
         """Predict if value is abnormal"""
-        if not self.is_trained:
+        snapshot = self.snapshot
+        if snapshot is None:
             return {'error': 'Models not trained yet'}
 
         try:
             value = float(value)
-            X_scaled = self.scaler.transform([[value]])
+            with PHASE_LATENCY.time('scaler', 'scale'):
+                X_scaled = snapshot.scale([[value]])
             
             predictions = {}
-            for model_name, model in self.models.items():
-                pred = int(model.predict(X_scaled)[0])
+            for model_name, model in snapshot.models.items():
+                with PHASE_LATENCY.time(model_name, 'inference'):
+                    pred = int(model.predict(X_scaled[model_name])[0])
                 predictions[model_name] = {'is_abnormal': bool(pred)}
             
             return predictions
         except Exception as e:
             return {'error': str(e)}
     
-    def predict_multi_feature(self, features):
+    def predict_multi_feature(self, features, models=None):
         """Predict if multiple features (e.g., Hemoglobin, WBC, Glucose) are abnormal"""
-        if not self.is_trained:
+        predictions = self.predict_batch([features], models)
+        if isinstance(predictions, dict):
+            return predictions
+        return predictions[0]
+
+    @staticmethod
+    def feature_matrix(rows):
+        X = np.asarray(rows, dtype=np.float64)
+        if X.ndim != 2 or len(X) == 0:
+            raise ValueError('Features must be a row or a non-empty list of rows')
+        return X
+
+    @staticmethod
+    def score(model_name, model, X):
+        """(predicted classes, confidence) of every row
+
+        Models with predict_proba take the class with the highest
+        probability as prediction and that probability as confidence; the
+        others (the SVM) predict directly with confidence 0.5.
+        """
+        with PHASE_LATENCY.time(model_name, 'inference'):
+            if hasattr(model, 'predict_proba'):
+                proba = model.predict_proba(X)
+                best = np.argmax(proba, axis=1)
+                return model.classes_[best].astype(int), proba[np.arange(len(proba)), best]
+            pred = model.predict(X).astype(int)
+            return pred, np.full(len(pred), 0.5)
+
+    @staticmethod
+    def model_results(pred, confidence):
+        return [
+            {
+                'is_abnormal': bool(p),
+                'prediction': p,  # 0 = Normal, 1 = Abnormal
+                'confidence': c
+            }
+            for p, c in zip(pred.tolist(), confidence.tolist())
+        ]
+
+    def predict_batch(self, rows, models=None):
+        """Predict every row of a feature matrix; returns one {model: result} per row, in order
+
+        The rows are scaled once and every model (or only those named in
+        models) runs once over the whole matrix.
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
             return {'error': 'Models not trained yet'}
 
         try:
-            # Convert features to numpy array
-            feature_values = np.array([float(f) for f in features]).reshape(1, -1)
-            
-            # Scale features
-            X_scaled = self.scaler.transform(feature_values)
-            
-            predictions = {}
-            for model_name, model in self.models.items():
+            X = self.feature_matrix(rows)
+            with PHASE_LATENCY.time('scaler', 'scale'):
+                X_scaled = snapshot.scale(X)
+
+            columns = {}
+            for model_name, model in snapshot.models.items():
+                if models is not None and model_name not in models:
+                    continue
                 try:
-                    pred = int(model.predict(X_scaled)[0])
-                    # Try to get probability for confidence
-                    confidence = 0.5
-                    if hasattr(model, 'predict_proba'):
-                        proba = model.predict_proba(X_scaled)[0]
-                        confidence = max(proba)  # Max probability
-                    
-                    predictions[model_name] = {
-                        'is_abnormal': bool(pred),
-                        'prediction': int(pred),  # 0 = Normal, 1 = Abnormal
-                        'confidence': float(confidence)
-                    }
+                    columns[model_name] = self.model_results(*self.score(model_name, model, X_scaled[model_name]))
                 except Exception as e:
-                    predictions[model_name] = {'error': str(e)}
-            
-            return predictions
+                    PREDICTION_ERRORS.inc(model_name)
+                    columns[model_name] = [{'error': str(e)}] * len(X)
+
+            return [{model_name: column[i] for model_name, column in columns.items()} for i in range(len(X))]
         except Exception as e:
             return {'error': str(e)}
 
+    @staticmethod
+    def cascade_stages(snapshot):
+        """CASCADE_STAGES limited to the snapshot's models; unlisted models join the last stage"""
+        stages = [[name for name in stage if name in snapshot.models] for stage in CASCADE_STAGES]
+        stages = [stage for stage in stages if stage] or [[]]
+        listed = {name for stage in stages for name in stage}
+        stages[-1] = stages[-1] + [name for name in snapshot.models if name not in listed]
+        return [stage for stage in stages if stage]
+
+    def predict_cascade(self, rows):
+        """Predict every row with as few models as needed; returns one result per row, in order
+
+        Stages run cheapest first. After each stage a row is settled if every
+        model of that stage is at least CASCADE_CONFIDENCE confident and
+        agrees with the majority of all models that have scored the row so
+        far; only unsettled rows go on to the next stage. So the first stage
+        settles rows its models agree on, and a later stage settles rows the
+        earlier ones disagreed on when it confidently breaks the tie. Rows
+        that reach the last stage are decided by majority vote of all
+        models, a tie counting as abnormal. Each result gives the decision,
+        the share of models that voted for it, the stage it was decided at
+        and the individual model results.
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {'error': 'Models not trained yet'}
+
+        try:
+            X = self.feature_matrix(rows)
+            with PHASE_LATENCY.time('scaler', 'scale'):
+                X_scaled = snapshot.scale(X)
+
+            n = len(X)
+            model_results = [{} for _ in range(n)]
+            abnormal = np.zeros(n, dtype=np.int64)
+            answered = np.zeros(n, dtype=np.int64)
+            stage_of = np.zeros(n, dtype=np.int64)
+            active = np.arange(n)
+            stages = self.cascade_stages(snapshot)
+            for stage, model_names in enumerate(stages):
+                # Predictions of this stage's models (-1: failed) and their lowest confidence
+                stage_preds = []
+                least_confident = np.ones(len(active))
+                for model_name in model_names:
+                    try:
+                        pred, confidence = self.score(model_name, snapshot.models[model_name], X_scaled[model_name][active])
+                    except Exception as e:
+                        PREDICTION_ERRORS.inc(model_name)
+                        for i in active.tolist():
+                            model_results[i][model_name] = {'error': str(e)}
+                        continue
+                    for i, result in zip(active.tolist(), self.model_results(pred, confidence)):
+                        model_results[i][model_name] = result
+                    abnormal[active] += pred
+                    answered[active] += 1
+                    stage_preds.append(pred)
+                    least_confident = np.minimum(least_confident, confidence)
+
+                if stage == len(stages) - 1:
+                    done = np.ones(len(active), dtype=bool)
+                elif not stage_preds:
+                    done = np.zeros(len(active), dtype=bool)
+                else:
+                    majority = (2 * abnormal[active] >= answered[active]).astype(np.int64)
+                    agree = np.all(np.vstack(stage_preds) == majority, axis=0)
+                    done = agree & (least_confident >= CASCADE_CONFIDENCE)
+                stage_of[active[done]] = stage
+                CASCADE_EXITS.inc(str(stage), amount=int(done.sum()))
+                active = active[~done]
+                if len(active) == 0:
+                    break
+
+            results = []
+            for i in range(n):
+                if answered[i] == 0:
+                    results.append({'error': 'No model could score this row', 'models': model_results[i]})
+                    continue
+                is_abnormal = 2 * abnormal[i] >= answered[i]
+                votes = abnormal[i] if is_abnormal else answered[i] - abnormal[i]
+                results.append({
+                    'is_abnormal': bool(is_abnormal),
+                    'prediction': int(is_abnormal),
+                    'agreement': round(float(votes / answered[i]), 4),
+                    'stage': int(stage_of[i]),
+                    'models': model_results[i]
+                })
+            return results
+        except Exception as e:
+            return {'error': str(e)}
+
+    def cascade_report(self):
+        """Cascade configuration and the share of rows resolved at each stage so far"""
+        snapshot = self.snapshot
+        stages = self.cascade_stages(snapshot) if snapshot is not None else CASCADE_STAGES
+        exits = CASCADE_EXITS.values()
+        total = sum(exits.values())
+        return {
+            'stages': stages,
+            'confidence_threshold': CASCADE_CONFIDENCE,
+            'rows': total,
+            'exits': [
+                {
+                    'stage': stage,
+                    'models': models,
+                    'rows': exits.get((str(stage),), 0),
+                    'rate': round(exits.get((str(stage),), 0) / total, 4) if total else 0.0
+                }
+                for stage, models in enumerate(stages)
+            ]
+        }
+
     def get_metrics(self):
         """Get all trained model metrics"""
-        if not self.is_trained:
+        snapshot = self.snapshot
+        if snapshot is None:
             return {'error': 'Models not trained yet'}
+        results = snapshot.results
         
         # Calculate averages
-        if self.results:
-            avg_accuracy = np.mean([r.get('accuracy', 0) for r in self.results.values() if 'accuracy' in r])
-            avg_precision = np.mean([r.get('precision', 0) for r in self.results.values() if 'precision' in r])
-            avg_recall = np.mean([r.get('recall', 0) for r in self.results.values() if 'recall' in r])
-            avg_f1 = np.mean([r.get('f1_score', 0) for r in self.results.values() if 'f1_score' in r])
+        if results:
+            avg_accuracy = np.mean([r.get('accuracy', 0) for r in results.values() if 'accuracy' in r])
+            avg_precision = np.mean([r.get('precision', 0) for r in results.values() if 'precision' in r])
+            avg_recall = np.mean([r.get('recall', 0) for r in results.values() if 'recall' in r])
+            avg_f1 = np.mean([r.get('f1_score', 0) for r in results.values() if 'f1_score' in r])
 
             # Find best model
             best_model = max(
-                [(name, r.get('f1_score', 0)) for name, r in self.results.items() if 'f1_score' in r],
+                [(name, r.get('f1_score', 0)) for name, r in results.items() if 'f1_score' in r],
                 key=lambda x: x[1]
             )[0]
 
@@ -196,7 +683,7 @@ class MLModels:
                 reliability = 'LOW'
 
             return {
-                'models': self.results,
+                'models': results,
                 'average_metrics': {
                     'accuracy': round(float(avg_accuracy), 4),
                     'precision': round(float(avg_precision), 4),
@@ -204,22 +691,74 @@ class MLModels:
                     'f1_score': round(float(avg_f1), 4)
                 },
                 'best_model': best_model,
-                'reliability_level': reliability
+                'reliability_level': reliability,
+                'cascade': self.cascade_report()
             }
         
-        return self.results
+        return results
+
+
+class DoctorPerformanceSnapshot:
+    """Fitted KNN index with the scaler and doctor records it was built from
+
+    X is the scaled metric matrix the index was fitted on, doctor_ids the
+    doctor of each of its rows and index the row of each doctor.
+    """
+
+    def __init__(self, version, knn, scaler, doctor_data, X, doctor_ids, trained_at=None):
+        self.version = version
+        self.knn = knn
+        self.scaler = scaler
+        self.doctor_data = doctor_data
+        self.X = X
+        self.doctor_ids = doctor_ids
+        self.index = {doctor_id: row for row, doctor_id in enumerate(doctor_ids)}
+        self.trained_at = trained_at if trained_at is not None else time.time()
+
+    def state(self):
+        return {
+            'knn': self.knn,
+            'scaler': self.scaler,
+            'doctor_data': self.doctor_data,
+            'X': self.X,
+            'doctor_ids': self.doctor_ids,
+            'trained_at': self.trained_at,
+        }
 
 
 class DoctorPerformanceKNN:
     """KNN-based doctor performance analysis and clustering"""
     
-    def __init__(self, n_neighbors=3):
+    def __init__(self, n_neighbors=3, store=None):
         self.n_neighbors = n_neighbors
-        self.knn = None
-        self.scaler = StandardScaler()
-        self.is_trained = False
-        self.doctor_data = {}
         self.metrics_history = {}
+        # (knn, scaler, doctor_data) of the last training, replaced as a whole
+        self.snapshot = None
+        self._versions = 0
+        self._lock = threading.Lock()
+        self.store = store if store is not None else SnapshotStore('doctor_performance')
+        self.load_snapshot()
+
+    def load_snapshot(self):
+        """Serve the latest saved KNN index, if any"""
+        start = time.perf_counter()
+        saved = self.store.load_latest()
+        if saved is None:
+            return False
+        version, state, _ = saved
+        self._versions = version
+        self.snapshot = DoctorPerformanceSnapshot(version, **state)
+        MODEL_LOAD_SECONDS.set(time.perf_counter() - start, 'doctor_performance')
+        print(f"Loaded doctor performance snapshot v{version} ({len(self.snapshot.doctor_ids)} doctors)")
+        return True
+
+    @property
+    def is_trained(self):
+        return self.snapshot is not None
+
+    @property
+    def doctor_data(self):
+        return self.snapshot.doctor_data if self.snapshot is not None else {}
     
     def prepare_doctor_metrics(self, doctors_data):
         """
@@ -273,27 +812,35 @@ class DoctorPerformanceKNN:
                 continue
         
         if len(X) < 2:
-            return None, None, None, None
+            return None, None, None, None, None
         
         X = np.array(X, dtype=np.float32)
-        X_scaled = self.scaler.fit_transform(X)
-        
-        self.doctor_data = doctor_info
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
         
         print(f"Prepared {len(X)} doctor records for performance analysis")
-        return X_scaled, doctor_ids, doctor_info, X
+        return X_scaled, doctor_ids, doctor_info, X, scaler
     
-    def train(self, doctors_data):
-        """Train KNN on doctor performance metrics"""
-        X_scaled, doctor_ids, doctor_info, X = self.prepare_doctor_metrics(doctors_data)
+    def train(self, doctors_data, progress=no_progress):
+        """Train KNN on doctor performance metrics and publish it as a new snapshot"""
+        progress('preparing', 0.0)
+        X_scaled, doctor_ids, doctor_info, X, scaler = self.prepare_doctor_metrics(doctors_data)
         
         if X_scaled is None or len(doctor_ids) < self.n_neighbors:
             return {'error': f'Insufficient data. Need at least {self.n_neighbors} doctors.'}
         
         try:
-            self.knn = NearestNeighbors(n_neighbors=min(self.n_neighbors, len(doctor_ids)))
-            self.knn.fit(X_scaled)
-            self.is_trained = True
+            progress('fitting', 0.5)
+            knn = NearestNeighbors(n_neighbors=min(self.n_neighbors, len(doctor_ids)))
+            knn.fit(X_scaled)
+            with self._lock:
+                self._versions += 1
+                snapshot = DoctorPerformanceSnapshot(self._versions, knn, scaler, doctor_info, X_scaled, doctor_ids)
+                self.snapshot = snapshot
+                try:
+                    self.store.save(snapshot.version, snapshot.state())
+                except Exception as e:
+                    print(f"Error saving doctor performance snapshot v{snapshot.version}: {e}")
             
             return {
                 'status': 'trained',
@@ -305,28 +852,21 @@ class DoctorPerformanceKNN:
     
     def find_similar_doctors(self, doctor_id, k=3):
         """Find k similar doctors using KNN"""
-        if not self.is_trained:
+        snapshot = self.snapshot
+        if snapshot is None:
             return {'error': 'Model not trained yet'}
         
-        doctor_ids = list(self.doctor_data.keys())
+        doctor_data = snapshot.doctor_data
+        doctor_ids = snapshot.doctor_ids
         try:
-            if doctor_id not in doctor_ids:
+            if doctor_id not in snapshot.index:
                 return {'error': f'Doctor {doctor_id} not found in trained data'}
             
-            doctor_index = doctor_ids.index(doctor_id)
-            target_metrics = np.array([
-                self.doctor_data[doctor_id]['metrics']['totalVisits'],
-                self.doctor_data[doctor_id]['metrics']['uniquePatients'],
-                self.doctor_data[doctor_id]['metrics']['averageConsultationFee'],
-                self.doctor_data[doctor_id]['metrics']['visitCompletionRate'],
-                self.doctor_data[doctor_id]['metrics']['prescriptionFrequency'],
-                self.doctor_data[doctor_id]['metrics']['repeatPatientPercentage']
-            ]).reshape(1, -1)
-            
-            target_scaled = self.scaler.transform(target_metrics)
+            # The doctor's row of the matrix the index was fitted on
+            target_scaled = snapshot.X[snapshot.index[doctor_id]].reshape(1, -1)
             
             # Get k+1 neighbors (including self)
-            distances, indices = self.knn.kneighbors(target_scaled, n_neighbors=min(k+1, len(doctor_ids)))
+            distances, indices = snapshot.knn.kneighbors(target_scaled, n_neighbors=min(k+1, len(doctor_ids)))
             
             similar = []
             for distance, idx in zip(distances[0], indices[0]):
@@ -334,15 +874,15 @@ class DoctorPerformanceKNN:
                 if similar_doctor_id != doctor_id:  # Exclude self
                     similar.append({
                         'doctorId': similar_doctor_id,
-                        'name': self.doctor_data[similar_doctor_id]['name'],
+                        'name': doctor_data[similar_doctor_id]['name'],
                         'distance': float(distance),
-                        'metrics': self.doctor_data[similar_doctor_id]['metrics']
+                        'metrics': doctor_data[similar_doctor_id]['metrics']
                     })
             
             return {
                 'doctorId': doctor_id,
-                'doctorName': self.doctor_data[doctor_id]['name'],
-                'targetMetrics': self.doctor_data[doctor_id]['metrics'],
+                'doctorName': doctor_data[doctor_id]['name'],
+                'targetMetrics': doctor_data[doctor_id]['metrics'],
                 'similarDoctors': similar[:k]
             }
         except Exception as e:
@@ -350,13 +890,14 @@ class DoctorPerformanceKNN:
     
     def get_performance_ranking(self):
         """Rank all doctors by overall performance score"""
-        if not self.is_trained:
+        snapshot = self.snapshot
+        if snapshot is None:
             return {'error': 'Model not trained yet'}
         
         try:
             rankings = []
             
-            for doctor_id, info in self.doctor_data.items():
+            for doctor_id, info in snapshot.doctor_data.items():
                 metrics = info['metrics']
                 
                 # Calculate performance score (0-100)
@@ -426,8 +967,10 @@ class DepressionRiskModel:
         """Load trained model and scaler if they exist"""
         try:
             if os.path.exists(self.model_path) and os.path.exists(self.scaler_path):
+                start = time.perf_counter()
                 self.model = joblib.load(self.model_path)
                 self.scaler = joblib.load(self.scaler_path)
+                MODEL_LOAD_SECONDS.set(time.perf_counter() - start, 'depression')
                 self.is_trained = True
                 print(f"Loaded depression model from {self.model_path}")
                 return True
@@ -459,19 +1002,27 @@ class DepressionRiskModel:
             y = df['depression']
 
             X_scaled = self.scaler.fit_transform(X)
-            self.model.fit(X_scaled, y)
+            with MODEL_TRAIN_SECONDS.time('depression'):
+                self.model.fit(X_scaled, y)
             
             # Save model and scaler
             joblib.dump(self.model, self.model_path)
             joblib.dump(self.scaler, self.scaler_path)
             
-            # Basic validation
-            y_pred = self.model.predict(X_scaled)
-            self.metrics = {
-                'accuracy': round(accuracy_score(y, y_pred), 4),
-                'f1_score': round(f1_score(y, y_pred), 4),
-                'samples': len(X)
-            }
+            # Cross-validated, with the scaler refitted on every training fold
+            candidate = make_pipeline(StandardScaler(), clone(self.model))
+            scores = evaluation.evaluate({'depression': candidate}, X.to_numpy(dtype=np.float64), y.to_numpy())
+            score = scores['depression'] if scores is not None else None
+            if score is not None and 'error' not in score:
+                self.metrics = dict(score, samples=len(X))
+            else:
+                y_pred = self.model.predict(X_scaled)
+                self.metrics = {
+                    'accuracy': round(accuracy_score(y, y_pred), 4),
+                    'f1_score': round(f1_score(y, y_pred), 4),
+                    'samples': len(X),
+                    'evaluation': 'training_data'
+                }
             
             self.is_trained = True
             return {'status': 'success', 'metrics': self.metrics}
@@ -503,9 +1054,13 @@ class DepressionRiskModel:
             # Clean near-zero values
             input_data = [0.0 if x < 1e-10 else x for x in input_data]
             
-            X_scaled = self.scaler.transform([input_data])
-            prediction = int(self.model.predict(X_scaled)[0])
-            probability = float(self.model.predict_proba(X_scaled)[0][1])
+            with PHASE_LATENCY.time('depression', 'scale'):
+                X_scaled = self.scaler.transform([input_data])
+            # One forest pass: the class is the argmax of the probabilities
+            with PHASE_LATENCY.time('depression', 'inference'):
+                proba = self.model.predict_proba(X_scaled)[0]
+            prediction = int(self.model.classes_[np.argmax(proba)])
+            probability = float(proba[1])
 
             risk_level = "Low"
             if probability > 0.7:
@@ -520,10 +1075,15 @@ class DepressionRiskModel:
                 'confidence': round(probability if prediction else (1 - probability), 4)
             }
         except Exception as e:
+            PREDICTION_ERRORS.inc('depression')
             return {'error': str(e)}
 
 
-# Global instances
-ml_engine = MLModels()
-doctor_performance_knn = DoctorPerformanceKNN(n_neighbors=3)
-depression_risk_model = DepressionRiskModel()
+# Global instances, in the serving process only: training and cross-validation
+# children re-import the main script, and must not load every snapshot again
+if evaluation.is_child_process():
+    ml_engine = doctor_performance_knn = depression_risk_model = None
+else:
+    ml_engine = MLModels()
+    doctor_performance_knn = DoctorPerformanceKNN(n_neighbors=3)
+    depression_risk_model = DepressionRiskModel()
@@ -0,0 +1,116 @@
+"""Versioned on-disk snapshots of the trained ML service models
+
+Every published snapshot is saved as
+
+    <ML_SNAPSHOT_DIR>/<kind>/v000012.joblib   scaler, fitted models, metrics, ...
+    <ML_SNAPSHOT_DIR>/<kind>/v000012.json     manifest, written last
+
+and a version counts as saved once its manifest exists. The .joblib file is
+uncompressed, so joblib.load(mmap_mode='r') memory-maps the NumPy arrays in
+it (support vectors, KNN training matrices, network weights) instead of
+reading them in; a restart is serving as soon as the pickle's object graph
+is rebuilt.
+
+Raw training chunks ((X, y) pairs) are stored once under chunks/, named by
+their content hash and referenced from the manifests, so saving after an
+incremental update writes only the new rows. The newest ML_SNAPSHOT_KEEP
+versions are kept. Setting ML_SNAPSHOT_DIR to an empty string turns
+persistence off.
+"""
+import hashlib
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+
+SNAPSHOT_DIR = os.getenv('ML_SNAPSHOT_DIR', 'models/snapshots')
+SNAPSHOT_KEEP = int(os.getenv('ML_SNAPSHOT_KEEP', '3'))
+
+
+def _atomic_write(path, write):
+    tmp = f'{path}.tmp{os.getpid()}'
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+class SnapshotStore:
+    def __init__(self, kind, root=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP):
+        self.kind = kind
+        self.enabled = bool(root)
+        self.dir = os.path.join(root, kind) if root else None
+        self.chunk_dir = os.path.join(self.dir, 'chunks') if root else None
+        self.keep = max(1, keep)
+
+    def _path(self, version, ext):
+        return os.path.join(self.dir, f'v{version:06d}.{ext}')
+
+    def versions(self):
+        """Saved versions, oldest first"""
+        if not self.enabled or not os.path.isdir(self.dir):
+            return []
+        return sorted(int(name[1:-5]) for name in os.listdir(self.dir)
+                      if name.startswith('v') and name.endswith('.json') and name[1:-5].isdigit())
+
+    def _save_chunk(self, X, y):
+        digest = hashlib.sha1()
+        for array in (X, y):
+            digest.update(str(array.dtype).encode())
+            digest.update(np.ascontiguousarray(array).tobytes())
+        name = digest.hexdigest()[:20]
+        for suffix, array in (('X', X), ('y', y)):
+            path = os.path.join(self.chunk_dir, f'{name}-{suffix}.npy')
+            if not os.path.exists(path):
+                _atomic_write(path, lambda f: np.save(f, array))
+        return name
+
+    def _load_chunk(self, name):
+        return tuple(np.load(os.path.join(self.chunk_dir, f'{name}-{suffix}.npy'), mmap_mode='r')
+                     for suffix in ('X', 'y'))
+
+    def save(self, version, state, chunks=()):
+        """Save state (anything joblib can pickle) and the training chunks as version"""
+        if not self.enabled:
+            return
+        start = time.perf_counter()
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        names = [self._save_chunk(X, y) for X, y in chunks]
+        _atomic_write(self._path(version, 'joblib'), lambda f: joblib.dump(state, f))
+        manifest = {'version': version, 'saved_at': time.time(), 'chunks': names}
+        _atomic_write(self._path(version, 'json'), lambda f: f.write(json.dumps(manifest).encode()))
+        self._prune()
+        print(f"Saved {self.kind} snapshot v{version} in {time.perf_counter() - start:.3f} s")
+
+    def load_latest(self):
+        """(version, state, chunks) of the newest readable version, or None"""
+        for version in reversed(self.versions()):
+            try:
+                with open(self._path(version, 'json')) as f:
+                    manifest = json.load(f)
+                state = joblib.load(self._path(version, 'joblib'), mmap_mode='r')
+                chunks = tuple(self._load_chunk(name) for name in manifest['chunks'])
+                return version, state, chunks
+            except Exception as e:
+                print(f"Error loading {self.kind} snapshot v{version}: {e}")
+        return None
+
+    def _prune(self):
+        versions = self.versions()
+        for version in versions[:-self.keep]:
+            for ext in ('json', 'joblib'):
+                try:
+                    os.remove(self._path(version, ext))
+                except FileNotFoundError:
+                    pass
+        referenced = set()
+        for version in versions[-self.keep:]:
+            try:
+                with open(self._path(version, 'json')) as f:
+                    referenced.update(json.load(f)['chunks'])
+            except (OSError, ValueError, KeyError):
+                return  # unsure what is still needed; keep every chunk
+        for name in os.listdir(self.chunk_dir):
+            if name.endswith('.npy') and name.rsplit('-', 1)[0] not in referenced:
+                os.remove(os.path.join(self.chunk_dir, name))
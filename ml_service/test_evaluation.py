@@ -0,0 +1,103 @@
+"""Cross-validation folds, the fold result cache and the process pool"""
+import numpy as np
+import pytest
+from sklearn.naive_bayes import GaussianNB
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+import evaluation
+from evaluation import EvaluationCache, evaluate, fold_count
+
+
+class CountingNB(GaussianNB):
+    """GaussianNB that counts its fits (in this process only)"""
+    fits = 0
+
+    def fit(self, X, y):
+        CountingNB.fits += 1
+        return super().fit(X, y)
+
+
+class FailingNB(GaussianNB):
+    def fit(self, X, y):
+        raise ValueError('cannot fit')
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(evaluation, 'cache', EvaluationCache())
+    CountingNB.fits = 0
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(120, 3))
+    y = (X[:, 0] + 0.5 * rng.normal(size=120) > 0).astype(np.int32)
+    return X, y
+
+
+def test_fold_count_is_limited_by_the_rarer_class():
+    assert fold_count(np.array([0] * 10 + [1] * 10), 5) == 5
+    assert fold_count(np.array([0] * 10 + [1] * 3), 5) == 3
+    assert fold_count(np.array([0] * 10 + [1]), 5) == 0
+    assert fold_count(np.array([0] * 10), 5) == 0
+
+
+def test_too_few_samples_give_no_evaluation(data):
+    X, y = data
+    y = np.zeros_like(y)
+    y[0] = 1
+    assert evaluate({'nb': GaussianNB()}, X, y, workers=0) is None
+
+
+def test_summary_covers_every_sample_once(data):
+    X, y = data
+    summary = evaluate({'nb': GaussianNB()}, X, y, folds=4, workers=0)['nb']
+    assert summary['evaluation'] == 'stratified_4_fold'
+    assert sum(summary['confusion_matrix'].values()) == len(y)
+    assert 0.5 < summary['f1_score'] <= 1.0
+
+
+def test_unchanged_data_reuses_cached_folds(data):
+    X, y = data
+    progress = []
+    first = evaluate({'nb': CountingNB()}, X, y, folds=5, workers=0)
+    assert CountingNB.fits == 5
+    second = evaluate({'nb': CountingNB()}, X, y, folds=5, workers=0, progress=lambda *p: progress.append(p))
+    assert CountingNB.fits == 5
+    assert second == first
+    assert progress == [(5, 5)]
+
+
+def test_changed_data_or_parameters_are_evaluated_again(data):
+    X, y = data
+    evaluate({'nb': CountingNB()}, X, y, folds=5, workers=0)
+    X_changed = X.copy()
+    X_changed[0, 0] += 1.0
+    evaluate({'nb': CountingNB()}, X_changed, y, folds=5, workers=0)
+    assert CountingNB.fits == 10
+    evaluate({'nb': CountingNB(var_smoothing=1e-3)}, X, y, folds=5, workers=0)
+    assert CountingNB.fits == 15
+
+
+def test_a_failing_model_does_not_affect_the_others(data):
+    X, y = data
+    results = evaluate({'nb': GaussianNB(), 'broken': FailingNB()}, X, y, folds=3, workers=0)
+    assert results['broken'] == {'error': 'Cross-validation failed: cannot fit'}
+    assert results['nb']['evaluation'] == 'stratified_3_fold'
+
+
+def test_pool_matches_serial_evaluation(data):
+    X, y = data
+    models = {
+        'nb': make_pipeline(StandardScaler(), GaussianNB()),
+        'tree': make_pipeline(StandardScaler(), DecisionTreeClassifier(random_state=42)),
+    }
+    progress = []
+    pooled = evaluate(models, X, y, folds=5, workers=2, progress=lambda *p: progress.append(p))
+    evaluation.cache = EvaluationCache()
+    serial = evaluate(models, X, y, folds=5, workers=0)
+    assert pooled == serial
+    assert progress[0] == (0, 10) and progress[-1] == (10, 10)
@@ -0,0 +1,153 @@
+"""Behavior of the lab models: training data preparation and cascade inference"""
+import numpy as np
+import pytest
+
+import ml_models
+from ml_models import LabModelSnapshot, MLModels, columnar_features, consultation_columns, numeric_column, LAB_PARAMETERS
+
+
+@pytest.fixture
+def engine():
+    return MLModels()
+
+
+def consultation(hemoglobin, wbc, glucose, abnormal=(False, False, False)):
+    return {
+        name: {'value': value, 'isAbnormal': flag}
+        for name, value, flag in zip(LAB_PARAMETERS, (hemoglobin, wbc, glucose), abnormal)
+    }
+
+
+def columnar(rows):
+    return {
+        name: {'value': [row[name]['value'] for row in rows], 'isAbnormal': [row[name]['isAbnormal'] for row in rows]}
+        for name in LAB_PARAMETERS
+    }
+
+
+def test_row_and_columnar_data_give_the_same_features():
+    rows = [consultation(13.5, 7.0, 90.0), consultation(9.0, 12.5, 150.0, (True, True, False))]
+    X_rows, y_rows = columnar_features(consultation_columns(rows))
+    X_columns, y_columns = columnar_features(consultation_columns(columnar(rows)))
+    assert np.array_equal(X_rows, X_columns)
+    assert np.array_equal(y_rows, y_columns)
+    assert X_rows.dtype == np.float32 and y_rows.dtype == np.int32
+    assert y_rows.tolist() == [0, 1]
+
+
+def test_incomplete_consultations_are_masked_out():
+    rows = [
+        consultation(13.5, 7.0, 90.0),
+        consultation(None, 7.0, 90.0),
+        consultation('n/a', 7.0, 90.0),
+        consultation(float('nan'), 7.0, 90.0),
+        consultation(float('inf'), 7.0, 90.0),
+        consultation(13.5, 7.0, 90.0, (False, None, False)),
+        {'hemoglobin': {'value': 13.5, 'isAbnormal': False}},
+        'not a consultation',
+        consultation('14.0', 6.0, 100.0, (False, False, True)),
+    ]
+    X, y = columnar_features(consultation_columns(rows))
+    assert X.tolist() == [[13.5, 7.0, 90.0], [14.0, 6.0, 100.0]]
+    assert y.tolist() == [0, 1]
+
+
+def test_numeric_column_coerces_what_it_can():
+    column = numeric_column([1, '2.5', None, 'x', 3.0])
+    assert column.dtype == np.float64
+    assert column[:2].tolist() == [1.0, 2.5]
+    assert np.isnan(column[2]) and np.isnan(column[3])
+    assert column[4] == 3.0
+
+
+@pytest.mark.parametrize('columns', [
+    {'hemoglobin': {'value': [1.0], 'isAbnormal': [False]}},
+    {name: {'value': [1.0, 2.0], 'isAbnormal': [False]} for name in LAB_PARAMETERS},
+    {name: {'value': [[1.0]], 'isAbnormal': [[False]]} for name in LAB_PARAMETERS},
+])
+def test_malformed_columns_are_rejected(engine, columns):
+    with pytest.raises(ValueError):
+        columnar_features(columns)
+    assert engine.prepare_data(columns) == (None, None)
+
+
+def test_prepare_data_needs_min_samples(engine):
+    rows = [consultation(13.5, 7.0, 90.0), consultation(None, 7.0, 90.0)]
+    assert engine.prepare_data(rows) == (None, None)
+    X, y = engine.prepare_data(rows, min_samples=1)
+    assert X.shape == (1, 3) and y.tolist() == [0]
+
+
+class Identity:
+    def transform(self, X):
+        return np.asarray(X, dtype=np.float64)
+
+
+class FixedModel:
+    """Returns a fixed probability of abnormal per row; column 0 of a row is its index"""
+    classes_ = np.array([0, 1])
+
+    def __init__(self, *abnormal):
+        self.abnormal = np.array(abnormal, dtype=np.float64)
+
+    def predict_proba(self, X):
+        p = self.abnormal[np.asarray(X)[:, 0].astype(int)]
+        return np.column_stack([1 - p, p])
+
+
+class BrokenModel:
+    classes_ = np.array([0, 1])
+
+    def predict_proba(self, X):
+        raise RuntimeError('broken')
+
+
+@pytest.fixture
+def cascade_engine(engine, monkeypatch):
+    monkeypatch.setattr(ml_models, 'CASCADE_STAGES', [['a', 'b'], ['c'], ['d', 'e']])
+    models = {
+        # row 0: a and b confidently abnormal, settled at stage 0
+        # row 1: b unsure, c confidently agrees with the normal majority, settled at stage 1
+        # row 2: a and b disagree, c unsure; the majority of all five decides at stage 2
+        'a': FixedModel(0.95, 0.02, 0.95),
+        'b': FixedModel(0.97, 0.30, 0.05),
+        'c': FixedModel(0.50, 0.05, 0.60),
+        'd': FixedModel(0.50, 0.50, 0.20),
+        'e': FixedModel(0.50, 0.50, 0.10),
+    }
+    engine.snapshot = LabModelSnapshot(1, Identity(), models, {}, ())
+    return engine
+
+
+ROWS = [[0, 0, 0], [1, 0, 0], [2, 0, 0]]
+
+
+def test_cascade_settles_rows_at_the_earliest_confident_stage(cascade_engine):
+    before = ml_models.CASCADE_EXITS.values()
+    results = cascade_engine.predict_cascade(ROWS)
+    assert [r['stage'] for r in results] == [0, 1, 2]
+    assert [r['prediction'] for r in results] == [1, 0, 0]
+    assert [sorted(r['models']) for r in results] == [['a', 'b'], ['a', 'b', 'c'], ['a', 'b', 'c', 'd', 'e']]
+    assert results[0]['agreement'] == 1.0
+    assert results[2]['agreement'] == 0.6
+    after = ml_models.CASCADE_EXITS.values()
+    assert [after.get((str(stage),), 0) - before.get((str(stage),), 0) for stage in range(3)] == [1, 1, 1]
+
+
+def test_cascade_last_stage_matches_full_majority(cascade_engine):
+    full = cascade_engine.predict_batch(ROWS)
+    cascade = cascade_engine.predict_cascade(ROWS)
+    votes = [sum(model['prediction'] for model in row.values()) for row in full]
+    assert cascade[2]['prediction'] == int(2 * votes[2] >= len(full[2]))
+
+
+def test_cascade_skips_a_failing_model(cascade_engine):
+    cascade_engine.snapshot.models['a'] = BrokenModel()
+    results = cascade_engine.predict_cascade(ROWS)
+    assert all(r['models']['a'] == {'error': 'broken'} for r in results)
+    assert results[0]['stage'] == 0 and results[0]['prediction'] == 1
+
+
+def test_unlisted_models_join_the_last_stage(cascade_engine):
+    cascade_engine.snapshot.models['f'] = FixedModel(0.5, 0.5, 0.5)
+    assert MLModels.cascade_stages(cascade_engine.snapshot) == [['a', 'b'], ['c'], ['d', 'e', 'f']]
@@ -0,0 +1,126 @@
+"""Background training jobs for the ML service
+
+Training requests are queued as jobs and run on a small thread pool, off
+the request thread, so predictions keep being served by the current model
+snapshot while a new one is fitted. A job's function receives a
+progress(stage, fraction) callback; its return value becomes the job
+result. Job status is kept in memory for the last JOB_HISTORY jobs.
+Periodic jobs, such as full refits, are submitted by TrainingJobs.schedule.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+import uuid
+
+# Concurrent training jobs; more are queued (1 keeps trainings of one model in order)
+JOB_WORKERS = int(os.getenv('ML_TRAINING_JOB_WORKERS', '1'))
+JOB_HISTORY = int(os.getenv('ML_TRAINING_JOB_HISTORY', '100'))
+
+
+class TrainingJob:
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def report(self, stage, fraction):
+        self.stage = stage
+        self.progress = round(min(max(fraction, 0.0), 1.0), 4)
+
+    def to_dict(self, include_result=True):
+        job = {
+            'jobId': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at,
+        }
+        if self.error is not None:
+            job['error'] = self.error
+        if include_result and self.result is not None:
+            job['result'] = self.result
+        return job
+
+
+class TrainingJobs:
+    def __init__(self, workers=JOB_WORKERS, history=JOB_HISTORY):
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='training-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn):
+        """Queue fn(progress) as a job and return it immediately"""
+        job = TrainingJob(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.done.is_set():
+                    break
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = fn(job.report)
+            if isinstance(job.result, dict) and 'error' in job.result:
+                # Models report bad input as {'error': ...} rather than raising
+                job.error = job.result['error']
+                job.status = 'failed'
+            else:
+                job.status = 'succeeded'
+                job.report('done', 1.0)
+        except Exception as e:
+            print(f"Training job {job.id} ({job.kind}) failed: {e}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            job.done.set()
+
+    def schedule(self, kind, fn, is_due, poll=60.0):
+        """Submit fn as a job whenever is_due() holds, checking every poll seconds
+
+        A new job is not submitted while one of the same kind is unfinished.
+        """
+        def loop():
+            job = None
+            while True:
+                time.sleep(poll)
+                try:
+                    if (job is None or job.done.is_set()) and is_due():
+                        job = self.submit(kind, fn)
+                except Exception as e:
+                    print(f"Scheduling {kind} job failed: {e}")
+
+        thread = threading.Thread(target=loop, name=f'schedule-{kind}', daemon=True)
+        thread.start()
+        return thread
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+
+training_jobs = TrainingJobs()
@@ -12,6 +12,21 @@ const { authAny, requireStaff } = require('../middleware/auth');
 
 const ML_SERVICE_URL = process.env.ML_SERVICE_URL || 'http://localhost:5000';
 
+/**
+ * Training consultations as parallel value/flag arrays per parameter,
+ * which the ML service parses without a per-consultation loop
+ */
+function toColumnar(trainingData) {
+  const columns = {};
+  for (const name of ['hemoglobin', 'wbc', 'glucose']) {
+    columns[name] = {
+      value: trainingData.map(sample => sample[name].value),
+      isAbnormal: trainingData.map(sample => sample[name].isAbnormal)
+    };
+  }
+  return columns;
+}
+
 /**
  * Train ML models on historical lab data
  */
@@ -153,7 +168,7 @@ router.post('/train', authAny, requireStaff(['Admin', 'Lab']), async (req, res)
 
     // Call Python ML service
     console.log(`Calling Python ML service at ${ML_SERVICE_URL}/api/ml/train`);
-    const response = await axios.post(`${ML_SERVICE_URL}/api/ml/train`, { trainingData });
+    const response = await axios.post(`${ML_SERVICE_URL}/api/ml/train`, { trainingData: toColumnar(trainingData), wait: true });
     
     console.log('Training response:', response.data);
 
@@ -255,6 +270,52 @@ router.post('/predict-live', authAny, async (req, res) => {
   }
 });
 
+/**
+ * Live prediction for a batch of lab results, scored in one ML service call
+ * body: { samples: [{ hemoglobin, wbc, glucose }, ...], model? }
+ */
+router.post('/predict-live/batch', authAny, async (req, res) => {
+  try {
+    const { samples, model } = req.body;
+
+    if (!Array.isArray(samples) || samples.length === 0 ||
+        samples.some(s => !s || s.hemoglobin === undefined || s.wbc === undefined || s.glucose === undefined)) {
+      return res.status(400).json({
+        message: 'samples must be a non-empty array of { hemoglobin, wbc, glucose }',
+        example: { samples: [{ hemoglobin: 13.5, wbc: 7.2, glucose: 95 }], model: 'decision_tree' }
+      });
+    }
+
+    const response = await axios.post(`${ML_SERVICE_URL}/api/ml/predict-multi`, {
+      features: samples.map(s => [s.hemoglobin, s.wbc, s.glucose]),
+      model: model || null
+    });
+
+    const pythonResult = response.data.data;
+    if (!Array.isArray(pythonResult.predictions)) {
+      return res.status(400).json({ success: false, message: 'Prediction failed', error: pythonResult.predictions.error });
+    }
+
+    res.json({
+      success: true,
+      data: {
+        model: pythonResult.model || null,
+        results: samples.map((s, i) => ({
+          input: { hemoglobin: s.hemoglobin, wbc: s.wbc, glucose: s.glucose },
+          predictions: pythonResult.predictions[i]
+        }))
+      }
+    });
+  } catch (err) {
+    console.error('Batch live prediction error:', err.message);
+    res.status(500).json({
+      success: false,
+      message: 'Prediction failed',
+      error: err.message
+    });
+  }
+});
+
 /**
  * Get model metrics and comparison
  */
@@ -405,7 +466,7 @@ router.post('/doctor-performance/train', authAny, requireStaff(['Admin']), async
     // Send to Python ML service for KNN training
     const mlResponse = await axios.post(
       `${ML_SERVICE_URL}/api/ml/doctor-performance/train`,
-      { doctors: validDoctorsData }
+      { doctors: validDoctorsData, wait: true }
     );
 
     res.json({